@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Attachment Metadata Indexing
+
+This module records the attachments of synced messages (filename, MIME type,
+decoded size and SHA-256) in Supabase without storing their bytes. Each
+distinct file is stored once in attachment_blobs, keyed by its hash, and
+email_attachments links it to every email that carried it.
+
+Attachments are decoded in chunks straight into the hash, so a 25 MB PDF
+never exists as a second decoded copy in memory. Hashing runs on a small
+background pool, off the fetch and triage path, as soon as a message is
+fetched. The rows are only written once the email itself is stored, so
+mail triaged as "ignore" leaves nothing behind in email_attachments.
+"""
+
+import base64
+import quopri
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Encoded characters decoded per step when hashing an attachment
+DECODE_CHUNK_SIZE = 1024 * 1024
+
+# Messages indexed at the same time
+DEFAULT_ATTACHMENT_WORKERS = 2
+
+# Encoded message bytes waiting to be indexed before submit() blocks
+DEFAULT_MAX_PENDING_BYTES = 64 * 1024 * 1024
+
+# Hashes remembered as already present in attachment_blobs
+SEEN_HASHES_SIZE = 50000
+
+
+def iter_attachment_parts(msg):
+    """Yield (part_index, part) for the attachments of a message, in walk order"""
+    for index, part in enumerate(msg.walk()):
+        if part.is_multipart():
+            continue
+        disposition = part.get_content_disposition()
+        if disposition == "attachment" or (disposition != "inline" and part.get_filename()):
+            yield index, part
+
+
+def _iter_decoded_chunks(part):
+    """Decode a part's payload chunk by chunk, following its transfer encoding"""
+    payload = part.get_payload()
+    if not isinstance(payload, str):
+        return
+    encoding = (part.get("Content-Transfer-Encoding") or "").strip().lower()
+    
+    if encoding == "base64":
+        remainder = ""
+        for start in range(0, len(payload), DECODE_CHUNK_SIZE):
+            chunk = remainder + "".join(payload[start:start + DECODE_CHUNK_SIZE].split())
+            # Decode whole 4-character groups and carry the rest into the next chunk
+            usable = len(chunk) - len(chunk) % 4
+            remainder = chunk[usable:]
+            if usable:
+                yield base64.b64decode(chunk[:usable])
+        if remainder.rstrip("="):
+            yield base64.b64decode(remainder + "=" * (-len(remainder) % 4))
+    elif encoding == "quoted-printable":
+        remainder = ""
+        for start in range(0, len(payload), DECODE_CHUNK_SIZE):
+            chunk = remainder + payload[start:start + DECODE_CHUNK_SIZE]
+            # Soft line breaks and =XX escapes never span a line, so split after the last newline
+            cut = chunk.rfind("\n") + 1
+            remainder = chunk[cut:]
+            if cut:
+                yield quopri.decodestring(chunk[:cut].encode("ascii", "surrogateescape"))
+        if remainder:
+            yield quopri.decodestring(remainder.encode("ascii", "surrogateescape"))
+    else:
+        # 7bit, 8bit and binary payloads are kept as surrogate-escaped text by the parser
+        for start in range(0, len(payload), DECODE_CHUNK_SIZE):
+            yield payload[start:start + DECODE_CHUNK_SIZE].encode("ascii", "surrogateescape")
+
+
+def describe_attachment(part):
+    """
+    Hash and measure one attachment part
+    
+    Returns:
+        dict: filename, mime_type, size (decoded bytes) and sha256
+    """
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in _iter_decoded_chunks(part):
+        digest.update(chunk)
+        size += len(chunk)
+    return {
+        "filename": part.get_filename(),
+        "mime_type": part.get_content_type(),
+        "size": size,
+        "sha256": digest.hexdigest()
+    }
+
+
+def extract_attachments(msg):
+    """
+    Describe every attachment of a message
+    
+    Returns:
+        list: describe_attachment dicts with their "part_index"
+    """
+    attachments = []
+    for part_index, part in iter_attachment_parts(msg):
+        try:
+            attachment = describe_attachment(part)
+        except Exception as e:
+            print(f"Error reading attachment {part.get_filename()}: {e}")
+            continue
+        attachment["part_index"] = part_index
+        attachments.append(attachment)
+    return attachments
+
+
+class AttachmentIndexer:
+    """Background pool that records message attachments in Supabase"""
+    
+    def __init__(self, supabase, workers=DEFAULT_ATTACHMENT_WORKERS, max_pending_bytes=DEFAULT_MAX_PENDING_BYTES):
+        """
+        Create the indexer
+        
+        Args:
+            supabase: Supabase client
+            workers: Messages indexed at the same time
+            max_pending_bytes: Encoded bytes of queued messages before submit() blocks
+        """
+        self.supabase = supabase
+        self.max_pending_bytes = max_pending_bytes
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="attachments")
+        self._pending_bytes = 0
+        self._pending = threading.Condition()
+        self._seen_lock = threading.Lock()
+        self._seen_hashes = {}
+        self._described_lock = threading.Lock()
+        self._described = {}
+        self.indexed = 0
+        self.errors = 0
+        
+    def submit(self, gmail_id, msg, size):
+        """
+        Queue a parsed message for hashing (nothing is written until write())
+        
+        Only blocks when `max_pending_bytes` of messages are already waiting,
+        which bounds the memory held by the queue.
+        
+        Args:
+            gmail_id: gmail_id of the email the attachments belong to
+            msg: email.message.Message with its full body
+            size: Size of the raw message in bytes
+        """
+        if not msg.is_multipart() and msg.get_content_disposition() != "attachment":
+            return
+        with self._pending:
+            while self._pending_bytes and self._pending_bytes + size > self.max_pending_bytes:
+                self._pending.wait()
+            self._pending_bytes += size
+        future = self._executor.submit(self._describe, gmail_id, msg, size)
+        with self._described_lock:
+            self._described[gmail_id] = future
+        
+    def _describe(self, gmail_id, msg, size):
+        """Describe a message's attachments (runs on the pool)"""
+        try:
+            return extract_attachments(msg)
+        except Exception as e:
+            print(f"Error indexing attachments of {gmail_id}: {e}")
+            with self._pending:
+                self.errors += 1
+            return []
+        finally:
+            with self._pending:
+                self._pending_bytes -= size
+                self._pending.notify_all()
+    
+    def take(self, gmail_id):
+        """
+        Get the attachments of a submitted message, waiting for its hashing to finish
+        
+        Returns:
+            list: extract_attachments dicts (empty if nothing was submitted for it)
+        """
+        with self._described_lock:
+            future = self._described.pop(gmail_id, None)
+        return future.result() if future is not None else []
+        
+    def write(self, gmail_id, attachments):
+        """Queue the rows of a stored email's attachments (from take()) for writing on the pool"""
+        if attachments:
+            self._executor.submit(self._write, gmail_id, attachments)
+    
+    def _write(self, gmail_id, attachments):
+        """Write a stored email's attachment rows (runs on the pool)"""
+        try:
+            self._store(gmail_id, attachments)
+        except Exception as e:
+            print(f"Error indexing attachments of {gmail_id}: {e}")
+            with self._pending:
+                self.errors += 1
+            return
+        with self._pending:
+            self.indexed += len(attachments)
+    
+    def _store(self, gmail_id, attachments):
+        """Upsert new blobs once per hash, then link them to the email"""
+        with self._seen_lock:
+            new_blobs = {}
+            for attachment in attachments:
+                if attachment["sha256"] not in self._seen_hashes:
+                    new_blobs[attachment["sha256"]] = {
+                        "sha256": attachment["sha256"],
+                        "size": attachment["size"],
+                        "mime_type": attachment["mime_type"]
+                    }
+        
+        if new_blobs:
+            self.supabase.table("attachment_blobs").upsert(
+                list(new_blobs.values()), on_conflict="sha256", ignore_duplicates=True
+            ).execute()
+            with self._seen_lock:
+                for sha256 in new_blobs:
+                    self._seen_hashes[sha256] = True
+                # Dicts keep insertion order, so the oldest hashes are dropped first
+                while len(self._seen_hashes) > SEEN_HASHES_SIZE:
+                    del self._seen_hashes[next(iter(self._seen_hashes))]
+        
+        self.supabase.table("email_attachments").upsert([
+            {
+                "gmail_id": gmail_id,
+                "part_index": attachment["part_index"],
+                "sha256": attachment["sha256"],
+                "filename": attachment["filename"],
+                "mime_type": attachment["mime_type"],
+                "size": attachment["size"]
+            }
+            for attachment in attachments
+        ], on_conflict="gmail_id,part_index", ignore_duplicates=True).execute()
+        
+    def close(self):
+        """Wait for queued messages and writes to finish and stop the pool"""
+        self._executor.shutdown(wait=True)
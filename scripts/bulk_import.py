@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Bulk import of mbox and Maildir exports.
+
+Parses an exported mailbox in a pool of worker processes, skips messages
+whose gmail_id is already stored, and feeds the rest through the same
+triage and batched store pipeline as gmail_sync. Use it instead of an IMAP
+--initial --all import when onboarding a historical mailbox.
+"""
+import os
+import sys
+import time
+from itertools import islice
+from functools import partial
+
+from email_parsing import parser_pool
+from mail_export import detect_format, iter_mbox_ranges, iter_maildir_files, parse_mbox_chunk, parse_maildir_chunk
+
+# Messages handed to a parser process per task
+DEFAULT_CHUNK_SIZE = 200
+
+def iter_chunks(items, size):
+    """Group an iterable into lists of up to `size` items."""
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+def bulk_import(path, export_format="auto", parse_workers=None, triage_workers=None, store_batch_size=None,
+                chunk_size=DEFAULT_CHUNK_SIZE, limit=None):
+    """
+    Import an mbox file or Maildir directory into Supabase with triage.
+    
+    Args:
+        path: mbox file or Maildir directory
+        export_format: "mbox", "maildir" or "auto" (detect from path)
+        parse_workers: Parser processes (default: one per CPU core)
+        triage_workers: Concurrent triages (default: gmail_sync's)
+        store_batch_size: Rows per database upsert (default: gmail_sync's)
+        chunk_size: Messages per parser task
+        limit: Only import the first `limit` messages of the export
+        
+    Returns:
+        dict: run_pipeline results plus "parsed", "parse_errors" and "duplicates"
+    """
+    # Imported here, not at module level: parser processes import this script
+    # again, and must not build gmail_sync's Supabase client, stores and triage flow
+    import gmail_sync
+    
+    parse_workers = parse_workers or os.cpu_count() or 1
+    triage_workers = triage_workers or gmail_sync.DEFAULT_TRIAGE_WORKERS
+    store_batch_size = store_batch_size or gmail_sync.DEFAULT_STORE_BATCH_SIZE
+    
+    if export_format == "auto":
+        export_format = detect_format(path)
+    if export_format == "maildir":
+        units = iter_maildir_files(path)
+        parse_chunk = parse_maildir_chunk
+    else:
+        units = iter_mbox_ranges(path)
+        parse_chunk = partial(parse_mbox_chunk, path)
+    if limit:
+        units = islice(units, limit)
+        
+    print(f"Importing {export_format} export {path} with {parse_workers} parser processes...")
+    
+    # Bring the dedup index up to date so already-stored messages are skipped cheaply
+    try:
+        gmail_sync.dedup_index.refresh()
+    except Exception as e:
+        print(f"Error refreshing dedup index: {e}")
+        
+    stats = {"parsed": 0, "parse_errors": 0, "duplicates": 0}
+    started_at = time.monotonic()
+    
+    def iter_new_emails(executor):
+        chunks = iter_chunks(units, chunk_size)
+        for emails, errors in gmail_sync.bounded_map(executor, parse_chunk, chunks, parse_workers * 2):
+            stats["parsed"] += len(emails)
+            stats["parse_errors"] += errors
+            
+            existing = gmail_sync.dedup_index.filter_existing(email_obj["gmail_id"] for email_obj in emails)
+            for email_obj in emails:
+                if email_obj["gmail_id"] in existing:
+                    stats["duplicates"] += 1
+                    continue
+                email_obj["category"] = None  # Set by triage
+                email_obj["triage_reasoning"] = None  # Set by triage
+                email_obj["reprocessed"] = False
+                yield email_obj
+                
+            elapsed = time.monotonic() - started_at
+            print(f"Parsed {stats['parsed']} messages ({stats['parsed'] / elapsed:.0f} msg/s), "
+                  f"{stats['duplicates']} already stored, {stats['parse_errors']} unreadable")
+    
+    with parser_pool(parse_workers) as executor:
+        results = gmail_sync.run_pipeline(
+            gmail_sync.triage_stream(iter_new_emails(executor), workers=triage_workers),
+            store_batch_size=store_batch_size
+        )
+        
+    results.update(stats)
+    elapsed = time.monotonic() - started_at
+    print(f"Bulk import completed in {elapsed:.1f}s ({stats['parsed'] / elapsed if elapsed > 0 else 0:.1f} msg/s). "
+          f"Results: {stats['parsed']} parsed, {stats['duplicates']} already stored, {results['imported']} imported, "
+          f"{results['skipped']} skipped, {results['ignored']} ignored, {results['failed']} failed, "
+          f"{stats['parse_errors']} unreadable")
+    
+    return results
+
+def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Bulk import an mbox or Maildir export into Supabase with triage')
+    parser.add_argument('path', help='mbox file or Maildir directory')
+    parser.add_argument('--format', choices=['auto', 'mbox', 'maildir'], default='auto',
+                        help='Export format (default: auto-detect)')
+    parser.add_argument('--workers', type=int, help='Parser processes (default: one per CPU core)')
+    parser.add_argument('--triage-workers', type=int, help='Number of emails triaged concurrently')
+    parser.add_argument('--store-batch-size', type=int, help='Number of rows per database upsert')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f'Messages per parser task (default: {DEFAULT_CHUNK_SIZE})')
+    parser.add_argument('--limit', type=int, help='Only import the first N messages of the export')
+    
+    args = parser.parse_args()
+    
+    if not os.path.exists(args.path):
+        print(f"Error: {args.path} does not exist")
+        sys.exit(1)
+        
+    try:
+        bulk_import(args.path, export_format=args.format, parse_workers=args.workers,
+                    triage_workers=args.triage_workers, store_batch_size=args.store_batch_size,
+                    chunk_size=args.chunk_size, limit=args.limit)
+    except KeyboardInterrupt:
+        print("Interrupted by user. Exiting...")
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,15 @@
 #!/usr/bin/env python3
 import os
+import re
 import time
 import sys
 import signal
 import subprocess
 from datetime import datetime
 
+from imap_idle import idle_wait, noop_new_mail
+from sync_scheduler import AdaptiveScheduler, DEFAULT_MIN_INTERVAL, DEFAULT_MAX_INTERVAL, DEFAULT_JITTER
+
 # Handle SIGTERM gracefully
 def handle_sigterm(signum, frame):
     print("Received SIGTERM signal. Exiting...")
@@ -16,44 +20,249 @@ signal.signal(signal.SIGTERM, handle_sigterm)
 # Script directory
 script_dir = os.path.dirname(os.path.abspath(__file__))
 
+# Polling interval in seconds (e.g., 15 minutes = 900 seconds)
+DEFAULT_INTERVAL = 900
+
+# Servers may drop an IDLE after 29 minutes, so re-issue it well before that
+DEFAULT_IDLE_TIMEOUT = 25 * 60
+
+# Summary lines printed by gmail_sync.py, read back in poll mode
+FOUND_PATTERN = re.compile(r"Sync completed\. Results: (\d+) new")
+LATENCY_PATTERN = re.compile(r"Arrival-to-stored latency: .*max ([\d.]+)s")
+
 def run_gmail_sync():
-    """Run the Gmail sync script."""
+    """
+    Run the Gmail sync script in a child process.
+    
+    Returns:
+        tuple: (new emails found, queue lag in seconds), read from the child's
+        summary lines (None for values it did not print)
+    """
+    found = None
+    lag = None
     try:
         print(f"[{datetime.now().isoformat()}] Running Gmail sync...")
+        started_at = time.monotonic()
+        startup_time = None
         
-        # Run the script with Python
-        result = subprocess.run(
-            [sys.executable, os.path.join(script_dir, "gmail_sync.py")],
-            capture_output=True,
+        # Run the script with Python, unbuffered so output can be streamed
+        process = subprocess.Popen(
+            [sys.executable, "-u", os.path.join(script_dir, "gmail_sync.py")],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
             text=True
         )
         
-        # Log output
-        print(result.stdout)
-        if result.stderr:
-            print(f"Errors: {result.stderr}")
+        # Log output line by line as the child produces it
+        for line in process.stdout:
+            if startup_time is None:
+                # The first line is printed once imports and client setup are done
+                startup_time = time.monotonic() - started_at
+            print(line, end="")
             
-        print(f"[{datetime.now().isoformat()}] Gmail sync completed with exit code {result.returncode}")
+            match = FOUND_PATTERN.search(line)
+            if match:
+                found = int(match.group(1))
+            match = LATENCY_PATTERN.search(line)
+            if match:
+                lag = max(lag or 0.0, float(match.group(1)))
+        process.wait()
+        
+        if startup_time is not None:
+            print(f"Cycle startup time: {startup_time:.2f}s (subprocess imports and initialization)")
+        print(f"[{datetime.now().isoformat()}] Gmail sync completed with exit code {process.returncode}")
+        
+    except Exception as e:
+        print(f"[{datetime.now().isoformat()}] Error running Gmail sync: {e}")
+    return found, lag
+
+def load_sync_worker():
+    """Import and initialize gmail_sync once for in-process sync cycles."""
+    started_at = time.monotonic()
+    import gmail_sync
+    print(f"Sync worker initialized in {time.monotonic() - started_at:.2f}s (paid once)")
+    return gmail_sync
+
+def run_worker_sync(gmail_sync):
+    """
+    Run one sync cycle in-process, reusing clients, triage agent and IMAP connection.
+    
+    Returns:
+        tuple: (new emails found, queue lag in seconds), None for values that are unknown
+    """
+    try:
+        print(f"[{datetime.now().isoformat()}] Running Gmail sync (in-process)...")
+        started_at = time.monotonic()
+        
+        # The only per-cycle setup left is checking (or re-opening) a pooled IMAP connection
+        with gmail_sync.imap_pool.connection(gmail_sync.load_accounts()[0][0]):
+            pass
+        print(f"Cycle startup time: {time.monotonic() - started_at:.2f}s (IMAP connection check)")
+        
+        result = gmail_sync.sync_gmail()
+        print(f"[{datetime.now().isoformat()}] Gmail sync completed in {time.monotonic() - started_at:.2f}s")
+        # The oldest email of the cycle waited longest between arriving and being stored
+        return result["found"], max(result["latencies"]) if result["latencies"] else None
         
     except Exception as e:
         print(f"[{datetime.now().isoformat()}] Error running Gmail sync: {e}")
+        gmail_sync.imap_pool.close_all()
+        return None, None
+
+def run_scheduled(run_cycle, scheduler=None, interval=DEFAULT_INTERVAL):
+    """
+    Run sync cycles forever, waiting between them.
+    
+    With a scheduler, each wait is chosen by AdaptiveScheduler from the
+    recent arrival rate and the cycle's duration; otherwise it is the fixed
+    `interval`. Every cycle logs its results, queue lag and the chosen wait.
+    
+    Args:
+        run_cycle: Function running one cycle and returning (found, lag)
+        scheduler: AdaptiveScheduler, or None for a fixed interval
+        interval: Wait in seconds when there is no scheduler
+    """
+    while True:
+        started_at = time.monotonic()
+        found, lag = run_cycle()
+        duration = time.monotonic() - started_at
+        
+        if scheduler is not None:
+            scheduler.record_cycle(started_at, duration, found)
+            wait = scheduler.next_interval()
+            reason = scheduler.reason
+        else:
+            wait = interval
+            reason = "fixed"
+            
+        found_text = "unknown" if found is None else found
+        lag_text = "n/a" if lag is None else f"{lag:.0f}s"
+        print(f"Cycle: {found_text} new emails in {duration:.1f}s, queue lag {lag_text}, "
+              f"next sync in {wait:.0f}s ({reason})")
+        time.sleep(wait)
+
+def run_push_sync(poll_interval=DEFAULT_INTERVAL, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+    """
+    Sync on IMAP IDLE notifications instead of a fixed sleep.
+    
+    Holds an IDLE connection on the inbox and runs an incremental sync as soon
+    as the server reports EXISTS. A sync also runs every `poll_interval`
+    seconds as a fallback, and the IDLE is re-issued every `idle_timeout`
+    seconds so the server never times it out.
+    """
+    gmail_sync = load_sync_worker()
+    
+    reconnect_delay = 5
+    
+    while True:
+        mail = None
+        try:
+            mail = gmail_sync.connect_imap()
+            if "IDLE" not in mail.capabilities:
+                print(f"[{datetime.now().isoformat()}] Server does not support IDLE, falling back to polling")
+                mail.logout()
+                while True:
+                    gmail_sync.sync_gmail()
+                    print(f"Waiting {poll_interval} seconds until next sync...")
+                    time.sleep(poll_interval)
+                    
+            mail.select("INBOX", readonly=True)
+            print(f"[{datetime.now().isoformat()}] IDLE connection established")
+            reconnect_delay = 5
+            
+            # Catch up on anything that arrived while we were disconnected
+            gmail_sync.sync_gmail()
+            last_sync = time.monotonic()
+            new_mail = noop_new_mail(mail)
+            
+            while True:
+                until_poll = poll_interval - (time.monotonic() - last_sync)
+                wait = max(1, min(idle_timeout, until_poll))
+                
+                if new_mail or idle_wait(mail, wait):
+                    woke_at = time.monotonic()
+                    print(f"[{datetime.now().isoformat()}] New mail notification, syncing...")
+                    gmail_sync.sync_gmail()
+                    print(f"Notification-to-stored time: {time.monotonic() - woke_at:.1f}s")
+                    last_sync = time.monotonic()
+                elif time.monotonic() - last_sync >= poll_interval:
+                    print(f"[{datetime.now().isoformat()}] No notifications for {poll_interval}s, running fallback sync...")
+                    gmail_sync.sync_gmail()
+                    last_sync = time.monotonic()
+                    
+                # Keep the connection alive between IDLE commands; mail that arrived
+                # during a sync is announced here, not by the next IDLE
+                new_mail = noop_new_mail(mail)
+                
+        except Exception as e:
+            print(f"[{datetime.now().isoformat()}] Error in IDLE loop: {e}")
+            print(f"Reconnecting in {reconnect_delay} seconds...")
+            time.sleep(reconnect_delay)
+            reconnect_delay = min(reconnect_delay * 2, 300)
+        finally:
+            if mail is not None:
+                try:
+                    mail.logout()
+                except Exception:
+                    pass
 
 def main():
-    # Interval in seconds (e.g., 15 minutes = 900 seconds)
-    interval = 900
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Continuously sync Gmail emails to Supabase')
+    parser.add_argument('--mode', choices=['poll', 'worker', 'push'], default='poll',
+                        help='poll: run gmail_sync.py in a subprocess every interval; '
+                             'worker: run the sync in-process every interval, reusing clients; '
+                             'push: sync in-process on IMAP IDLE notifications (default: poll)')
+    parser.add_argument('--interval', type=int, default=DEFAULT_INTERVAL,
+                        help=f'Polling interval in seconds with --schedule fixed, the first interval with --schedule adaptive; '
+                             f'in push mode, the fallback poll interval (default: {DEFAULT_INTERVAL})')
+    parser.add_argument('--schedule', choices=['adaptive', 'fixed'], default='adaptive',
+                        help='adaptive: wait between --min-interval and --max-interval depending on the recent arrival rate; '
+                             'fixed: always wait --interval (default: adaptive)')
+    parser.add_argument('--min-interval', type=int, default=DEFAULT_MIN_INTERVAL,
+                        help=f'Shortest adaptive wait in seconds (default: {DEFAULT_MIN_INTERVAL})')
+    parser.add_argument('--max-interval', type=int, default=DEFAULT_MAX_INTERVAL,
+                        help=f'Longest adaptive wait in seconds (default: {DEFAULT_MAX_INTERVAL})')
+    parser.add_argument('--quiet-hours', default=os.getenv("SYNC_QUIET_HOURS"),
+                        help='Local time range that always waits --max-interval, e.g. 22-6 (default: SYNC_QUIET_HOURS)')
+    parser.add_argument('--jitter', type=float, default=DEFAULT_JITTER,
+                        help=f'Random +/- fraction applied to adaptive waits (default: {DEFAULT_JITTER})')
+    parser.add_argument('--idle-timeout', type=int, default=DEFAULT_IDLE_TIMEOUT,
+                        help=f'Seconds before re-issuing IDLE in push mode (default: {DEFAULT_IDLE_TIMEOUT})')
+    
+    args = parser.parse_args()
+    interval = args.interval
+    
+    scheduler = None
+    if args.schedule == 'adaptive' and args.mode != 'push':
+        scheduler = AdaptiveScheduler(min_interval=args.min_interval, max_interval=args.max_interval,
+                                      initial_interval=min(args.max_interval, max(args.min_interval, interval)),
+                                      quiet_hours=args.quiet_hours, jitter=args.jitter)
     
-    print(f"Starting continuous sync with interval of {interval} seconds")
     print("Press Ctrl+C to exit")
     
     try:
-        while True:
-            run_gmail_sync()
-            print(f"Waiting {interval} seconds until next sync...")
-            time.sleep(interval)
+        if args.mode == 'push':
+            print(f"Starting push sync with IMAP IDLE (fallback poll every {interval} seconds)")
+            run_push_sync(poll_interval=interval, idle_timeout=args.idle_timeout)
+        elif args.mode == 'worker':
+            if scheduler is not None:
+                print(f"Starting in-process sync worker with adaptive interval of {args.min_interval}-{args.max_interval} seconds")
+            else:
+                print(f"Starting in-process sync worker with interval of {interval} seconds")
+            gmail_sync = load_sync_worker()
+            run_scheduled(lambda: run_worker_sync(gmail_sync), scheduler, interval)
+        else:
+            if scheduler is not None:
+                print(f"Starting continuous sync with adaptive interval of {args.min_interval}-{args.max_interval} seconds")
+            else:
+                print(f"Starting continuous sync with interval of {interval} seconds")
+            run_scheduled(run_gmail_sync, scheduler, interval)
     except KeyboardInterrupt:
         print("Interrupted by user. Exiting...")
     except Exception as e:
         print(f"Error in continuous sync: {e}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
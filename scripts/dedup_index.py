@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Local Dedup Index for Imported Emails
+
+This module keeps a persistent SQLite index of the gmail_id values already
+stored in the Supabase emails table, so the sync can tell which fetched
+messages are new without downloading the whole table on every run.
+
+Lookups check the local index first. IDs it does not know are checked
+against Supabase with batched `in_` queries, and any hits are added locally,
+so dedup cost scales with the size of the fetch batch rather than with the
+mailbox history.
+"""
+
+import os
+import sqlite3
+import threading
+
+# Number of IDs per server-side `in_` query (keeps the request URL short)
+SERVER_CHECK_BATCH_SIZE = 200
+
+# Rows per page when copying gmail_ids from Supabase into the index
+REFRESH_PAGE_SIZE = 1000
+
+
+class DedupIndex:
+    """Persistent local index of gmail_ids known to exist in Supabase"""
+    
+    def __init__(self, supabase, path):
+        """
+        Open (or create) the index
+        
+        Args:
+            supabase: Supabase client used for server-side checks
+            path: Path of the SQLite index file
+        """
+        self.supabase = supabase
+        self.path = path
+        self._lock = threading.Lock()
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS gmail_ids (gmail_id TEXT PRIMARY KEY)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._db.commit()
+        
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM gmail_ids").fetchone()[0]
+    
+    def add(self, gmail_ids):
+        """Record gmail_ids as stored in the database"""
+        gmail_ids = [gmail_id for gmail_id in gmail_ids if gmail_id]
+        if not gmail_ids:
+            return
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO gmail_ids (gmail_id) VALUES (?)",
+                [(gmail_id,) for gmail_id in gmail_ids]
+            )
+            self._db.commit()
+    
+    def _lookup_local(self, gmail_ids):
+        """Return the subset of gmail_ids present in the local index"""
+        found = set()
+        gmail_ids = list(gmail_ids)
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(gmail_ids), 500):
+                chunk = gmail_ids[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._db.execute(
+                    f"SELECT gmail_id FROM gmail_ids WHERE gmail_id IN ({placeholders})", chunk
+                ).fetchall()
+                found.update(row[0] for row in rows)
+        return found
+        
+    def _lookup_remote(self, gmail_ids):
+        """Return the subset of gmail_ids present in the Supabase emails table"""
+        found = set()
+        gmail_ids = list(gmail_ids)
+        for start in range(0, len(gmail_ids), SERVER_CHECK_BATCH_SIZE):
+            chunk = gmail_ids[start:start + SERVER_CHECK_BATCH_SIZE]
+            response = self.supabase.table("emails").select("gmail_id").in_("gmail_id", chunk).execute()
+            found.update(item["gmail_id"] for item in response.data or [])
+        return found
+        
+    def filter_existing(self, gmail_ids):
+        """
+        Find which of the given gmail_ids already exist in the database
+        
+        Args:
+            gmail_ids: Candidate message IDs (typically one fetch batch)
+            
+        Returns:
+            set: The gmail_ids that are already stored
+        """
+        gmail_ids = set(gmail_id for gmail_id in gmail_ids if gmail_id)
+        if not gmail_ids:
+            return set()
+            
+        existing = self._lookup_local(gmail_ids)
+        unknown = gmail_ids - existing
+        if unknown:
+            try:
+                remote = self._lookup_remote(unknown)
+            except Exception as e:
+                print(f"Error checking existing emails in database: {e}")
+                remote = set()
+            if remote:
+                self.add(remote)
+                existing |= remote
+        return existing
+        
+    def refresh(self):
+        """
+        Copy gmail_ids added to Supabase since the last refresh into the index
+        
+        Uses keyset pagination on emails.id, so each call only transfers rows
+        newer than the last one seen.
+        
+        Returns:
+            int: Number of rows read from the database
+        """
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'last_row_id'").fetchone()
+        last_row_id = int(row[0]) if row else 0
+        total = 0
+        
+        while True:
+            response = self.supabase.table("emails").select("id, gmail_id").gt(
+                "id", last_row_id
+            ).order("id").limit(REFRESH_PAGE_SIZE).execute()
+            rows = response.data or []
+            if not rows:
+                break
+                
+            self.add(item["gmail_id"] for item in rows)
+            last_row_id = rows[-1]["id"]
+            total += len(rows)
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('last_row_id', ?)", (str(last_row_id),)
+                )
+                self._db.commit()
+                
+            if len(rows) < REFRESH_PAGE_SIZE:
+                break
+        
+        return total
+        
+    def rebuild(self):
+        """Discard the index and rebuild it from the emails table"""
+        with self._lock:
+            self._db.execute("DELETE FROM gmail_ids")
+            self._db.execute("DELETE FROM meta WHERE key = 'last_row_id'")
+            self._db.commit()
+        return self.refresh()
+        
+    def close(self):
+        """Close the underlying SQLite connection"""
+        with self._lock:
+            self._db.close()
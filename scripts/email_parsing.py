@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Email Parsing Helpers
+
+This module turns raw RFC822 messages into the fields the sync stores:
+decoded subject, addresses, date, thread and plain-text body. It has no database or
+IMAP dependencies, so it can run in worker processes (archive replay, bulk
+imports) as well as inside gmail_sync.
+"""
+
+import re
+import email
+import hashlib
+import email.utils
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from email.header import decode_header
+from datetime import datetime
+from html import unescape
+
+# Message-IDs inside References / In-Reply-To headers
+MESSAGE_ID_PATTERN = re.compile(r"<([^<>\s]+)>")
+
+# Reply and forward prefixes, possibly repeated ("Re: Fwd: RE[2]: ...")
+SUBJECT_PREFIX_PATTERN = re.compile(r"^\s*((re|fwd?|aw|wg)\s*(\[\d+\])?\s*:\s*)+", re.IGNORECASE)
+
+
+def clean_email_address(addr):
+    """Clean and extract email address."""
+    if not addr:
+        return ""
+    
+    # Handle format like "Name <email@example.com>"
+    if '<' in addr and '>' in addr:
+        start = addr.find('<') + 1
+        end = addr.find('>')
+        return addr[start:end].strip()
+    return addr.strip()
+
+
+def parse_email_addresses(addr_str):
+    """Parse email addresses from comma-separated string."""
+    if not addr_str:
+        return []
+    
+    return [clean_email_address(addr) for addr in addr_str.split(',') if addr.strip()]
+
+
+def decode_email_content(part):
+    """Decode email content based on charset."""
+    content = part.get_payload(decode=True)
+    if not content:
+        return ""
+        
+    charset = part.get_content_charset()
+    
+    if charset:
+        try:
+            return content.decode(charset)
+        except:
+            try:
+                return content.decode('latin1')  # Fallback encoding
+            except:
+                return ""  # If all decoding fails
+    else:
+        try:
+            return content.decode('utf-8')
+        except:
+            try:
+                return content.decode('latin1')  # Fallback encoding
+            except:
+                return ""  # If all decoding fails
+
+
+def html_to_text(html):
+    """Reduce an HTML body to plain text."""
+    html = re.sub(r'(?is)<(script|style)\b.*?</\1>', ' ', html)
+    text = unescape(re.sub(r'(?s)<[^>]+>', ' ', html))
+    text = re.sub(r'[ \t\r\f\v]+', ' ', text)
+    return re.sub(r'\s*\n\s*', '\n', text).strip()
+
+
+def get_email_body(msg):
+    """Extract email body from a message object (HTML is used only when there is no plain text)."""
+    if msg.is_multipart():
+        # If multipart, find the text part
+        text_parts = []
+        html_parts = []
+        for part in msg.walk():
+            content_type = part.get_content_type()
+            content_disposition = str(part.get("Content-Disposition"))
+            
+            # Skip attachments
+            if "attachment" in content_disposition:
+                continue
+            
+            # Look for text/plain parts, keeping HTML as a fallback
+            if content_type == "text/plain":
+                try:
+                    text_parts.append(decode_email_content(part))
+                except:
+                    continue
+            elif content_type == "text/html":
+                try:
+                    html_parts.append(decode_email_content(part))
+                except:
+                    continue
+        
+        # Join all text parts
+        if not text_parts and html_parts:
+            return html_to_text("\n".join(html_parts))
+        return "\n".join(text_parts)
+    else:
+        # Not multipart - return the payload directly
+        try:
+            if msg.get_content_type() == "text/html":
+                return html_to_text(decode_email_content(msg))
+            return decode_email_content(msg)
+        except:
+            return ""
+
+
+def decode_subject(msg):
+    """Decode a message's (possibly RFC 2047 encoded) Subject header."""
+    subject = ""
+    subject_header = decode_header(msg.get("Subject", ""))
+    for part, encoding in subject_header:
+        if isinstance(part, bytes):
+            if encoding:
+                try:
+                    subject += part.decode(encoding)
+                except:
+                    subject += part.decode('utf-8', errors='replace')
+            else:
+                subject += part.decode('utf-8', errors='replace')
+        else:
+            subject += str(part)
+    return subject
+
+
+def get_message_id(msg, email_id, scope=""):
+    """
+    Get the cleaned Message-ID of a message, generating one if it is missing.
+    
+    A generated ID hashes `scope` (the mailbox and its UIDVALIDITY), the
+    UID `email_id` and the Date and From headers, so fetching the same
+    message again gives the same ID and the dedup index and sync journal
+    recognize it.
+    """
+    message_id = msg.get("Message-ID", "")
+    if not message_id:
+        key = "\0".join((scope, email_id.decode(), str(msg.get("Date", "")), str(msg.get("From", ""))))
+        message_id = "generated-" + hashlib.sha256(key.encode("utf-8", "surrogateescape")).hexdigest()[:32]
+    
+    # Ensure message_id is a string
+    if isinstance(message_id, bytes):
+        message_id = message_id.decode()
+    
+    # Clean < and > from message_id
+    return message_id.strip("<>")
+
+
+def get_thread_id(msg, message_id):
+    """
+    Get the thread a message belongs to
+    
+    The thread is named after its first message: the root of the References
+    chain (clients keep it even when they trim the middle), else the
+    In-Reply-To parent, else the message's own ID. It needs no lookups, so
+    it can be computed when the message is parsed.
+    """
+    for header in ("References", "In-Reply-To"):
+        ids = MESSAGE_ID_PATTERN.findall(str(msg.get(header, "") or ""))
+        if ids:
+            return ids[0]
+    return message_id
+
+
+def normalize_subject(subject):
+    """Lower-case a subject and drop its reply/forward prefixes, for comparing messages in a thread."""
+    subject = SUBJECT_PREFIX_PATTERN.sub("", subject or "")
+    return " ".join(subject.split()).lower()
+
+
+def parser_pool(max_workers):
+    """
+    Create the process pool archive replays and bulk imports parse in
+    
+    Workers are started by a forkserver that has only imported this module
+    (spawn where there is no forkserver), never forked from the caller: by
+    the time a pool starts, the caller runs threads (HTTP clients, triage
+    workers, the attachment indexer), and a forked worker can inherit a lock
+    one of them held with no thread left to release it.
+    
+    Started workers import the main script again before running any task,
+    so the functions handed to them should live in modules like this one
+    that build no clients or stores on import, and a script that starts a
+    pool is best kept free of module-level clients (see bulk_import).
+    
+    Args:
+        max_workers: Number of parser processes
+        
+    Returns:
+        ProcessPoolExecutor: The pool
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["email_parsing"])
+    else:
+        context = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+
+
+def parse_email(msg, message_id, body=None):
+    """
+    Extract the stored fields of a message
+    
+    Args:
+        msg: email.message.Message (headers only is enough if body is given)
+        message_id: gmail_id to store the email under (see get_message_id)
+        body: Already extracted body text, or None to extract it from msg
+        
+    Returns:
+        dict: gmail_id, thread_id, subject, sender, recipient, cc, bcc, body and date (ISO format)
+    """
+    # Get date
+    date_str = msg.get("Date", "")
+    try:
+        date = email.utils.parsedate_to_datetime(date_str)
+    except:
+        date = datetime.now()  # Fallback to current time
+        
+    return {
+        "gmail_id": message_id,
+        "thread_id": get_thread_id(msg, message_id),
+        "subject": decode_subject(msg),
+        "sender": msg.get("From", ""),
+        "recipient": parse_email_addresses(msg.get("To", "")),
+        "cc": parse_email_addresses(msg.get("Cc", "")),
+        "bcc": parse_email_addresses(msg.get("Bcc", "")),
+        "body": body if body is not None else get_email_body(msg),
+        "date": date.isoformat()
+    }
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Durable Local Spool for Triaged Emails
+
+This module provides a SQLite-backed write-ahead queue. Triaged emails are
+written here before anything is sent to Supabase, so an email that has
+already cost an LLM call survives a slow or unavailable database, or a
+crash. A drainer claims entries in batches, writes them to the database,
+and acknowledges them. Entries that fail are retried with exponential
+backoff and are set aside as dead after too many attempts.
+
+Entries may carry a source key (gmail_sync uses the mailbox label), so
+pipelines running side by side each drain only their own entries.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+# Retry delays grow from SPOOL_BASE_BACKOFF up to SPOOL_MAX_BACKOFF seconds
+SPOOL_BASE_BACKOFF = 5
+SPOOL_MAX_BACKOFF = 300
+
+# Attempts before an entry is set aside as dead (kept for inspection)
+DEFAULT_MAX_ATTEMPTS = 20
+
+
+class EmailSpool:
+    """Durable queue of triaged emails waiting to be written to the database"""
+    
+    def __init__(self, path, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """
+        Open (or create) the spool
+        
+        Args:
+            path: Path of the SQLite spool file
+            max_attempts: Failed writes before an entry is marked dead
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # Every committed enqueue must survive a power loss
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS spool ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, gmail_id TEXT, payload TEXT NOT NULL, "
+            "enqueued_at REAL, attempts INTEGER DEFAULT 0, next_attempt_at REAL DEFAULT 0, "
+            "claimed INTEGER DEFAULT 0, dead INTEGER DEFAULT 0, last_error TEXT, source TEXT)"
+        )
+        # Spools created before entries had a source get the column (their entries keep NULL)
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(spool)")]
+        if "source" not in columns:
+            self._db.execute("ALTER TABLE spool ADD COLUMN source TEXT")
+        # Claims held by a process that crashed are released on open
+        self._db.execute("UPDATE spool SET claimed = 0 WHERE claimed = 1")
+        self._db.commit()
+        
+    def put(self, emails, source=None):
+        """Durably enqueue emails under an optional source key (returns once they are committed to disk)"""
+        now = time.time()
+        rows = [(email["gmail_id"], json.dumps(email, default=str), now, source) for email in emails]
+        if not rows:
+            return
+        with self._lock:
+            self._db.executemany("INSERT INTO spool (gmail_id, payload, enqueued_at, source) VALUES (?, ?, ?, ?)", rows)
+            self._db.commit()
+    
+    def claim(self, limit, source=None):
+        """
+        Claim up to `limit` entries that are due for a write attempt
+        
+        Args:
+            limit: Maximum number of entries
+            source: Only claim entries put with this source key (None: any entry)
+        
+        Returns:
+            list: (entry_id, email) tuples, oldest first
+        """
+        where, params = self._source_filter(source)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT id, payload FROM spool WHERE claimed = 0 AND dead = 0 AND next_attempt_at <= ?{where} "
+                "ORDER BY id LIMIT ?", (time.time(), *params, limit)
+            ).fetchall()
+            if rows:
+                self._db.executemany("UPDATE spool SET claimed = 1 WHERE id = ?", [(row[0],) for row in rows])
+                self._db.commit()
+        return [(entry_id, json.loads(payload)) for entry_id, payload in rows]
+        
+    def ack(self, entry_ids):
+        """Remove entries that were written to the database"""
+        if not entry_ids:
+            return
+        with self._lock:
+            self._db.executemany("DELETE FROM spool WHERE id = ?", [(entry_id,) for entry_id in entry_ids])
+            self._db.commit()
+    
+    def retry(self, entry_ids, error):
+        """
+        Release entries after a failed write and schedule their next attempt
+        
+        Returns:
+            int: Number of entries that reached max_attempts and are now dead
+        """
+        if not entry_ids:
+            return 0
+        now = time.time()
+        dead = 0
+        with self._lock:
+            for entry_id in entry_ids:
+                row = self._db.execute("SELECT attempts FROM spool WHERE id = ?", (entry_id,)).fetchone()
+                if row is None:
+                    continue
+                attempts = row[0] + 1
+                delay = min(SPOOL_MAX_BACKOFF, SPOOL_BASE_BACKOFF * 2 ** (attempts - 1))
+                is_dead = attempts >= self.max_attempts
+                dead += is_dead
+                self._db.execute(
+                    "UPDATE spool SET claimed = 0, attempts = ?, next_attempt_at = ?, dead = ?, last_error = ? "
+                    "WHERE id = ?", (attempts, now + delay, int(is_dead), str(error)[:1000], entry_id)
+                )
+            self._db.commit()
+        return dead
+        
+    def next_attempt_in(self, source=None):
+        """Seconds until the next unclaimed entry is due (0 if one is due now, None if there is none; `source` as for claim)"""
+        where, params = self._source_filter(source)
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT MIN(next_attempt_at) FROM spool WHERE claimed = 0 AND dead = 0{where}", params
+            ).fetchone()
+        if row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+        
+    def counts(self, source=None):
+        """
+        Get the number of waiting and dead entries (of `source`, if given)
+        
+        Returns:
+            tuple: (waiting, dead)
+        """
+        where, params = self._source_filter(source)
+        with self._lock:
+            waiting, dead = self._db.execute(
+                f"SELECT COALESCE(SUM(dead = 0), 0), COALESCE(SUM(dead = 1), 0) FROM spool WHERE 1 = 1{where}", params
+            ).fetchone()
+        return waiting, dead
+        
+    def _source_filter(self, source):
+        """SQL condition and parameters selecting the entries of a source key (none for None)"""
+        if source is None:
+            return "", ()
+        return " AND source = ?", (source,)
+        
+    def close(self):
+        """Close the underlying SQLite connection"""
+        with self._lock:
+            self._db.close()
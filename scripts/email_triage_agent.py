@@ -8,11 +8,94 @@ from Gmail before they are added to the Supabase vector store.
 
 import os
 import re
+import time
+import hashlib
+import threading
+import crewai
 from crewai import Agent, Task, Crew
 from crewai.flow.flow import Flow, listen, start
+from crewai.utilities.events import (
+    crewai_event_bus, LLMCallStartedEvent, LLMCallCompletedEvent, LLMCallFailedEvent
+)
 from pydantic import BaseModel
 from typing import Literal
 
+from rate_limiter import estimate_tokens
+from triage_rules import get_default_rules
+
+# Reasoning of decisions reused from an earlier email in the thread
+THREAD_REUSE_PREFIX = "Follow-up in an already triaged thread."
+
+# Reasoning of decisions the LLM made in the expected format (the local classifier trains on these)
+LLM_PREFIX = "LLM triage:"
+
+# Print CrewAI's agent and crew traces (TRIAGE_VERBOSE=true); off by default
+DEFAULT_VERBOSE = os.getenv("TRIAGE_VERBOSE", "false").lower() in ("1", "true", "yes")
+
+# Keep CrewAI's `crewai replay` task log (TRIAGE_REPLAY_LOG=true); off by default, see _NoReplayLog
+DEFAULT_REPLAY_LOG = os.getenv("TRIAGE_REPLAY_LOG", "false").lower() in ("1", "true", "yes")
+
+# CrewAI release whose private task log attribute _NoReplayLog replaces (pinned in requirements.txt)
+REPLAY_LOG_CREWAI_VERSION = "0.108.0"
+
+# Seconds the current thread has spent inside LLM requests, fed by CrewAI's event bus
+_llm_timing = threading.local()
+_llm_timing_lock = threading.Lock()
+_llm_timing_registered = False
+
+# Whether the notice about keeping another CrewAI release's replay log was printed (once per process)
+_replay_log_notice_printed = False
+_replay_log_notice_lock = threading.Lock()
+
+
+def _register_llm_timing():
+    """Time every LLM request on the thread that makes it (registered once per process)"""
+    global _llm_timing_registered
+    with _llm_timing_lock:
+        if _llm_timing_registered:
+            return
+            
+        @crewai_event_bus.on(LLMCallStartedEvent)
+        def on_llm_call_started(source, event):
+            _llm_timing.started = time.perf_counter()
+            
+        def on_llm_call_finished(source, event):
+            started = getattr(_llm_timing, "started", None)
+            if started is not None:
+                _llm_timing.seconds = getattr(_llm_timing, "seconds", 0.0) + time.perf_counter() - started
+                _llm_timing.started = None
+                
+        crewai_event_bus.on(LLMCallCompletedEvent)(on_llm_call_finished)
+        crewai_event_bus.on(LLMCallFailedEvent)(on_llm_call_finished)
+        _llm_timing_registered = True
+
+
+class _NoReplayLog:
+    """
+    Stands in for the task output log CrewAI keeps for `crewai replay`
+    
+    Every kickoff would otherwise clear and rewrite a SQLite file shared by
+    all crews in the process, storing each email's body on disk; that was
+    the largest cost of a kickoff outside the LLM request. The trade-off is
+    that `crewai replay` has nothing to replay for triage crews.
+    
+    CrewAI has no public switch for this log, so the crew's private
+    _task_output_handler is replaced, and only on the pinned CrewAI release
+    (REPLAY_LOG_CREWAI_VERSION); any other release keeps its log.
+    """
+    
+    def update(self, task_index, log):
+        pass
+        
+    def add(self, *args, **kwargs):
+        pass
+        
+    def reset(self):
+        pass
+        
+    def load(self):
+        return None
+
 
 class EmailTriageState(BaseModel):
     """
@@ -21,6 +104,9 @@ class EmailTriageState(BaseModel):
     email_subject: str = ""
     email_body: str = ""
     email_sender: str = ""
+    use_cache: bool = True  # False re-asks the LLM even for cached sender/subject templates
+    use_reputation: bool = True  # False ignores the sender's triage history
+    use_classifier: bool = True  # False skips the local classifier
     triage_category: Literal["ignore", "notify", "respond"] = "notify"  # Default to notify if unsure
     triage_reasoning: str = ""
 
@@ -28,14 +114,35 @@ class EmailTriageState(BaseModel):
 class EmailTriageAgent:
     """Email triage agent using CrewAI to evaluate email importance"""
     
-    def __init__(self, triage_instructions=None):
+    def __init__(self, triage_instructions=None, rate_limiter=None, rules=None, cache=None, reputation=None,
+                 classifier=None, verbose=None, replay_log=None):
         """
         Initialize the email triage agent with instructions
         
         Args:
             triage_instructions: Dictionary containing triage instructions for each category
+            rate_limiter: Optional RateLimiter applied before each LLM call
+            rules: Optional CompiledRules (default: triage_rules.json, or TRIAGE_RULES_FILE)
+            cache: Optional TriageCache consulted before each LLM call
+            reputation: Optional SenderReputation consulted before each LLM call (gmail_sync
+                adds the LLM's decisions to it once they are stored)
+            classifier: Optional TriageClassifier that answers before the LLM when it is confident
+            verbose: Whether CrewAI prints its traces (default: TRIAGE_VERBOSE)
+            replay_log: Whether CrewAI keeps its `crewai replay` task log (default: TRIAGE_REPLAY_LOG)
         """
         self.triage_instructions = triage_instructions or {}
+        self.rate_limiter = rate_limiter
+        self.rules = rules or get_default_rules()
+        self.cache = cache
+        self.reputation = reputation
+        self.classifier = classifier
+        self.verbose = DEFAULT_VERBOSE if verbose is None else verbose
+        self.replay_log = DEFAULT_REPLAY_LOG if replay_log is None else replay_log
+        self._stats_lock = threading.Lock()
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+        self.kickoff_seconds = 0.0
+        self.overhead_seconds = 0.0
         self._load_default_instructions()
         self._create_agent()
         
@@ -96,7 +203,15 @@ class EmailTriageAgent:
             """
     
     def _create_agent(self):
-        """Create the CrewAI agent for email triage"""
+        """
+        Create the CrewAI agent, task and crew for email triage
+        
+        The crew is built once and kicked off for every email; kickoff
+        formats the task description (and backstory) with the email from the
+        originals CrewAI keeps, so nothing from one email leaks into the next.
+        Each agent is only used by one thread at a time (gmail_sync pools the
+        flows that own them).
+        """
         # First detect and clean the instructions
         for key in self.triage_instructions:
             # Clean up the instructions by removing excess whitespace
@@ -137,11 +252,14 @@ class EmailTriageAgent:
         Then provide your detailed reasoning on subsequent lines.
         """
         
+        # Kickoff formats the backstory with the inputs, so braces in the instructions are escaped
+        backstory = backstory.replace("{", "{{").replace("}", "}}")
+        
         self.agent = Agent(
             role="Email Triage Specialist",
             goal="Categorize emails accurately based on importance and need for response",
             backstory=backstory,
-            verbose=True
+            verbose=self.verbose
         )
         
         self.task = Task(
@@ -159,123 +277,83 @@ class EmailTriageAgent:
             "ignore", "notify", or "respond"
             
             Then provide a detailed explanation of your reasoning.
+            
+            Email to triage:
+            {email}
             """,
             expected_output="A category (ignore, notify, or respond) on the first line, followed by a detailed explanation",
             agent=self.agent
         )
+        
+        # Cached decisions are only valid for the instructions (and model) that made them
+        self.instructions_fingerprint = hashlib.sha256(
+            (backstory + self.task.description + os.getenv("MODEL", "") + os.getenv("OPENAI_MODEL_NAME", "")).encode("utf-8")
+        ).hexdigest()[:16]
+        
+        self.crew = Crew(
+            agents=[self.agent],
+            tasks=[self.task],
+            verbose=self.verbose
+        )
+        if not self.replay_log:
+            self._disable_replay_log()
+        
+        # Tokens of the prompt around the email, counted once rather than per call
+        self._prompt_tokens = estimate_tokens(backstory + self.task.description)
+        _register_llm_timing()
     
+    def _disable_replay_log(self):
+        """Swap the crew's `crewai replay` task log for _NoReplayLog where that is known to be safe"""
+        global _replay_log_notice_printed
+        if crewai.__version__ != REPLAY_LOG_CREWAI_VERSION or not hasattr(self.crew, "_task_output_handler"):
+            # Every warm crew of every triage worker gets here, so say it once
+            with _replay_log_notice_lock:
+                if not _replay_log_notice_printed:
+                    _replay_log_notice_printed = True
+                    print(f"CrewAI {crewai.__version__} is not {REPLAY_LOG_CREWAI_VERSION}; "
+                          f"keeping its replay log (set TRIAGE_REPLAY_LOG=true to silence this)")
+            return
+        self.crew._task_output_handler = _NoReplayLog()
+        
     def _analyze_email_indicators(self, subject, body, sender):
         """
         Pre-analyze email for common indicators of importance or clear marketing/notification emails
         
+        The rules (critical communications first, then platform notifications
+        and marketing) are compiled from the rules file by triage_rules.
+        
         Returns:
-            tuple: (likely_category, confidence, reasoning)
+            tuple: (likely_category, confidence, reasoning, rule_id)
         """
-        subject_lower = subject.lower() if subject else ""
-        body_lower = body.lower() if body else ""
-        sender_lower = sender.lower() if sender else ""
+        match = self.rules.match(subject, body, sender)
+        if match is None:
+            # No conclusive indicators found, letting the AI do more detailed analysis
+            return None, 0, "No conclusive indicators found, need AI analysis", None
+        return match.category, match.confidence, match.reason, match.rule_id
         
-        # QUICK PATTERN MATCHING - These are high-confidence cases we can decide immediately
+    def triage_headers(self, subject, sender):
+        """
+        Categorize an email from its subject and sender alone, when the rules allow it
         
-        # Check for critical communications that should never be ignored
+        Only "ignore" decisions are returned, and only from a rule the body
+        cannot overturn (CompiledRules.match_headers refuses to decide when
+        the first rule the headers allow also looks at the body).
         
-        # 1. Voice/text/fax messages from RingCentral
-        if any(term in subject_lower for term in ["voice message", "text message", "fax"]) and "ringcentral" in sender_lower:
-            return "notify", 0.95, "Message notification from RingCentral"
-            
-        # 2. Bills and payments
-        if ("bill" in subject_lower and "due" in subject_lower) or "payment required" in subject_lower:
-            return "notify", 0.95, "Bill or payment notification"
-        
-        # 3. Legal communications
-        legal_indicators = [
-            "case", "court", "filing", "attorney", "lawyer", "legal", 
-            "hearing", "plaintiff", "defendant", "estate", "vs.", "v."
-        ]
-        
-        for indicator in legal_indicators:
-            if indicator in subject_lower:
-                return "respond", 0.95, f"Legal term in subject: '{indicator}'"
-        
-        # 4. Team member communications
-        team_domains = ["whaleylawfirm.com", "filevine.com", "blazeo.com"]
-        is_team_member = any(domain in sender_lower for domain in team_domains)
-        
-        if is_team_member:
-            return "respond", 0.95, "Email from team member domain"
-        
-        # AGGRESSIVE FILTERING OF MARKETING/NOTIFICATION EMAILS
-        
-        # 1. Platform notifications and digests
-        platform_indicators = [
-            "new notification" in subject_lower,
-            "notification" in subject_lower and not "court" in subject_lower,
-            "digest" in subject_lower,
-            "what you missed" in body_lower,
-            "notification since" in body_lower,
-            "noreply" in sender_lower,
-            "no-reply" in sender_lower,
-            "donotreply" in sender_lower,
-            "notification" in sender_lower,
-            "updates" in subject_lower and "new" in subject_lower,
-            any(domain in sender_lower for domain in ["skool.com", "medium.com", "facebook.com", "twitter.com", "linkedin.com"]),
-            "view online" in body_lower[:500],
-            "view in browser" in body_lower,
-            "email preferences" in body_lower,
-            "unsubscribe" in body_lower and ("offer" in body_lower or "discount" in body_lower),
-            body_lower.count("http") > 5,  # Many links is a sign of marketing email
-            "too many emails" in body_lower
-        ]
-        
-        if any(platform_indicators):
-            # Find the first true indicator for better explanation
-            for i, indicator in enumerate(platform_indicators):
-                if indicator:
-                    if i == 0: return "ignore", 0.9, "Email contains 'new notification' in subject"
-                    if i == 1: return "ignore", 0.9, "Email contains 'notification' in subject"
-                    if i == 2: return "ignore", 0.9, "Email is a digest"
-                    if i == 3: return "ignore", 0.9, "Email contains 'what you missed'"
-                    if i == 4: return "ignore", 0.9, "Email contains 'notification since'"
-                    if i == 5: return "ignore", 0.9, "Email is from noreply address"
-                    if i == 6: return "ignore", 0.9, "Email is from no-reply address"
-                    if i == 7: return "ignore", 0.9, "Email is from donotreply address"
-                    if i == 8: return "ignore", 0.9, "Email is from notification sender"
-                    if i == 9: return "ignore", 0.9, "Email contains 'updates' and 'new' in subject"
-                    if i == 10: return "ignore", 0.9, "Email is from social/platform domain"
-                    if i == 11: return "ignore", 0.9, "Email has 'view online' at top"
-                    if i == 12: return "ignore", 0.9, "Email has 'view in browser'"
-                    if i == 13: return "ignore", 0.9, "Email mentions email preferences"
-                    if i == 14: return "ignore", 0.9, "Email has unsubscribe and offer/discount"
-                    if i == 15: return "ignore", 0.9, "Email contains many links (marketing)"
-                    if i == 16: return "ignore", 0.9, "Email mentions 'too many emails'"
-        
-        # 2. Marketing and promotional emails
-        marketing_indicators = [
-            "offer" in subject_lower,
-            "discount" in subject_lower,
-            "sale" in subject_lower,
-            "deal" in subject_lower,
-            "promotion" in subject_lower,
-            "special" in subject_lower and "offer" in subject_lower,
-            "coupon" in subject_lower,
-            "limited time" in subject_lower or "limited time" in body_lower[:500],
-            "off" in subject_lower and "%" in subject_lower,
-            "exclusive" in subject_lower,
-            "reward" in subject_lower and not "law" in subject_lower,
-            "pro days" in body_lower[:500],
-            "pro days" in subject_lower,
-            "come back" in subject_lower, 
-            "miss you" in subject_lower,
-            "save" in subject_lower and "$" in subject_lower
-        ]
-        
-        if any(marketing_indicators):
-            return "ignore", 0.9, "Email contains marketing/promotional content"
+        Args:
+            subject: Email subject
+            sender: Email sender address
             
-        # No conclusive indicators found, letting the AI do more detailed analysis
-        return None, 0, "No conclusive indicators found, need AI analysis"
+        Returns:
+            tuple: (category, reasoning), or (None, None) if the body is needed
+        """
+        match = self.rules.match_headers(subject, sender)
+        
+        if match is not None and match.category == "ignore" and match.confidence >= 0.9:
+            return match.category, f"Automatic categorization (headers only): {match.reason} [rule: {match.rule_id}]"
+        return None, None
         
-    def triage_email(self, subject, body, sender):
+    def triage_email(self, subject, body, sender, thread_lookup=None, use_cache=True, use_reputation=True,
+                     use_classifier=True):
         """
         Triage an email using the CrewAI agent
         
@@ -283,6 +361,12 @@ class EmailTriageAgent:
             subject: Email subject
             body: Email body text
             sender: Email sender address
+            thread_lookup: Callable returning the (category, reasoning) of an earlier
+                email in the same thread, or None; called only when the rules do not
+                decide, and its decision is used instead of the LLM (follow-ups)
+            use_cache: Whether the triage cache may answer instead of the LLM
+            use_reputation: Whether the sender's history may answer instead of the LLM
+            use_classifier: Whether the local classifier may answer instead of the LLM
             
         Returns:
             tuple: (category, reasoning)
@@ -290,31 +374,58 @@ class EmailTriageAgent:
                 reasoning - explanation for the categorization
         """
         # First do a basic analysis for high-confidence cases
-        pre_category, confidence, pre_reasoning = self._analyze_email_indicators(subject, body, sender)
+        pre_category, confidence, pre_reasoning, rule_id = self._analyze_email_indicators(subject, body, sender)
         
         # For high confidence cases, we can skip the AI agent
         if pre_category and confidence >= 0.9:
-            return pre_category, f"Automatic categorization: {pre_reasoning}"
+            return pre_category, f"Automatic categorization: {pre_reasoning} [rule: {rule_id}]"
             
-        # Create a crew with the agent and task
-        crew = Crew(
-            agents=[self.agent],
-            tasks=[self.task],
-            verbose=True
-        )
+        # Follow-ups in a thread that was already triaged keep the thread's decision
+        thread_category, thread_reasoning = (thread_lookup() if thread_lookup else None) or (None, None)
+        if thread_category in ("ignore", "notify", "respond"):
+            thread_reasoning = thread_reasoning or ""
+            if not thread_reasoning.startswith(THREAD_REUSE_PREFIX):
+                thread_reasoning = f"{THREAD_REUSE_PREFIX}\nThread reasoning: {thread_reasoning}"
+            return self._apply_safeguards(subject, sender, thread_category, thread_reasoning)
+            
+        # Repeated machine-generated mail gets the decision the LLM settled on before
+        use_cache = use_cache and self.cache is not None
+        if use_cache:
+            cached = self.cache.get(sender, subject, self.instructions_fingerprint)
+            if cached:
+                return cached
+                
+        # Senders whose history is overwhelmingly one category need no LLM call
+        use_reputation = use_reputation and self.reputation is not None
+        if use_reputation:
+            known = self.reputation.lookup(sender)
+            if known:
+                return self._apply_safeguards(subject, sender, *known)
+                
+        # Only emails the local classifier is unsure about reach the LLM
+        if use_classifier and self.classifier is not None:
+            predicted = self.classifier.predict(subject, body, sender)
+            if predicted:
+                return self._apply_safeguards(subject, sender, *predicted)
+            
+        started = time.perf_counter()
         
         # Prepare email content for the agent
-        email_content = f"""
-        Subject: {subject}
-        
-        From: {sender}
-        
-        Body:
-        {body}
-        """
-        
-        # Run the crew with the email content
-        result = crew.kickoff(inputs={"email": email_content})
+        email_content = f"Subject: {subject}\nFrom: {sender}\n\nBody:\n{body}"
+        
+        # Wait for LLM quota; rule-decided emails above never get here
+        if self.rate_limiter:
+            # Prompt (backstory, task and email) plus room for the completion
+            waited = time.perf_counter()
+            self.rate_limiter.acquire(self._prompt_tokens + estimate_tokens(email_content) + 500)
+            started += time.perf_counter() - waited
+        
+        # Run the warm crew with the email filled into the task description
+        _llm_timing.seconds = 0.0
+        kickoff_started = time.perf_counter()
+        result = self.crew.kickoff(inputs={"email": email_content})
+        kickoff_seconds = time.perf_counter() - kickoff_started
+        llm_seconds = _llm_timing.seconds
         
         # Parse the result - expected format is "category\nreasoning"
         result_text = result.raw.strip()
@@ -326,6 +437,7 @@ class EmailTriageAgent:
             reasoning = parts[1].strip() if len(parts) > 1 else "No reasoning provided"
             
             # Extract category - look for exact matches
+            parsed = category_text in ("ignore", "notify", "respond")
             if category_text == "ignore":
                 category = "ignore"
             elif category_text == "notify":
@@ -338,37 +450,77 @@ class EmailTriageAgent:
                 reasoning = f"Could not determine exact category from '{category_text}', defaulting to 'notify'.\n{result_text}"
         else:
             # Default if we can't parse the result
+            parsed = False
             category = "notify"
             reasoning = f"Failed to parse result: {result_text}"
             
+        if parsed:
+            reasoning = f"{LLM_PREFIX} {reasoning}"
+            
         # Apply safeguards to prevent important emails from being ignored
+        category, reasoning = self._apply_safeguards(subject, sender, category, reasoning)
         
-        # Voice messages, texts, faxes from RingCentral should never be ignored
-        if category == "ignore" and any(term in subject.lower() for term in ["voice message", "text message", "fax"]) and "ringcentral" in sender.lower():
-            category = "notify"
-            reasoning = f"SAFEGUARD OVERRIDE: Voice/text/fax messages should not be ignored.\nOriginal reasoning: {reasoning}"
-            
-        # Emails about cases or from attorneys should never be ignored
-        legal_terms = ["case", "court", "attorney", "estate", "v.", "vs.", "plaintiff", "defendant"]
-        if category == "ignore" and any(term in subject.lower() for term in legal_terms):
-            category = "respond"
-            reasoning = f"SAFEGUARD OVERRIDE: Legal correspondence should not be ignored.\nOriginal reasoning: {reasoning}"
+        # Only answers the LLM gave in the expected format are worth repeating
+        if use_cache and parsed:
+            self.cache.put(sender, subject, self.instructions_fingerprint, category, reasoning)
             
-        # Emails about bills should never be ignored
-        if category == "ignore" and ("bill" in subject.lower() and "due" in subject.lower()):
-            category = "notify"
-            reasoning = f"SAFEGUARD OVERRIDE: Bills and payment notices should not be ignored.\nOriginal reasoning: {reasoning}"
+        with self._stats_lock:
+            self.llm_calls += 1
+            self.llm_seconds += llm_seconds
+            self.kickoff_seconds += kickoff_seconds
+            self.overhead_seconds += time.perf_counter() - started - llm_seconds
                 
         return category, reasoning
+        
+    def llm_stats(self):
+        """
+        Get the time this agent's LLM triage calls took
+        
+        Returns:
+            dict: calls, llm_seconds (inside LLM requests), kickoff_seconds (CrewAI
+                kickoff, LLM requests included) and overhead_seconds (everything
+                outside the LLM requests, rate limiter waits excluded)
+        """
+        with self._stats_lock:
+            return {
+                "calls": self.llm_calls,
+                "llm_seconds": self.llm_seconds,
+                "kickoff_seconds": self.kickoff_seconds,
+                "overhead_seconds": self.overhead_seconds
+            }
+        
+    def _apply_safeguards(self, subject, sender, category, reasoning):
+        """
+        Keep important emails (RingCentral messages, legal correspondence, bills) from being ignored
+        
+        Returns:
+            tuple: (category, reasoning), overridden by the first matching safeguard
+        """
+        if category == "ignore":
+            override = self.rules.safeguard(subject, sender)
+            if override:
+                return override.category, f"{override.reason}\nOriginal reasoning: {reasoning}"
+        return category, reasoning
 
 
 class EmailTriageFlow(Flow[EmailTriageState]):
     """Flow for triaging an email using CrewAI"""
     
-    def __init__(self):
-        """Initialize the email triage flow"""
+    def __init__(self, rate_limiter=None, triage_cache=None, sender_reputation=None, classifier=None):
+        """
+        Initialize the email triage flow
+        
+        Args:
+            rate_limiter: Optional RateLimiter shared by all flows making LLM calls
+            triage_cache: Optional TriageCache shared by all flows
+            sender_reputation: Optional SenderReputation shared by all flows
+            classifier: Optional TriageClassifier shared by all flows
+        """
         super().__init__()
-        self.triage_agent = EmailTriageAgent()
+        self.triage_agent = EmailTriageAgent(rate_limiter=rate_limiter, cache=triage_cache,
+                                             reputation=sender_reputation, classifier=classifier)
+        # Set per email: finds the decision of an earlier email in its thread (see triage_email)
+        self.thread_lookup = None
     
     @start()
     def process_email(self):
@@ -379,7 +531,11 @@ class EmailTriageFlow(Flow[EmailTriageState]):
         category, reasoning = self.triage_agent.triage_email(
             self.state.email_subject,
             self.state.email_body,
-            self.state.email_sender
+            self.state.email_sender,
+            thread_lookup=self.thread_lookup,
+            use_cache=self.state.use_cache,
+            use_reputation=self.state.use_reputation,
+            use_classifier=self.state.use_classifier
         )
         
         # Update the state with the triage results
@@ -4,8 +4,15 @@ import email
 import imaplib
 import time
 import sys
-import random
-from email.header import decode_header
+import re
+import atexit
+import json
+import resource
+import queue
+import threading
+from collections import deque, OrderedDict
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from supabase import create_client, Client
@@ -15,6 +22,21 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Import the email triage agent
 from email_triage_agent import EmailTriageFlow
+from dedup_index import DedupIndex
+from rate_limiter import RateLimiter
+from imap_pool import ImapConnectionPool
+from email_spool import EmailSpool
+from sync_journal import SyncJournal
+from triage_cache import TriageCache, DEFAULT_MAX_ENTRIES as DEFAULT_TRIAGE_CACHE_SIZE, DEFAULT_TTL_DAYS as DEFAULT_TRIAGE_CACHE_TTL_DAYS
+from sender_reputation import SenderReputation
+from triage_classifier import load_classifier, LLM_PREFIX, BODY_CHARS as TRAINING_BODY_CHARS
+from email_parsing import (
+    clean_email_address, parse_email_addresses, decode_email_content, html_to_text,
+    get_email_body, decode_subject, get_message_id, normalize_subject, parse_email, parser_pool
+)
+from raw_archive import RawArchive, load_archived
+from attachments import AttachmentIndexer
+from imap_parts import parse_fetch_response, parse_bodystructure, select_text_parts, get_section, decode_part
 
 # Load environment variables
 load_dotenv()
@@ -24,93 +46,160 @@ supabase_url = os.environ.get("SUPABASE_URL")
 supabase_key = os.environ.get("SUPABASE_KEY")
 gmail_email = os.environ.get("GMAIL_EMAIL")
 gmail_password = os.environ.get("GMAIL_APP_PASSWORD")
+imap_host = os.environ.get("IMAP_HOST", "imap.gmail.com")
+imap_port = int(os.environ.get("IMAP_PORT", "993"))
+imap_ssl = os.environ.get("IMAP_SSL", "true").lower() not in ("0", "false", "no")
+
+# Optional JSON file listing several accounts/folders to sync (see load_accounts)
+sync_accounts_file = os.environ.get("SYNC_ACCOUNTS_FILE")
+
+# Directory for local sync state (dedup index, etc.)
+state_dir = os.environ.get("SYNC_STATE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "state"))
+
+# Optional directory for the compressed raw-message archive (see raw_archive.py)
+raw_archive_dir = os.environ.get("RAW_ARCHIVE_DIR")
 
 if not supabase_url or not supabase_key:
     print("Error: Supabase credentials not found in environment variables")
     sys.exit(1)
     
-if not gmail_email or not gmail_password:
+if (not gmail_email or not gmail_password) and not sync_accounts_file:
     print("Error: Gmail credentials not found in environment variables")
     sys.exit(1)
 
+# Number of UIDs requested per IMAP FETCH command
+DEFAULT_FETCH_BATCH_SIZE = 100
+
+# "full" downloads whole messages; "parts" reads BODYSTRUCTURE first and
+# downloads only the text parts, up to DEFAULT_PART_MAX_BYTES each
+DEFAULT_FETCH_MODE = os.environ.get("FETCH_MODE", "full")
+DEFAULT_PART_MAX_BYTES = int(os.environ.get("FETCH_PART_MAX_BYTES", str(256 * 1024)))
+
+# Fetch headers first and skip the body download for mail the rules ignore
+DEFAULT_HEADER_PRETRIAGE = os.environ.get("HEADER_PRETRIAGE", "false").lower() in ("1", "true", "yes")
+
+# Record attachment metadata (filename, type, size, SHA-256) of fully downloaded messages
+DEFAULT_INDEX_ATTACHMENTS = os.environ.get("INDEX_ATTACHMENTS", "false").lower() in ("1", "true", "yes")
+
+# Header fields the sync reads (two-phase fetches download only these)
+HEADER_FIELDS = "MESSAGE-ID SUBJECT FROM TO CC BCC DATE IN-REPLY-TO REFERENCES"
+
+# Reuse a thread's earlier triage decision for replies with the same subject
+# instead of asking the LLM again
+DEFAULT_THREAD_REUSE = os.environ.get("THREAD_TRIAGE_REUSE", "true").lower() in ("1", "true", "yes")
+
+# Threads whose latest decision is kept in memory
+THREAD_CACHE_SIZE = 10000
+
+# Reuse the LLM's settled decision for repeated sender + subject templates
+# (see triage_cache.py) instead of asking it again
+DEFAULT_TRIAGE_CACHE = os.environ.get("TRIAGE_CACHE", "true").lower() in ("1", "true", "yes")
+
+# Take a sender's category from its triage history (see sender_reputation.py)
+# when that history is overwhelmingly one category, and add LLM decisions to it when they are stored
+DEFAULT_SENDER_REPUTATION = os.environ.get("SENDER_REPUTATION", "true").lower() in ("1", "true", "yes")
+
+# Let the local classifier (see triage_classifier.py) decide before the LLM,
+# when a trained model exists; TRIAGE_CLASSIFIER_THRESHOLD overrides its threshold
+DEFAULT_TRIAGE_CLASSIFIER = os.environ.get("TRIAGE_CLASSIFIER", "true").lower() in ("1", "true", "yes")
+triage_model_path = os.environ.get("TRIAGE_MODEL_FILE", os.path.join(state_dir, "triage_classifier.npz"))
+
+# Number of emails triaged concurrently (LLM calls are still bounded by the rate limiter)
+DEFAULT_TRIAGE_WORKERS = int(os.environ.get("TRIAGE_WORKERS", "4"))
+
+# Number of rows written per Supabase upsert
+DEFAULT_STORE_BATCH_SIZE = 500
+
+# Maximum seconds a triaged email waits in the store buffer before being written
+STORE_FLUSH_SECONDS = 30
+
+# Archived messages parsed per worker task when replaying the raw archive
+REPLAY_CHUNK_SIZE = 200
+
+# Rows read per page when re-triaging stored emails (--reprocess-from-db)
+DEFAULT_REPROCESS_PAGE_SIZE = 500
+
+# Progress of an interrupted --reprocess-from-db run (last emails.id written)
+reprocess_cursor_path = os.path.join(state_dir, "reprocess_cursor.json")
+
+# Maximum open IMAP connections per server (Gmail allows 15 per account)
+DEFAULT_MAX_CONNECTIONS_PER_SERVER = int(os.environ.get("IMAP_MAX_CONNECTIONS_PER_SERVER", "10"))
+
+# IMAP connections per mailbox for --initial imports, each fetching its own UID range
+DEFAULT_IMPORT_CONNECTIONS = int(os.environ.get("IMPORT_CONNECTIONS", "4"))
+
+# Seconds between progress lines of a parallel import
+IMPORT_PROGRESS_SECONDS = 10
+
+# Counters iter_emails adds to its metrics dict
+FETCH_METRICS = ("fetched", "fetch_seconds", "bytes_total", "bytes_downloaded",
+                 "pretriage_candidates", "pretriaged", "pretriage_bytes_avoided")
+
+# Maximum number of mailboxes synced at the same time
+DEFAULT_MAILBOX_WORKERS = int(os.environ.get("SYNC_MAILBOX_WORKERS", "4"))
+
+# Matches the UID item in a FETCH response line, e.g. b'12 (UID 4821 RFC822 {5120}'
+FETCH_UID_PATTERN = re.compile(rb"UID (\d+)")
+
+# Matches items in a STATUS response, e.g. b'"INBOX" (UIDVALIDITY 3 UIDNEXT 4822 HIGHESTMODSEQ 90211)'
+STATUS_ITEM_PATTERN = re.compile(rb"(UIDVALIDITY|UIDNEXT|HIGHESTMODSEQ) (\d+)")
+
 # Initialize Supabase client
 supabase: Client = create_client(supabase_url, supabase_key)
 
-# Initialize Email Triage Flow
-email_triage_flow = EmailTriageFlow()
+# Local index of already-imported gmail_ids (avoids downloading the emails table)
+dedup_index = DedupIndex(supabase, os.path.join(state_dir, "dedup_index.sqlite3"))
 
-def clean_email_address(addr):
-    """Clean and extract email address."""
-    if not addr:
-        return ""
-    
-    # Handle format like "Name <email@example.com>"
-    if '<' in addr and '>' in addr:
-        start = addr.find('<') + 1
-        end = addr.find('>')
-        return addr[start:end].strip()
-    return addr.strip()
+# Triaged emails waiting to be written to Supabase (survives database outages and crashes)
+email_spool = EmailSpool(os.path.join(state_dir, "spool.sqlite3"))
 
-def parse_email_addresses(addr_str):
-    """Parse email addresses from comma-separated string."""
-    if not addr_str:
-        return []
-    
-    return [clean_email_address(addr) for addr in addr_str.split(',') if addr.strip()]
+# Per-message progress of sync runs, so a crashed run resumes without re-triaging
+sync_journal = SyncJournal(os.path.join(state_dir, "journal.sqlite3"))
 
-def decode_email_content(part):
-    """Decode email content based on charset."""
-    content = part.get_payload(decode=True)
-    if not content:
-        return ""
-        
-    charset = part.get_content_charset()
-    
-    if charset:
-        try:
-            return content.decode(charset)
-        except:
-            try:
-                return content.decode('latin1')  # Fallback encoding
-            except:
-                return ""  # If all decoding fails
-    else:
-        try:
-            return content.decode('utf-8')
-        except:
-            try:
-                return content.decode('latin1')  # Fallback encoding
-            except:
-                return ""  # If all decoding fails
-
-def get_email_body(msg):
-    """Extract email body from a message object."""
-    if msg.is_multipart():
-        # If multipart, find the text part
-        text_parts = []
-        for part in msg.walk():
-            content_type = part.get_content_type()
-            content_disposition = str(part.get("Content-Disposition"))
-
-            # Skip attachments
-            if "attachment" in content_disposition:
-                continue
-            
-            # Look for text/plain parts
-            if content_type == "text/plain":
-                try:
-                    text_parts.append(decode_email_content(part))
-                except:
-                    continue
-        
-        # Join all text parts
-        return "\n".join(text_parts)
-    else:
-        # Not multipart - return the payload directly
-        try:
-            return decode_email_content(msg)
-        except:
-            return ""
+# LLM triage decisions of repeated sender + subject templates, kept across runs
+triage_cache = TriageCache(
+    os.path.join(state_dir, "triage_cache.sqlite3"),
+    max_entries=int(os.environ.get("TRIAGE_CACHE_SIZE", str(DEFAULT_TRIAGE_CACHE_SIZE))),
+    ttl_days=float(os.environ.get("TRIAGE_CACHE_TTL_DAYS", str(DEFAULT_TRIAGE_CACHE_TTL_DAYS)))
+)
+use_triage_cache = DEFAULT_TRIAGE_CACHE
+
+# Per-sender and per-domain triage history kept in Supabase
+sender_reputation = SenderReputation(supabase)
+use_sender_reputation = DEFAULT_SENDER_REPUTATION
+atexit.register(sender_reputation.flush_savings)
+
+# Local triage classifier (None without a trained model)
+local_classifier = load_classifier(
+    triage_model_path,
+    threshold=float(os.environ["TRIAGE_CLASSIFIER_THRESHOLD"]) if os.environ.get("TRIAGE_CLASSIFIER_THRESHOLD") else None
+) if DEFAULT_TRIAGE_CLASSIFIER else None
+use_local_classifier = DEFAULT_TRIAGE_CLASSIFIER
+
+# Raw copies of fetched messages, for replay without IMAP (None when disabled)
+raw_archive = RawArchive(raw_archive_dir) if raw_archive_dir else None
+
+# Background attachment indexing (None when disabled); finishes queued messages at exit
+attachment_indexer = AttachmentIndexer(supabase) if DEFAULT_INDEX_ATTACHMENTS else None
+if attachment_indexer is not None:
+    atexit.register(attachment_indexer.close)
+
+# LLM quota shared by all triage workers (0 disables a limit)
+triage_rate_limiter = RateLimiter(
+    requests_per_minute=int(os.environ.get("TRIAGE_REQUESTS_PER_MINUTE", "60")),
+    tokens_per_minute=int(os.environ.get("TRIAGE_TOKENS_PER_MINUTE", "100000"))
+)
+
+# Latest triage decision per thread: thread_id -> (normalized subject, category, reasoning)
+thread_reuse = DEFAULT_THREAD_REUSE
+_thread_decisions = OrderedDict()
+_thread_decisions_lock = threading.Lock()
+
+# Idle Email Triage Flows. Each worker borrows its own flow so no two
+# concurrent triages share flow state; flows are kept for reuse.
+_triage_flows = queue.LifoQueue()
+_triage_flows.put(EmailTriageFlow(rate_limiter=triage_rate_limiter, triage_cache=triage_cache,
+                                  sender_reputation=sender_reputation, classifier=local_classifier))
 
 def get_last_sync_time():
     """Get the last sync time from the sync_status table."""
@@ -141,6 +230,85 @@ def update_last_sync_time():
     except Exception as e:
         print(f"Error updating last sync time: {e}")
 
+def get_sync_checkpoint(mailbox):
+    """
+    Get the UID checkpoint for a mailbox from the sync_checkpoints table.
+
+    Returns a fresh checkpoint (no UIDVALIDITY, last_uid 0) if none is stored
+    yet, which makes the next fetch fall back to a date-based search.
+    """
+    checkpoint = {"mailbox": mailbox, "uidvalidity": None, "last_uid": 0, "highest_modseq": None}
+    try:
+        response = supabase.table("sync_checkpoints").select("*").eq("mailbox", mailbox).execute()
+        if response.data and len(response.data) > 0:
+            row = response.data[0]
+            checkpoint["uidvalidity"] = row.get("uidvalidity")
+            checkpoint["last_uid"] = row.get("last_uid") or 0
+            checkpoint["highest_modseq"] = row.get("highest_modseq")
+    except Exception as e:
+        print(f"Error getting sync checkpoint for {mailbox}: {e}")
+    return checkpoint
+
+def update_sync_checkpoint(checkpoint):
+    """Persist a mailbox UID checkpoint to the sync_checkpoints table."""
+    if checkpoint.get("uidvalidity") is None:
+        return
+    try:
+        supabase.table("sync_checkpoints").upsert({
+            "mailbox": checkpoint["mailbox"],
+            "uidvalidity": checkpoint["uidvalidity"],
+            "last_uid": checkpoint["last_uid"],
+            "highest_modseq": checkpoint.get("highest_modseq"),
+            "updated_at": datetime.now().isoformat()
+        }, on_conflict="mailbox").execute()
+    except Exception as e:
+        print(f"Error updating sync checkpoint for {checkpoint['mailbox']}: {e}")
+
+def record_failed_uids(checkpoint, uids):
+    """Remember the lowest UID of `uids` that could not be fetched, so the checkpoint stays below it."""
+    if checkpoint is None or not uids:
+        return
+    lowest = min(int(uid) for uid in uids)
+    if checkpoint.get("failed_uid") is None or lowest < checkpoint["failed_uid"]:
+        checkpoint["failed_uid"] = lowest
+
+def advance_checkpoint(checkpoint, uid):
+    """
+    Move a checkpoint's last_uid up to `uid`.
+    
+    It never moves past a UID recorded by record_failed_uids, so the next
+    run fetches that UID (and the ones after it) again.
+    """
+    last_uid = max(checkpoint.get("last_uid") or 0, uid)
+    if checkpoint.get("failed_uid") is not None:
+        last_uid = min(last_uid, checkpoint["failed_uid"] - 1)
+    checkpoint["last_uid"] = max(checkpoint.get("last_uid") or 0, last_uid)
+
+def get_mailbox_state(mail, mailbox="INBOX"):
+    """
+    Get UIDVALIDITY, UIDNEXT and (with CONDSTORE) HIGHESTMODSEQ for a mailbox.
+
+    Must be called before the mailbox is selected.
+    """
+    items = "UIDVALIDITY UIDNEXT"
+    if "CONDSTORE" in mail.capabilities:
+        items += " HIGHESTMODSEQ"
+    status, data = mail.status(mailbox, f"({items})")
+    if status != 'OK' or not data or not data[0]:
+        return {}
+    return {
+        key.decode().lower(): int(value)
+        for key, value in STATUS_ITEM_PATTERN.findall(data[0])
+    }
+
+def get_selected_uidvalidity(mail):
+    """UIDVALIDITY the server reported when the current mailbox was selected (None if it did not)."""
+    _, data = mail.response("UIDVALIDITY")
+    try:
+        return int(data[-1])
+    except (TypeError, ValueError, IndexError):
+        return None
+
 def check_email_exists(gmail_id):
     """Check if an email with the given Gmail ID already exists in the database."""
     try:
@@ -150,10 +318,19 @@ def check_email_exists(gmail_id):
         print(f"Error checking if email exists: {e}")
         return False
 
-def triage_email(subject, body, sender):
+def triage_email(subject, body, sender, thread_lookup=None, use_cache=True, use_reputation=True,
+                 use_classifier=True):
     """
     Triage an email using the CrewAI agent
     
+    If given, `thread_lookup` is called (only when the agent's rules do not
+    decide) for the (category, reasoning) of an earlier email in the same
+    thread, or None; the agent uses that decision instead of the LLM. With `use_cache` the triage cache may answer for
+    a repeated sender and subject template before the LLM is asked, and with
+    `use_reputation` the sender's triage history may (store_emails adds
+    the LLM's decision to it). With `use_classifier` the local classifier
+    may answer when it is confident.
+    
     Returns: 
         tuple: (category, reasoning)
     """
@@ -164,16 +341,24 @@ def triage_email(subject, body, sender):
     print(f"Body: {body[:500]}... (truncated)")
     print(f"===================================\n")
     
+    # Borrow a flow of our own so concurrent triages don't share state
+    try:
+        email_triage_flow = _triage_flows.get_nowait()
+    except queue.Empty:
+        email_triage_flow = EmailTriageFlow(rate_limiter=triage_rate_limiter, triage_cache=triage_cache,
+                                            sender_reputation=sender_reputation, classifier=local_classifier)
+    
     # Reset the flow state for a new email
     email_triage_flow.state.email_subject = subject
     email_triage_flow.state.email_body = body
     email_triage_flow.state.email_sender = sender
+    email_triage_flow.thread_lookup = thread_lookup
+    email_triage_flow.state.use_cache = use_cache
+    email_triage_flow.state.use_reputation = use_reputation
+    email_triage_flow.state.use_classifier = use_classifier
     
     # Run the triage flow
     try:
-        # Add a small delay to prevent rate limiting with OpenAI
-        time.sleep(random.uniform(0.5, 2.0))
-        
         category = email_triage_flow.kickoff()
         reasoning = email_triage_flow.state.triage_reasoning
         
@@ -194,15 +379,483 @@ def triage_email(subject, body, sender):
         print(f"Error during email triage: {e}")
         # Default to 'notify' if triage fails
         return "notify", f"Triage failed with error: {str(e)}"
+    finally:
+        email_triage_flow.thread_lookup = None
+        _triage_flows.put(email_triage_flow)
 
-def fetch_emails(limit=None, unread_only=True, reprocess_all=False):
-    """Fetch emails from Gmail via IMAP."""
-    emails = []
+def pretriage_email(subject, sender):
+    """
+    Run the header-only rules on an email.
     
+    Returns:
+        tuple: (category, reasoning), or (None, None) if the body is needed
+    """
+    try:
+        email_triage_flow = _triage_flows.get_nowait()
+    except queue.Empty:
+        email_triage_flow = EmailTriageFlow(rate_limiter=triage_rate_limiter, triage_cache=triage_cache,
+                                            sender_reputation=sender_reputation, classifier=local_classifier)
     try:
-        # Connect to Gmail
-        mail = imaplib.IMAP4_SSL("imap.gmail.com")
-        mail.login(gmail_email, gmail_password)
+        return email_triage_flow.triage_agent.triage_headers(subject, sender)
+    finally:
+        _triage_flows.put(email_triage_flow)
+
+def remember_thread_decision(email_obj):
+    """Record an email's triage decision as the latest one for its thread."""
+    thread_id = email_obj.get("thread_id")
+    if not thread_id or not email_obj.get("category"):
+        return
+    with _thread_decisions_lock:
+        _thread_decisions[thread_id] = (
+            normalize_subject(email_obj["subject"]), email_obj["category"], email_obj["triage_reasoning"]
+        )
+        _thread_decisions.move_to_end(thread_id)
+        while len(_thread_decisions) > THREAD_CACHE_SIZE:
+            _thread_decisions.popitem(last=False)
+
+def get_thread_decision(email_obj):
+    """
+    Find the decision to reuse for an obvious follow-up in an already triaged thread.
+    
+    An obvious follow-up is a reply (its thread is named after another
+    message) whose subject, without Re:/Fwd: prefixes, matches the thread's
+    latest triaged email. Decisions come from this process first, then from
+    the latest stored row of the thread (an indexed lookup on thread_id).
+    
+    Returns:
+        tuple: (category, reasoning), or None to triage the email from scratch
+    """
+    thread_id = email_obj.get("thread_id")
+    if not thread_reuse or email_obj.get("reprocessed") or not thread_id or thread_id == email_obj["gmail_id"]:
+        return None
+    
+    with _thread_decisions_lock:
+        decision = _thread_decisions.get(thread_id)
+    
+    if decision is None:
+        try:
+            response = supabase.table("emails").select(
+                "subject, category, triage_reasoning"
+            ).eq("thread_id", thread_id).order("received_date", desc=True).limit(1).execute()
+        except Exception as e:
+            print(f"Error looking up thread {thread_id}: {e}")
+            return None
+        if not response.data or not response.data[0].get("category"):
+            return None
+        row = response.data[0]
+        decision = (normalize_subject(row.get("subject")), row["category"], row.get("triage_reasoning") or "")
+    
+    subject, category, reasoning = decision
+    if subject != normalize_subject(email_obj["subject"]):
+        return None
+    return category, reasoning
+
+def triage_email_obj(email_obj):
+    """Triage a fetched email dictionary in place and return it (emails pre-triaged on headers are kept)."""
+    if not email_obj.get("category"):
+        category, reasoning = triage_email(
+            email_obj["subject"], email_obj["body"], email_obj["sender"],
+            # Looked up only if the rules do not decide (it may query Supabase)
+            thread_lookup=lambda: get_thread_decision(email_obj),
+            # Reprocessing exists to re-ask the LLM, so it never reads the cache
+            use_cache=use_triage_cache and not email_obj.get("reprocessed"),
+            use_reputation=use_sender_reputation and not email_obj.get("reprocessed"),
+            use_classifier=use_local_classifier and not email_obj.get("reprocessed")
+        )
+        email_obj["category"] = category
+        email_obj["triage_reasoning"] = reasoning
+    remember_thread_decision(email_obj)
+    if email_obj.get("uid") is not None and not email_obj.get("reprocessed"):
+        # Only messages journaled by iter_emails are updated
+        sync_journal.record_triaged(email_obj["gmail_id"], email_obj["category"], email_obj["triage_reasoning"])
+    return email_obj
+
+def bounded_map(executor, fn, items, max_pending):
+    """
+    Like executor.map, but consumes `items` lazily.
+    
+    At most `max_pending` calls are in flight at once and results are yielded
+    in input order, so a long generator is never read ahead of the consumer.
+    """
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def triage_stream(emails, workers=DEFAULT_TRIAGE_WORKERS):
+    """
+    Triage a stream of fetched emails with up to `workers` concurrent triages.
+    
+    Emails come out in the order they went in. LLM calls are throttled by the
+    shared rate limiter; emails the rule engine decides are not.
+    """
+    if workers <= 1:
+        for email_obj in emails:
+            yield triage_email_obj(email_obj)
+        return
+    
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="triage") as executor:
+        yield from bounded_map(executor, triage_email_obj, emails, max_pending=workers * 2)
+
+def get_default_account():
+    """The single account configured through GMAIL_EMAIL / IMAP_* variables."""
+    return {
+        "name": "default",
+        "email": gmail_email,
+        "password": gmail_password,
+        "host": imap_host,
+        "port": imap_port,
+        "ssl": imap_ssl,
+        "folders": ["INBOX"]
+    }
+
+def load_accounts(path=None):
+    """
+    Load the accounts and folders to sync.
+    
+    Without a config file this is just the default account's INBOX. A config
+    file is JSON of the form:
+    
+        {
+            "max_connections_per_server": 10,
+            "accounts": [
+                {"name": "aaron", "email": "aaron@example.com", "password_env": "AARON_APP_PASSWORD",
+                 "host": "imap.gmail.com", "folders": ["INBOX", "Clients"]}
+            ]
+        }
+    
+    where each account may give "password" directly or the name of an
+    environment variable in "password_env".
+    
+    Returns:
+        tuple: (accounts, max_connections_per_server)
+    """
+    path = path or sync_accounts_file
+    if not path:
+        return [get_default_account()], DEFAULT_MAX_CONNECTIONS_PER_SERVER
+    
+    with open(path) as f:
+        config = json.load(f)
+    
+    accounts = []
+    for entry in config.get("accounts", []):
+        password = entry.get("password")
+        if not password and entry.get("password_env"):
+            password = os.environ.get(entry["password_env"])
+        accounts.append({
+            "name": entry.get("name", entry["email"]),
+            "email": entry["email"],
+            "password": password,
+            "host": entry.get("host", imap_host),
+            "port": int(entry.get("port", imap_port)),
+            "ssl": entry.get("ssl", imap_ssl),
+            "folders": entry.get("folders", ["INBOX"])
+        })
+    return accounts, config.get("max_connections_per_server", DEFAULT_MAX_CONNECTIONS_PER_SERVER)
+
+def get_checkpoint_key(account, mailbox):
+    """Checkpoint key for one folder of one account (the default account keeps plain folder keys)."""
+    if account.get("name") == "default":
+        return mailbox
+    return f"{account['email']}/{mailbox}"
+
+def quote_mailbox(mailbox):
+    """Quote a mailbox name for IMAP commands if it contains spaces or specials."""
+    if mailbox.startswith('"') or not re.search(r'[\s"()\[\]{}%*\\]', mailbox):
+        return mailbox
+    return '"' + mailbox.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def connect_imap(account=None):
+    """Open an authenticated IMAP connection for an account (default: the env account)."""
+    account = account or get_default_account()
+    if account["ssl"]:
+        mail = imaplib.IMAP4_SSL(account["host"], account["port"])
+    else:
+        mail = imaplib.IMAP4(account["host"], account["port"])
+    mail.login(account["email"], account["password"])
+    return mail
+
+# Authenticated IMAP connections reused across mailboxes and sync cycles
+imap_pool = ImapConnectionPool(connect_imap, DEFAULT_MAX_CONNECTIONS_PER_SERVER)
+atexit.register(imap_pool.close_all)
+
+def iter_fetch_response(msg_data):
+    """
+    Yield (uid, raw_bytes, response_line) tuples from a multi-message FETCH response.
+
+    imaplib returns each message as a (header, literal) tuple followed by a
+    closing bytes item. Data items such as UID and INTERNALDATE usually appear
+    in the header, but some servers send them after the literal, so
+    `response_line` joins both parts and the UID is looked up in it.
+    """
+    line = None
+    raw = None
+    for item in msg_data:
+        if isinstance(item, tuple):
+            if raw is not None:
+                yield _fetch_uid(line), raw, line
+            line = item[0]
+            raw = item[1]
+        elif isinstance(item, bytes) and raw is not None:
+            line += b" " + item
+            yield _fetch_uid(line), raw, line
+            line = None
+            raw = None
+    if raw is not None:
+        yield _fetch_uid(line), raw, line
+
+def _fetch_uid(response_line):
+    """Extract the UID from a FETCH response line, or None if absent."""
+    match = FETCH_UID_PATTERN.search(response_line)
+    return match.group(1) if match else None
+
+def fetch_batch_full(mail, batch, metrics, count_total=True):
+    """
+    Fetch whole messages (BODY.PEEK[]) for a batch of UIDs.
+    
+    `count_total` is False when the messages' sizes were already counted
+    by fetch_batch_headers.
+    
+    Returns:
+        list: Dicts with uid, msg, arrived_at and body (None: parse from msg)
+    """
+    fetch_started = time.monotonic()
+    status, msg_data = mail.uid("fetch", b",".join(batch), "(INTERNALDATE BODY.PEEK[])")
+    metrics["fetch_seconds"] += time.monotonic() - fetch_started
+    
+    if status != 'OK':
+        print(f"Error fetching emails {batch[0].decode()}-{batch[-1].decode()}: {status}")
+        return []
+    
+    messages = []
+    for uid, raw_email, response_line in iter_fetch_response(msg_data):
+        if count_total:
+            metrics["bytes_total"] += len(raw_email)
+        metrics["bytes_downloaded"] += len(raw_email)
+        
+        # INTERNALDATE is when the server received the message (used for latency reporting)
+        internal_date = imaplib.Internaldate2tuple(response_line)
+        
+        messages.append({
+            "uid": uid,
+            "msg": email.message_from_bytes(raw_email),
+            "arrived_at": time.mktime(internal_date) if internal_date else None,
+            "body": None,
+            "raw": raw_email
+        })
+    return messages
+
+def fetch_batch_headers(mail, batch, metrics, bodystructure=True):
+    """
+    Fetch the headers the sync uses (and optionally BODYSTRUCTURE), but no body, for a batch of UIDs.
+    
+    Returns:
+        list: Dicts with uid, msg (headers only), arrived_at, size, header_size
+        and the text "parts" to download with fetch_text_parts (empty if the
+        FETCH failed or its response could not be parsed)
+    """
+    items = "UID INTERNALDATE RFC822.SIZE"
+    if bodystructure:
+        items += " BODYSTRUCTURE"
+    fetch_started = time.monotonic()
+    status, msg_data = mail.uid("fetch", b",".join(batch), f"({items} BODY.PEEK[HEADER.FIELDS ({HEADER_FIELDS})])")
+    metrics["fetch_seconds"] += time.monotonic() - fetch_started
+    
+    if status != 'OK':
+        print(f"Error fetching headers {batch[0].decode()}-{batch[-1].decode()}: {status}")
+        return []
+    
+    try:
+        items = parse_fetch_response(msg_data)
+    except ValueError as e:
+        print(f"Error parsing headers {batch[0].decode()}-{batch[-1].decode()}: {e}")
+        return []
+    
+    messages = []
+    for item in items:
+        header = get_section(item, f"HEADER.FIELDS ({HEADER_FIELDS})") or b""
+        size = item.get("RFC822.SIZE")
+        size = int(size) if isinstance(size, bytes) and size.isdigit() else len(header)
+        metrics["bytes_total"] += size
+        metrics["bytes_downloaded"] += len(header)
+        
+        internal_date = None
+        if isinstance(item.get("INTERNALDATE"), bytes):
+            internal_date = imaplib.Internaldate2tuple(b'INTERNALDATE "' + item["INTERNALDATE"] + b'"')
+        
+        messages.append({
+            "uid": item.get("UID"),
+            "msg": email.message_from_bytes(header),
+            "arrived_at": time.mktime(internal_date) if internal_date else None,
+            "size": size,
+            "header_size": len(header),
+            "parts": select_text_parts(parse_bodystructure(item.get("BODYSTRUCTURE"))) if bodystructure else [],
+            "body": None
+        })
+    return messages
+
+def fetch_text_parts(mail, messages, part_max_bytes, metrics):
+    """
+    Download the text parts chosen by fetch_batch_headers and set each message's "body".
+    
+    Messages needing the same sections share one FETCH, and each part is
+    cut at `part_max_bytes` with a partial fetch (BODY.PEEK[n]<0.max>).
+    
+    Returns:
+        list: Messages whose parts could not be downloaded (a failed or
+        unparsable FETCH, or a UID missing from its response), marked "failed"
+    """
+    groups = {}
+    failed = []
+    for message in messages:
+        message["body"] = ""
+        sections = tuple(part["section"] for part in message["parts"])
+        if sections and message["uid"]:
+            groups.setdefault(sections, []).append(message)
+    
+    for sections, group in groups.items():
+        items = " ".join(f"BODY.PEEK[{section}]<0.{part_max_bytes}>" for section in sections)
+        fetch_started = time.monotonic()
+        status, msg_data = mail.uid("fetch", b",".join(message["uid"] for message in group), f"(UID {items})")
+        metrics["fetch_seconds"] += time.monotonic() - fetch_started
+        
+        if status != 'OK':
+            print(f"Error fetching text parts {', '.join(sections)}: {status}")
+            failed.extend(group)
+            continue
+        
+        try:
+            items = parse_fetch_response(msg_data)
+        except ValueError as e:
+            print(f"Error parsing text parts {', '.join(sections)}: {e}")
+            failed.extend(group)
+            continue
+        
+        by_uid = {message["uid"]: message for message in group}
+        for item in items:
+            message = by_uid.pop(item.get("UID"), None)
+            if message is None:
+                continue
+            texts = []
+            for part in message["parts"]:
+                data = get_section(item, part["section"]) or b""
+                metrics["bytes_downloaded"] += len(data)
+                text = decode_part(data, part)
+                texts.append(html_to_text(text) if part["subtype"] == "html" else text)
+            message["body"] = "\n".join(texts)
+        failed.extend(by_uid.values())
+    
+    for message in failed:
+        message["failed"] = True
+    return failed
+
+def fetch_full_bodies(mail, messages, metrics):
+    """
+    Download whole messages for entries from fetch_batch_headers, replacing their header-only msg.
+    
+    Returns:
+        list: Messages that were not downloaded (a failed FETCH, or a UID
+        missing from its response), marked "failed"
+    """
+    uids = [message["uid"] for message in messages if message["uid"]]
+    if not uids:
+        return []
+    by_uid = {message["uid"]: message for message in messages if message["uid"]}
+    for fetched in fetch_batch_full(mail, uids, metrics, count_total=False):
+        message = by_uid.pop(fetched["uid"], None)
+        if message is not None:
+            message["msg"] = fetched["msg"]
+            message["raw"] = fetched["raw"]
+    
+    failed = list(by_uid.values())
+    for message in failed:
+        message["failed"] = True
+    return failed
+
+def format_bytes(count):
+    """Format a byte count for log output."""
+    for unit in ("B", "KB", "MB"):
+        if abs(count) < 1024:
+            return f"{count:.1f} {unit}" if unit != "B" else f"{count} B"
+        count /= 1024
+    return f"{count:.1f} GB"
+
+def get_search_criteria(unread_only=True, reprocess_all=False):
+    """IMAP SEARCH criteria for a sync without a UID checkpoint."""
+    # If reprocessing all emails, look for all emails in a reasonable timeframe
+    if reprocess_all:
+        one_year_ago = (datetime.now() - timedelta(days=365)).strftime("%d-%b-%Y")
+        return f'SINCE "{one_year_ago}"'
+    if unread_only:
+        return 'UNSEEN'
+    # A more flexible search that gets emails from the last 90 days
+    ninety_days_ago = (datetime.now() - timedelta(days=90)).strftime("%d-%b-%Y")
+    return f'SINCE "{ninety_days_ago}"'
+
+def iter_emails(limit=None, unread_only=True, reprocess_all=False, batch_size=DEFAULT_FETCH_BATCH_SIZE,
+                checkpoint=None, account=None, mailbox="INBOX", metrics=None,
+                fetch_mode=DEFAULT_FETCH_MODE, part_max_bytes=DEFAULT_PART_MAX_BYTES,
+                header_pretriage=DEFAULT_HEADER_PRETRIAGE, uids=None, label_suffix=""):
+    """
+    Fetch emails from Gmail via IMAP and yield them one at a time, untriaged.
+
+    Messages are fetched by UID in chunks of `batch_size` per FETCH command,
+    so an import costs one round trip per batch instead of one per message.
+    A batch size of 1 reproduces the old per-message behaviour. Only one
+    FETCH batch is held in memory at a time.
+
+    If a `checkpoint` (see get_sync_checkpoint) is given, only messages with a
+    UID above the checkpoint's last_uid are fetched, regardless of their
+    \\Seen flag. Each email carries its "uid", and checkpoint["scanned_uid"]
+    tracks the highest UID handled (yielded, or skipped as a duplicate), so
+    run_pipeline can advance the checkpoint as emails are stored. UIDs a
+    FETCH failed to return are recorded in checkpoint["failed_uid"] (the
+    lowest one), and neither scanned_uid nor last_uid moves past it, so
+    nothing is missed: the next run fetches it again. A `limit` takes the
+    oldest UIDs above the checkpoint rather than the newest.
+    
+    `account` (default: the env account) and `mailbox` select what to read;
+    the connection comes from the shared pool. If a `metrics` dict is given,
+    "fetched", "fetch_seconds", "bytes_total" (full message sizes) and
+    "bytes_downloaded" are added to it.
+    
+    With `fetch_mode="parts"`, each batch first fetches headers and
+    BODYSTRUCTURE; text parts are then downloaded (capped at
+    `part_max_bytes` each) only for messages that are not duplicates, and
+    attachments are never transferred.
+    
+    If the raw archive is enabled, the raw bytes of every message processed
+    in full mode are archived (parts mode never downloads whole messages).
+    
+    With `header_pretriage`, each batch first fetches only the header fields
+    and runs the header-only triage rules (EmailTriageAgent.triage_headers).
+    Emails they ignore are yielded already categorized, with an empty body
+    that is never downloaded; "pretriage_candidates", "pretriaged" and
+    "pretriage_bytes_avoided" are added to `metrics`.
+    
+    If `uids` is given, exactly those UIDs are fetched without a search (see
+    iter_emails_parallel); `label_suffix` tells their log lines apart and is
+    never part of what is stored.
+    """
+    batch_size = max(1, batch_size or 1)
+    metrics = metrics if metrics is not None else {}
+    for key in FETCH_METRICS:
+        metrics.setdefault(key, 0)
+    two_phase = fetch_mode == "parts" or header_pretriage
+    account = account or get_default_account()
+    # Archive, journal and checkpoint entries are keyed on the mailbox alone;
+    # the UID range suffix of parallel imports only goes into log lines
+    mailbox_label = f"{account['name']}/{mailbox}"
+    log_label = mailbox_label + label_suffix
+    mail = None
+    failed = False
+    
+    try:
+        # Connect to Gmail (reusing a pooled connection if there is one)
+        mail = imap_pool.acquire(account)
         
         # Force a connection reset to refresh IMAP status
         try:
@@ -210,254 +863,1166 @@ def fetch_emails(limit=None, unread_only=True, reprocess_all=False):
         except:
             pass
             
-        mail.select("INBOX")  # Select inbox or another mailbox
+        # Read UIDVALIDITY/UIDNEXT before selecting so incremental syncs can skip work
+        mailbox_state = get_mailbox_state(mail, quote_mailbox(mailbox)) if checkpoint is not None else {}
         
-        # Prepare search criteria - CRITICAL CHANGE: JUST USE 'UNSEEN' with no date filter
-        if unread_only:
-            search_criteria = 'UNSEEN'
-        else:
-            # A more flexible search that gets emails from the last 90 days
-            ninety_days_ago = (datetime.now() - timedelta(days=90)).strftime("%d-%b-%Y")
-            search_criteria = f'SINCE "{ninety_days_ago}"'
-            
-        # If reprocessing all emails, look for all emails in a reasonable timeframe
-        if reprocess_all:
-            one_year_ago = (datetime.now() - timedelta(days=365)).strftime("%d-%b-%Y")
-            search_criteria = f'SINCE "{one_year_ago}"'
+        status, _ = mail.select(quote_mailbox(mailbox))  # Select inbox or another mailbox
+        if status != 'OK':
+            print(f"[{log_label}] Could not select mailbox: {status}")
+            return
         
-        print(f"Using search criteria: {search_criteria}")
+        # UIDs (journal entries, generated message IDs) only mean something under this UIDVALIDITY
+        selected_uidvalidity = get_selected_uidvalidity(mail)
         
-        # Search for emails
-        status, email_ids = mail.search(None, search_criteria)
-        if status != 'OK':
-            print(f"Error searching for emails: {status}")
-            return emails
+        if uids is not None:
+            # The UIDs were already searched for (parallel import ranges)
+            email_id_list = list(uids)
+        else:
+            # Prepare search criteria - CRITICAL CHANGE: JUST USE 'UNSEEN' with no date filter
+            if checkpoint is not None:
+                uidvalidity = mailbox_state.get("uidvalidity")
+                if uidvalidity is not None and uidvalidity == checkpoint.get("uidvalidity"):
+                    # Nothing new since the checkpoint: skip the search entirely
+                    last_uid = checkpoint.get("last_uid") or 0
+                    if mailbox_state.get("uidnext") and mailbox_state["uidnext"] <= last_uid + 1:
+                        print(f"[{log_label}] No new messages since UID {last_uid}")
+                        checkpoint["highest_modseq"] = mailbox_state.get("highestmodseq", checkpoint.get("highest_modseq"))
+                        mail.close()
+                        return
+                    search_criteria = f'UID {last_uid + 1}:*'
+                else:
+                    # First run or UIDVALIDITY changed: UIDs are meaningless, fall back to the last sync time
+                    if checkpoint.get("uidvalidity") is not None:
+                        print(f"[{log_label}] UIDVALIDITY changed ({checkpoint['uidvalidity']} -> {uidvalidity}), resetting checkpoint")
+                    since = get_last_sync_time().strftime("%d-%b-%Y")
+                    search_criteria = f'SINCE "{since}"'
+                    checkpoint["uidvalidity"] = uidvalidity
+                    checkpoint["last_uid"] = 0
+                checkpoint["highest_modseq"] = mailbox_state.get("highestmodseq")
+                if reprocess_all:
+                    # Reprocessing always looks back a year, whatever the checkpoint
+                    search_criteria = get_search_criteria(reprocess_all=True)
+            else:
+                search_criteria = get_search_criteria(unread_only, reprocess_all)
             
-        email_id_list = email_ids[0].split()
+            print(f"[{log_label}] Using search criteria: {search_criteria}")
+            
+            # Search for emails by UID so batches can be fetched with UID sets
+            status, email_ids = mail.uid("search", None, search_criteria)
+            if status != 'OK':
+                print(f"[{log_label}] Error searching for emails: {status}")
+                return
+                
+            email_id_list = email_ids[0].split()
+            
+            # "UID n:*" always matches the highest UID, even when it is below n
+            if checkpoint is not None and checkpoint.get("last_uid"):
+                email_id_list = [uid for uid in email_id_list if int(uid) > checkpoint["last_uid"]]
+            
+            # Without a checkpoint, pick up what an interrupted run left behind (checkpointed
+            # runs re-read everything above the checkpoint anyway)
+            if checkpoint is None and not reprocess_all:
+                email_id_list = add_unfinished_uids(email_id_list, mailbox_label, selected_uidvalidity)
         
         # Check if any emails were found
         if not email_id_list:
-            print("No emails found matching the criteria.")
-            return emails
+            print(f"[{log_label}] No emails found matching the criteria.")
+            return
         
         # Apply limit if specified
         if limit and limit < len(email_id_list):
-            email_id_list = email_id_list[-limit:]  # Get most recent emails
+            if checkpoint is not None:
+                # The oldest ones, so the checkpoint does not skip past the rest
+                email_id_list = email_id_list[:limit]
+            else:
+                email_id_list = email_id_list[-limit:]  # Get most recent emails
         
-        print(f"Found {len(email_id_list)} emails to process")
+        print(f"[{log_label}] Found {len(email_id_list)} emails to process")
         
-        # Get list of existing email IDs from the database
-        existing_emails = set()
-        try:
-            response = supabase.table("emails").select("gmail_id").execute()
-            if response.data:
-                existing_emails = set(item["gmail_id"] for item in response.data)
-                print(f"Found {len(existing_emails)} existing emails in database")
-        except Exception as e:
-            print(f"Error fetching existing emails: {e}")
+        # Throughput counters (fetch time excludes triage so batch sizes can be compared)
+        fetched_before = metrics["fetched"]
+        fetch_seconds_before = metrics["fetch_seconds"]
+        started_at = time.monotonic()
         
-        # Process each email
-        for i, email_id in enumerate(email_id_list):
-            print(f"Fetching email {i+1}/{len(email_id_list)} (ID: {email_id})")
-            status, msg_data = mail.fetch(email_id, "(RFC822)")
+        # Process emails one FETCH batch at a time
+        for batch_start in range(0, len(email_id_list), batch_size):
+            batch = email_id_list[batch_start:batch_start + batch_size]
+            print(f"[{log_label}] Fetching emails {batch_start+1}-{batch_start+len(batch)}/{len(email_id_list)}")
             
-            if status != 'OK':
-                print(f"Error fetching email {email_id}: {status}")
-                continue
+            if two_phase:
+                batch_messages = fetch_batch_headers(mail, batch, metrics, bodystructure=fetch_mode == "parts")
+            else:
+                batch_messages = fetch_batch_full(mail, batch, metrics)
+            metrics["fetched"] += len(batch_messages)
+            
+            # A failed FETCH returns nothing; keep the checkpoint below whatever was not returned
+            returned = set(message["uid"] for message in batch_messages)
+            record_failed_uids(checkpoint, [uid for uid in batch if uid not in returned])
+            
+            for message in batch_messages:
+                message["message_id"] = get_message_id(message["msg"], message["uid"] or batch[0],
+                                                       scope=f"{mailbox_label}/{selected_uidvalidity}")
+            
+            # Check the whole batch against the dedup index in one go
+            existing_emails = dedup_index.filter_existing(message["message_id"] for message in batch_messages)
+            
+            # Journal the new messages, and reuse decisions an interrupted run already paid for
+            journal_decisions = {}
+            sync_journal.record_stored(existing_emails)  # Finished by another run
+            if not reprocess_all:
+                new_messages = [message for message in batch_messages if message["message_id"] not in existing_emails]
+                sync_journal.record_fetched(mailbox_label, [(message["message_id"], message["uid"]) for message in new_messages],
+                                            uidvalidity=selected_uidvalidity)
+                journal_decisions = sync_journal.get_decisions(message["message_id"] for message in new_messages)
+            
+            # Download bodies only for the messages that will be processed
+            if two_phase:
+                needed = [message for message in batch_messages
+                          if reprocess_all or message["message_id"] not in existing_emails]
+                
+                # Settle what the header rules can, and leave those bodies on the server
+                if header_pretriage:
+                    metrics["pretriage_candidates"] += len(needed)
+                    for message in needed:
+                        message["category"], message["triage_reasoning"] = pretriage_email(
+                            decode_subject(message["msg"]), message["msg"].get("From", "")
+                        )
+                        if message["category"]:
+                            message["body"] = ""
+                            metrics["pretriaged"] += 1
+                            metrics["pretriage_bytes_avoided"] += message["size"] - message["header_size"]
+                    needed = [message for message in needed if not message["category"]]
+                
+                if fetch_mode == "parts":
+                    failed_messages = fetch_text_parts(mail, needed, part_max_bytes, metrics)
+                else:
+                    failed_messages = fetch_full_bodies(mail, needed, metrics)
+                if failed_messages:
+                    print(f"[{log_label}] Could not download {len(failed_messages)} bodies, leaving them for the next run")
+                    record_failed_uids(checkpoint, [message["uid"] for message in failed_messages])
+            
+            for message in batch_messages:
+                uid = message["uid"]
+                msg = message["msg"]
+                message_id = message["message_id"]
+                arrived_at = message["arrived_at"]
+                
+                # Skip if already in database (unless reprocessing)
+                if not reprocess_all and message_id in existing_emails:
+                    print(f"Skipping already imported email: {decode_subject(msg)[:50]}...")
+                    mark_scanned(checkpoint, uid)
+                    continue
+                
+                # Never triage or store a message without its body; it stays journaled as fetched
+                if message.get("failed"):
+                    continue
                 
-            for response in msg_data:
-                if isinstance(response, tuple):
-                    msg = email.message_from_bytes(response[1])
-                    
-                    # Get subject
-                    subject = ""
-                    subject_header = decode_header(msg.get("Subject", ""))
-                    for part, encoding in subject_header:
-                        if isinstance(part, bytes):
-                            if encoding:
-                                try:
-                                    subject += part.decode(encoding)
-                                except:
-                                    subject += part.decode('utf-8', errors='replace')
-                            else:
-                                subject += part.decode('utf-8', errors='replace')
-                        else:
-                            subject += str(part)
-                    
-                    # Get sender and recipients
-                    sender = msg.get("From", "")
-                    to = msg.get("To", "")
-                    cc = msg.get("Cc", "")
-                    bcc = msg.get("Bcc", "")
-                    
-                    # Get message ID
-                    message_id = msg.get("Message-ID", "")
-                    if not message_id:
-                        # Generate a unique ID if none exists
-                        message_id = f"generated-{email_id.decode()}-{time.time()}"
-                    
-                    # Ensure message_id is a string
-                    if isinstance(message_id, bytes):
-                        message_id = message_id.decode()
-                    
-                    # Clean < and > from message_id
-                    message_id = message_id.strip("<>")
-                    
-                    # Skip if already in database (unless reprocessing)
-                    if not reprocess_all and message_id in existing_emails:
-                        print(f"Skipping already imported email: {subject[:50]}...")
-                        continue
-                    
-                    # Get date
-                    date_str = msg.get("Date", "")
+                # Keep the raw message so it can be re-parsed without IMAP
+                raw_email = message.pop("raw", None)
+                if raw_archive is not None and raw_email is not None:
                     try:
-                        date = email.utils.parsedate_to_datetime(date_str)
-                    except:
-                        date = datetime.now()  # Fallback to current time
-                    
-                    # Get body
-                    body = get_email_body(msg)
-                    
-                    # Triage the email using CrewAI
-                    triage_category, triage_reasoning = triage_email(subject, body, sender)
-                    
-                    # Create email object with triage information
-                    email_obj = {
-                        "gmail_id": message_id,
-                        "subject": subject,
-                        "sender": sender,
-                        "recipient": parse_email_addresses(to),
-                        "cc": parse_email_addresses(cc),
-                        "bcc": parse_email_addresses(bcc),
-                        "body": body,
-                        "date": date.isoformat(),
-                        "category": triage_category,  # Add triage category
-                        "triage_reasoning": triage_reasoning,  # Add triage reasoning
-                        "reprocessed": message_id in existing_emails  # Flag for reprocessing
-                    }
-                    
-                    emails.append(email_obj)
-        
-        # Close connection
+                        raw_archive.put(raw_email, gmail_id=message_id, mailbox=mailbox_label,
+                                        uid=int(uid) if uid is not None else None, arrived_at=arrived_at)
+                    except Exception as e:
+                        print(f"Error archiving email {message_id}: {e}")
+                
+                # Attachments are hashed in the background (and written once the email is
+                # stored, see run_pipeline); parts mode never downloads them
+                if attachment_indexer is not None and raw_email is not None:
+                    attachment_indexer.submit(message_id, msg, len(raw_email))
+                
+                # Create email object (the body was already downloaded in parts mode);
+                # triage_stream fills in category and reasoning
+                email_obj = parse_email(msg, message_id, message["body"])
+                category, reasoning = journal_decisions.get(message_id, (None, None))
+                email_obj.update({
+                    "category": message.get("category") or category,  # Set by triage (or header pre-triage, or the journal)
+                    "triage_reasoning": message.get("triage_reasoning") or reasoning,  # Set with the category
+                    "reprocessed": message_id in existing_emails,  # Flag for reprocessing
+                    "uid": int(uid) if uid is not None else None,  # IMAP UID, not stored
+                    "arrived_at": arrived_at  # Server receive time (epoch seconds), not stored
+                })
+                
+                yield email_obj
+                # Only now handed on: an error before this point must not move the checkpoint past it
+                mark_scanned(checkpoint, uid)
+        
+        elapsed = time.monotonic() - started_at
+        fetched_count = metrics["fetched"] - fetched_before
+        fetch_seconds = metrics["fetch_seconds"] - fetch_seconds_before
+        if fetched_count:
+            fetch_rate = fetched_count / fetch_seconds if fetch_seconds > 0 else 0.0
+            overall_rate = fetched_count / elapsed if elapsed > 0 else 0.0
+            print(f"[{log_label}] Fetched {fetched_count} messages in {fetch_seconds:.2f}s of IMAP time "
+                  f"({fetch_rate:.1f} msg/s, batch size {batch_size}); "
+                  f"{overall_rate:.1f} msg/s overall including triage")
+            print(f"[{log_label}] Downloaded {format_bytes(metrics['bytes_downloaded'])} of "
+                  f"{format_bytes(metrics['bytes_total'])} ({fetch_mode} mode, "
+                  f"{format_bytes(metrics['bytes_total'] - metrics['bytes_downloaded'])} saved)")
+            if header_pretriage and metrics["pretriage_candidates"]:
+                print(f"[{log_label}] Header pre-triage settled {metrics['pretriaged']}/{metrics['pretriage_candidates']} "
+                      f"messages ({100.0 * metrics['pretriaged'] / metrics['pretriage_candidates']:.1f}%) "
+                      f"without a body download, avoiding {format_bytes(metrics['pretriage_bytes_avoided'])}")
+        
+        # Close the mailbox; the connection itself goes back to the pool
         mail.close()
-        mail.logout()
         
     except Exception as e:
-        print(f"Error fetching emails: {e}")
+        print(f"[{log_label}] Error fetching emails: {e}")
+        # Don't reuse a connection that may be mid-command
+        failed = True
+    finally:
+        if mail is not None:
+            imap_pool.release(mail, discard=failed)
+
+def mark_scanned(checkpoint, uid):
+    """
+    Record that a message was skipped as stored or handed on for storage.
+    
+    checkpoint["scanned_uid"] is how far the scan got; run_pipeline moves
+    last_uid up to it at the end of a run. It stays below the lowest UID
+    that failed to fetch, so it never covers a message that was not handled.
+    """
+    if checkpoint is None or uid is None:
+        return
+    uid = int(uid)
+    if checkpoint.get("failed_uid") is not None and uid >= checkpoint["failed_uid"]:
+        return
+    checkpoint["scanned_uid"] = max(checkpoint.get("scanned_uid") or 0, uid)
+
+def add_unfinished_uids(uid_list, mailbox_label, uidvalidity):
+    """Add the UIDs the journal says an earlier run fetched (under `uidvalidity`) but never stored to a search result."""
+    unfinished = sync_journal.get_unfinished(mailbox_label, uidvalidity)
+    if not unfinished:
+        return uid_list
+    found = set(int(uid) for uid in uid_list)
+    missing = [str(uid).encode() for uid in unfinished if uid not in found]
+    if not missing:
+        return uid_list
+    print(f"[{mailbox_label}] Resuming {len(missing)} emails left unfinished by an earlier run")
+    return sorted(uid_list + missing, key=int)
+
+def split_uid_ranges(uids, parts):
+    """Split a list of UIDs into up to `parts` contiguous ranges of (nearly) equal size."""
+    parts = max(1, min(parts, len(uids)))
+    size, extra = divmod(len(uids), parts)
+    ranges = []
+    start = 0
+    for index in range(parts):
+        end = start + size + (1 if index < extra else 0)
+        ranges.append(uids[start:end])
+        start = end
+    return ranges
+
+def iter_emails_parallel(connections, limit=None, unread_only=True, reprocess_all=False,
+                         batch_size=DEFAULT_FETCH_BATCH_SIZE, account=None, mailbox="INBOX", metrics=None,
+                         fetch_mode=DEFAULT_FETCH_MODE, part_max_bytes=DEFAULT_PART_MAX_BYTES,
+                         header_pretriage=DEFAULT_HEADER_PRETRIAGE):
+    """
+    Like iter_emails without a checkpoint, but fetching over several IMAP connections.
+    
+    The mailbox is searched once and the matching UIDs are split into
+    `connections` contiguous ranges. Each range is fetched by its own thread
+    over its own pooled connection (the pool's per-server cap still holds),
+    and the emails are merged through a bounded queue into one stream for
+    triage and store, in no particular order. Progress and an ETA are
+    printed every IMPORT_PROGRESS_SECONDS.
+    """
+    metrics = metrics if metrics is not None else {}
+    for key in FETCH_METRICS:
+        metrics.setdefault(key, 0)
+    account = account or get_default_account()
+    label = f"{account['name']}/{mailbox}"
+    
+    # One search for the whole mailbox
+    mail = None
+    failed = False
+    try:
+        mail = imap_pool.acquire(account)
+        status, _ = mail.select(quote_mailbox(mailbox), readonly=True)
+        if status != 'OK':
+            print(f"[{label}] Could not select mailbox: {status}")
+            return
+        
+        search_criteria = get_search_criteria(unread_only, reprocess_all)
+        print(f"[{label}] Using search criteria: {search_criteria}")
+        status, email_ids = mail.uid("search", None, search_criteria)
+        if status != 'OK':
+            print(f"[{label}] Error searching for emails: {status}")
+            return
+        uid_list = email_ids[0].split()
+        if not reprocess_all:
+            uid_list = add_unfinished_uids(uid_list, label, get_selected_uidvalidity(mail))
+        mail.close()
+    except Exception as e:
+        print(f"[{label}] Error searching for emails: {e}")
+        failed = True
+        return
+    finally:
+        if mail is not None:
+            imap_pool.release(mail, discard=failed)
+    
+    if not uid_list:
+        print(f"[{label}] No emails found matching the criteria.")
+        return
+    if limit and limit < len(uid_list):
+        uid_list = uid_list[-limit:]  # Get most recent emails
     
-    return emails
+    ranges = split_uid_ranges(uid_list, connections)
+    total = len(uid_list)
+    print(f"[{label}] Found {total} emails, fetching them over {len(ranges)} connections")
+    
+    output = queue.Queue(maxsize=batch_size * len(ranges))
+    stop = threading.Event()
+    range_done = object()
+    range_metrics = [{} for _ in ranges]
+    
+    def put(item):
+        # Give up if the consumer has gone away, instead of blocking forever
+        while not stop.is_set():
+            try:
+                output.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def fetch_range(index, uids):
+        try:
+            for email_obj in iter_emails(reprocess_all=reprocess_all, batch_size=batch_size, account=account,
+                                         mailbox=mailbox, metrics=range_metrics[index], fetch_mode=fetch_mode,
+                                         part_max_bytes=part_max_bytes, header_pretriage=header_pretriage,
+                                         uids=uids, label_suffix=f" range {index + 1}/{len(ranges)}"):
+                if not put(email_obj):
+                    return
+        finally:
+            put(range_done)
+    
+    threads = [
+        threading.Thread(target=fetch_range, args=(index, uids), name=f"import-range-{index + 1}", daemon=True)
+        for index, uids in enumerate(ranges)
+    ]
+    for thread in threads:
+        thread.start()
+    
+    started_at = time.monotonic()
+    last_report = started_at
+    running = len(threads)
+    try:
+        while running:
+            try:
+                item = output.get(timeout=IMPORT_PROGRESS_SECONDS)
+            except queue.Empty:
+                item = None
+            
+            now = time.monotonic()
+            if now - last_report >= IMPORT_PROGRESS_SECONDS:
+                last_report = now
+                fetched = sum(range_metric.get("fetched", 0) for range_metric in range_metrics)
+                rate = fetched / (now - started_at)
+                eta = f"{(total - fetched) / rate:.0f}s" if rate > 0 else "unknown"
+                print(f"[{label}] Progress: {fetched}/{total} fetched ({100.0 * fetched / total:.1f}%), "
+                      f"{rate:.1f} msg/s, ETA {eta}")
+            
+            if item is range_done:
+                running -= 1
+            elif item is not None:
+                yield item
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+        for range_metric in range_metrics:
+            for key, value in range_metric.items():
+                metrics[key] = metrics.get(key, 0) + value
 
-def store_emails(emails, reprocess_all=False):
-    """Store emails in Supabase."""
+def fetch_emails(limit=None, unread_only=True, reprocess_all=False, batch_size=DEFAULT_FETCH_BATCH_SIZE,
+                 checkpoint=None, triage_workers=DEFAULT_TRIAGE_WORKERS, account=None, mailbox="INBOX",
+                 fetch_mode=DEFAULT_FETCH_MODE, part_max_bytes=DEFAULT_PART_MAX_BYTES,
+                 header_pretriage=DEFAULT_HEADER_PRETRIAGE):
+    """Fetch and triage emails from Gmail via IMAP into a list (see iter_emails)."""
+    return list(triage_stream(
+        iter_emails(limit=limit, unread_only=unread_only, reprocess_all=reprocess_all,
+                    batch_size=batch_size, checkpoint=checkpoint, account=account, mailbox=mailbox,
+                    fetch_mode=fetch_mode, part_max_bytes=part_max_bytes, header_pretriage=header_pretriage),
+        workers=triage_workers
+    ))
+
+def write_email_rows(rows, write):
+    """
+    Write a batch of email rows with one request, bisecting on failure.
+    
+    If the batch request fails, it is split in half and each half retried,
+    so one bad row only costs O(log n) extra requests and the rest of the
+    batch is still written.
+    
+    Args:
+        rows: Row dictionaries
+        write: Function sending a list of rows and returning the response
+    
+    Returns:
+        tuple: (written, failures, requests)
+            written - set of gmail_ids returned by the database
+            failures - list of (row, error) for rows that could not be written
+            requests - number of HTTP requests made
+    """
+    try:
+        response = write(rows)
+        return set(item["gmail_id"] for item in response.data or []), [], 1
+    except Exception as e:
+        if len(rows) == 1:
+            return set(), [(rows[0], e)], 1
+        middle = len(rows) // 2
+        written_left, failures_left, requests_left = write_email_rows(rows[:middle], write)
+        written_right, failures_right, requests_right = write_email_rows(rows[middle:], write)
+        return (
+            written_left | written_right,
+            failures_left + failures_right,
+            1 + requests_left + requests_right
+        )
+
+def insert_email_rows(rows):
+    """
+    Insert a batch of new rows into the emails table.
+    
+    Rows whose gmail_id is already stored are left untouched (an upsert
+    that ignores duplicates), so they come back missing from `written`.
+    
+    Returns:
+        tuple: (written, failures, requests), as for write_email_rows
+    """
+    return write_email_rows(rows, lambda batch: supabase.table("emails").upsert(
+        batch, on_conflict="gmail_id", ignore_duplicates=True
+    ).execute())
+
+def update_email_rows(rows):
+    """
+    Update the triage fields of stored emails with the update_email_triage RPC.
+    
+    This is an UPDATE only: rows whose gmail_id is not in the table are not
+    created, and come back missing from `written`. Keys a row leaves out
+    (thread_id, subject, body, processing_status) keep their stored value.
+    
+    Returns:
+        tuple: (written, failures, requests), as for write_email_rows
+    """
+    return write_email_rows(rows, lambda batch: supabase.rpc(
+        "update_email_triage", {"updates": batch}
+    ).execute())
+
+def store_emails(emails, reprocess_all=False, batch_size=DEFAULT_STORE_BATCH_SIZE):
+    """
+    Store emails in Supabase.
+    
+    New emails are inserted with batched upserts that leave existing rows
+    alone, so a concurrent run that stored the same gmail_id first just turns
+    the row into a skip. Reprocessed emails update category and reasoning
+    through a batched UPDATE-only RPC keyed on gmail_id; emails re-parsed from the raw
+    archive ("reparsed") also update subject and body and are queued for
+    embedding again.
+    
+    Each email's outcome is recorded in email["store_status"]: "stored",
+    "updated", "skipped", "ignored" or "failed". The attachment rows an
+    email carries (see run_pipeline) are queued for writing once it is
+    stored or updated.
+    """
     success_count = 0
     skip_count = 0
     fail_count = 0
     ignored_count = 0
     updated_count = 0
+    request_count = 0
+    batch_size = max(1, batch_size or 1)
+    
+    new_rows = {}
+    update_rows = {}
+    emails_by_id = {}
+    ignored_rows = {}
+    reputation_outcomes = []
     
     for email in emails:
-        try:
-            # Check if this email is being reprocessed
-            is_reprocessed = email.get("reprocessed", False)
-            
-            # Skip emails triaged as "ignore" (unless reprocessing)
-            if email["category"] == "ignore" and not is_reprocessed:
-                print(f"Ignoring email based on triage: {email['subject'][:50]}...")
-                ignored_count += 1
-                continue
-            
-            # If reprocessing, update existing record
-            if is_reprocessed:
-                response = supabase.table("emails").update({
-                    "category": email["category"],
-                    "triage_reasoning": email["triage_reasoning"][:1000]
-                }).eq("gmail_id", email["gmail_id"]).execute()
-                
-                if response.data:
-                    print(f"Updated email ({email['category']}): {email['subject'][:50]}...")
-                    updated_count += 1
-                else:
-                    print(f"Failed to update email: {email['subject'][:50]}...")
-                    fail_count += 1
-            else:
-                # Store as a new email
-                response = supabase.table("emails").insert({
+        # Check if this email is being reprocessed
+        is_reprocessed = email.get("reprocessed", False)
+        
+        # Skip emails triaged as "ignore" (unless reprocessing)
+        if email["category"] == "ignore" and not is_reprocessed:
+            print(f"Ignoring email based on triage: {email['subject'][:50]}...")
+            email["store_status"] = "ignored"
+            ignored_count += 1
+            if email["triage_reasoning"].startswith(LLM_PREFIX):
+                # Kept as training data for the local classifier, which never sees ignored mail otherwise
+                ignored_rows[email["gmail_id"]] = {
+                    "gmail_id": email["gmail_id"],
                     "subject": email["subject"],
                     "sender": email["sender"],
-                    "recipient": email["recipient"],
-                    "cc": email["cc"],
-                    "bcc": email["bcc"],
+                    "body": email["body"][:TRAINING_BODY_CHARS],
+                    "triage_reasoning": email["triage_reasoning"][:1000]
+                }
+            continue
+        
+        emails_by_id[email["gmail_id"]] = email
+        
+        # If reprocessing, update existing record
+        if is_reprocessed:
+            update_rows[email["gmail_id"]] = {
+                "gmail_id": email["gmail_id"],
+                "category": email["category"],
+                "triage_reasoning": email["triage_reasoning"][:1000]
+            }
+            if email.get("thread_id"):
+                # Backfills the thread of rows stored before threads were recorded
+                update_rows[email["gmail_id"]]["thread_id"] = email["thread_id"]
+            if email.get("reparsed"):
+                update_rows[email["gmail_id"]].update({
+                    "subject": email["subject"],
                     "body": email["body"],
-                    "gmail_id": email["gmail_id"],
-                    "received_date": email["date"],
-                    "category": email["category"],  # Add triage category to the database
-                    "triage_reasoning": email["triage_reasoning"][:1000],  # Add triage reasoning (truncated if needed)
-                    "processing_status": "pending"  # Set initial processing status
-                }).execute()
-                
-                if response.data:
-                    print(f"Stored email ({email['category']}): {email['subject'][:50]}...")
-                    success_count += 1
-                else:
-                    print(f"Failed to store email: {email['subject'][:50]}...")
+                    "processing_status": "pending"  # Re-chunk and re-embed the new body
+                })
+        else:
+            # LLM decisions go into the sender's triage history once the row is written
+            counted = use_sender_reputation and email["triage_reasoning"].startswith(LLM_PREFIX)
+            
+            # Store as a new email
+            new_rows[email["gmail_id"]] = {
+                "subject": email["subject"],
+                "sender": email["sender"],
+                "recipient": email["recipient"],
+                "cc": email["cc"],
+                "bcc": email["bcc"],
+                "body": email["body"],
+                "gmail_id": email["gmail_id"],
+                "thread_id": email.get("thread_id") or email["gmail_id"],
+                "received_date": email["date"],
+                "category": email["category"],  # Add triage category to the database
+                "triage_reasoning": email["triage_reasoning"][:1000],  # Add triage reasoning (truncated if needed)
+                "processing_status": "pending",  # Set initial processing status
+                "reputation_category": email["category"] if counted else None,
+                "reputation_weight": 1 if counted else None
+            }
+    
+    for rows, is_update in ((list(new_rows.values()), False), (list(update_rows.values()), True)):
+        for batch_start in range(0, len(rows), batch_size):
+            batch = rows[batch_start:batch_start + batch_size]
+            if is_update:
+                written, failures, requests = update_email_rows(batch)
+            else:
+                written, failures, requests = insert_email_rows(batch)
+            request_count += requests
+            
+            for row, error in failures:
+                print(f"Error storing email {row['gmail_id']}: {error}")
+                fail_count += 1
+            failed_ids = set(row["gmail_id"] for row, _ in failures)
+            
+            for row in batch:
+                gmail_id = row["gmail_id"]
+                email = emails_by_id[gmail_id]
+                if gmail_id in failed_ids:
+                    email["store_status"] = "failed"
+                    continue
+                if gmail_id in written:
+                    if attachment_indexer is not None:
+                        attachment_indexer.write(gmail_id, email.get("attachments"))
+                    if is_update:
+                        print(f"Updated email ({email['category']}): {email['subject'][:50]}...")
+                        email["store_status"] = "updated"
+                        updated_count += 1
+                    else:
+                        print(f"Stored email ({email['category']}): {email['subject'][:50]}...")
+                        email["stored_at"] = time.time()
+                        email["store_status"] = "stored"
+                        success_count += 1
+                        if row["reputation_category"]:
+                            reputation_outcomes.append((row["sender"], row["reputation_category"], 1))
+                elif is_update:
+                    # Not in the table (the dedup index was stale), so nothing was updated
+                    print(f"Failed to update email (not stored): {email['subject'][:50]}...")
+                    email["store_status"] = "failed"
                     fail_count += 1
-                
+                else:
+                    # Insert was a no-op because another run already stored it
+                    print(f"Skipping already stored email: {email['subject'][:50]}...")
+                    email["store_status"] = "skipped"
+                    skip_count += 1
+            
+            if not is_update:
+                # Written and already-present rows are both in the database now
+                dedup_index.add(set(row["gmail_id"] for row in batch) - failed_ids)
+    
+    if ignored_rows:
+        try:
+            response = supabase.table("triage_ignored").upsert(
+                list(ignored_rows.values()), on_conflict="gmail_id", ignore_duplicates=True
+            ).execute()
+            if use_sender_reputation:
+                # Only first-time rows, so a resumed or retried email is not counted twice
+                for item in response.data or []:
+                    reputation_outcomes.append((ignored_rows[item["gmail_id"]]["sender"], "ignore", 1))
         except Exception as e:
-            print(f"Error storing email: {e}")
-            fail_count += 1
+            print(f"Error recording {len(ignored_rows)} ignored emails: {e}")
+    
+    sender_reputation.record_many(reputation_outcomes)
+    
+    if request_count:
+        print(f"Stored {len(new_rows) + len(update_rows)} rows in {request_count} database requests (batch size {batch_size})")
     
     if reprocess_all:
         return success_count, skip_count, fail_count, ignored_count, updated_count
     else:
         return success_count, skip_count, fail_count, ignored_count
 
-def sync_gmail():
-    """Sync new emails from Gmail since the last sync."""
-    print("Starting Gmail sync...")
+def get_peak_rss_mb():
+    """Peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux but bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def drain_spool(results=None, batch_size=DEFAULT_STORE_BATCH_SIZE, results_lock=None, source=None):
+    """
+    Write due spool entries to Supabase in batches until none are left.
     
-    # Fetch unread emails WITHOUT date filtering
-    emails = fetch_emails(unread_only=True)
-    print(f"Found {len(emails)} unread emails")
+    With a `source`, only entries spooled under that key are written, so
+    pipelines running side by side count only their own emails.
     
-    # Store emails in Supabase
-    success_count, skip_count, fail_count, ignored_count = store_emails(emails)
+    Entries whose write fails (or whose batch raises) are released for a
+    retry with exponential backoff, and draining stops so the database is
+    not hammered while it is struggling. Counts are added to `results`
+    (imported, updated, skipped, ignored, failed for dead entries, retried)
+    along with arrival-to-stored latencies.
+    
+    Returns:
+        int: Number of entries written or settled
+    """
+    settled = 0
+    while True:
+        entries = email_spool.claim(batch_size, source=source)
+        if not entries:
+            return settled
+        entry_ids = [entry_id for entry_id, _ in entries]
+        emails = [email_obj for _, email_obj in entries]
+        
+        try:
+            store_emails(emails, reprocess_all=True, batch_size=batch_size)
+        except Exception as e:
+            print(f"Error writing spooled emails, will retry: {e}")
+            dead = email_spool.retry(entry_ids, e)
+            _add_drain_counts(results, results_lock, {"retried": len(entry_ids) - dead, "failed": dead}, [])
+            return settled
+        
+        failed_ids = [entry_id for entry_id, email_obj in entries if email_obj.get("store_status") == "failed"]
+        done_ids = [entry_id for entry_id, email_obj in entries if email_obj.get("store_status") != "failed"]
+        email_spool.ack(done_ids)
+        dead = email_spool.retry(failed_ids, "write failed")
+        settled += len(done_ids)
+        
+        counts = {"retried": len(failed_ids) - dead, "failed": dead}
+        for status, key in (("stored", "imported"), ("updated", "updated"), ("skipped", "skipped"), ("ignored", "ignored")):
+            counts[key] = sum(1 for email_obj in emails if email_obj.get("store_status") == status)
+        
+        # End-to-end latency from server arrival (INTERNALDATE) to stored row
+        latencies = [
+            email_obj["stored_at"] - email_obj["arrived_at"]
+            for email_obj in emails
+            if email_obj.get("stored_at") and email_obj.get("arrived_at")
+        ]
+        _add_drain_counts(results, results_lock, counts, latencies)
+        
+        if failed_ids:
+            return settled
+
+def _add_drain_counts(results, results_lock, counts, latencies):
+    """Add drain_spool counts to a results dict (under its lock, if any)."""
+    if results is None:
+        return
+    if results_lock is None:
+        results_lock = threading.Lock()
+    with results_lock:
+        for key, count in counts.items():
+            results[key] = results.get(key, 0) + count
+        results["latencies"].extend(latencies)
+
+def run_pipeline(email_iter, store_batch_size=DEFAULT_STORE_BATCH_SIZE, checkpoint=None,
+                 flush_seconds=STORE_FLUSH_SECONDS, on_flush=None, spool_key=None):
+    """
+    Spool triaged emails as they stream out of `email_iter` and store them in the background.
+    
+    Emails are buffered only until `store_batch_size` are pending or the
+    oldest has waited `flush_seconds`, then committed to the local spool.
+    A drainer thread writes the spool to Supabase with store_emails, so
+    fetching and triage never wait on the database, and a database outage
+    only delays writes: entries are retried with backoff, and anything
+    still spooled when the run ends is written by the next run. Memory
+    stays bounded by one fetch batch plus one store batch, however large
+    the mailbox.
+    
+    If a checkpoint is given, its last_uid is advanced to the highest UID
+    spooled and persisted after every batch, so a crash only loses the
+    batch in flight. It stays below the lowest UID iter_emails could not
+    fetch (checkpoint["failed_uid"]). Emails must arrive in UID order. If
+    given, `on_flush` is called with each batch of emails once it is spooled.
+    
+    Emails are spooled under `spool_key`, and the drainer writes only
+    entries with that key (sync_mailbox uses the mailbox label), so
+    pipelines running at the same time never store each other's emails.
+    Without a key the drainer writes every due entry, including those left
+    by earlier runs of any mailbox.
+    
+    Returns:
+        dict: Counts (found, imported, updated, skipped, ignored, failed,
+        retried, spooled), arrival-to-stored latencies and peak RSS in MB
+    """
+    results = {
+        "found": 0,
+        "imported": 0,
+        "updated": 0,
+        "skipped": 0,
+        "ignored": 0,
+        "failed": 0,
+        "retried": 0,
+        "latencies": []
+    }
+    results_lock = threading.Lock()
+    pending = []
+    oldest_pending_at = None
+    
+    # Background drainer: wakes on every spooled batch, or when a retry is due
+    wake = threading.Event()
+    done = threading.Event()
+    
+    def drain_loop():
+        while True:
+            wake.clear()
+            try:
+                drain_spool(results, store_batch_size, results_lock, source=spool_key)
+            except Exception as e:
+                print(f"Error draining spool: {e}")
+            if done.is_set():
+                return
+            next_attempt = email_spool.next_attempt_in(spool_key)
+            wake.wait(timeout=max(1.0, next_attempt) if next_attempt is not None else None)
+    
+    drainer = threading.Thread(target=drain_loop, name="spool-drainer", daemon=True)
+    drainer.start()
+    
+    def flush():
+        if pending:
+            if attachment_indexer is not None:
+                # Spooled with the email, so its rows are written with it (never for ignored mail)
+                for email in pending:
+                    attachments = attachment_indexer.take(email["gmail_id"])
+                    if attachments:
+                        email["attachments"] = attachments
+            
+            # Durable before anything else: from here on the triage result cannot be lost
+            email_spool.put(pending, source=spool_key)
+            wake.set()
+            sync_journal.record_stored(email["gmail_id"] for email in pending if email.get("uid") is not None)
+            
+            if checkpoint is not None:
+                uids = [email["uid"] for email in pending if email.get("uid")]
+                if uids:
+                    advance_checkpoint(checkpoint, max(uids))
+            if on_flush is not None:
+                on_flush(pending)
+            pending.clear()
+        if checkpoint is not None:
+            update_sync_checkpoint(checkpoint)
+    
+    try:
+        for email_obj in email_iter:
+            results["found"] += 1
+            pending.append(email_obj)
+            if oldest_pending_at is None:
+                oldest_pending_at = time.monotonic()
+            
+            if len(pending) >= store_batch_size or time.monotonic() - oldest_pending_at >= flush_seconds:
+                flush()
+                oldest_pending_at = None
+        
+        # Everything scanned has now been spooled or skipped, including trailing duplicates
+        if checkpoint is not None and checkpoint.get("scanned_uid"):
+            advance_checkpoint(checkpoint, checkpoint["scanned_uid"])
+        flush()
+    finally:
+        # One last pass over everything that is due; entries waiting on a retry stay spooled
+        done.set()
+        wake.set()
+        drainer.join()
+        # LLM calls sender reputation saved during the run, in one write
+        sender_reputation.flush_savings()
+    
+    waiting, dead = email_spool.counts(spool_key)
+    results["spooled"] = waiting
+    if waiting or dead:
+        print(f"Spool: {waiting} emails waiting to be written, {dead} dead entries")
+    
+    latencies = results["latencies"]
+    if latencies:
+        print(f"Arrival-to-stored latency: min {min(latencies):.1f}s, "
+              f"avg {sum(latencies) / len(latencies):.1f}s, max {max(latencies):.1f}s")
+    results["peak_rss_mb"] = get_peak_rss_mb()
+    print(f"Peak memory (RSS): {results['peak_rss_mb']:.1f} MB")
+    
+    return results
+
+def sync_mailbox(account, mailbox, limit=None, unread_only=False, reprocess_all=False, use_checkpoint=True,
+                 batch_size=DEFAULT_FETCH_BATCH_SIZE, store_batch_size=DEFAULT_STORE_BATCH_SIZE,
+                 triage_workers=DEFAULT_TRIAGE_WORKERS, fetch_mode=DEFAULT_FETCH_MODE,
+                 part_max_bytes=DEFAULT_PART_MAX_BYTES, header_pretriage=DEFAULT_HEADER_PRETRIAGE,
+                 connections=1):
+    """
+    Fetch, triage and store one folder of one account.
+    
+    With `use_checkpoint`, only messages above the folder's own UID
+    checkpoint are fetched and the checkpoint is advanced as batches land.
+    Without it, `connections` > 1 fetches UID ranges over that many
+    connections at once (see iter_emails_parallel).
+    
+    Returns:
+        dict: run_pipeline results plus "mailbox", "elapsed", "messages_per_second"
+        and the fetch metrics from iter_emails
+    """
+    label = f"{account['name']}/{mailbox}"
+    started_at = time.monotonic()
+    metrics = {}
+    
+    checkpoint = None
+    if use_checkpoint:
+        checkpoint = get_sync_checkpoint(get_checkpoint_key(account, mailbox))
+        print(f"[{label}] Checkpoint: UIDVALIDITY={checkpoint['uidvalidity']}, last UID={checkpoint['last_uid']}, MODSEQ={checkpoint['highest_modseq']}")
+    
+    if checkpoint is None and connections > 1:
+        email_iter = iter_emails_parallel(
+            connections, limit=limit, unread_only=unread_only, reprocess_all=reprocess_all, batch_size=batch_size,
+            account=account, mailbox=mailbox, metrics=metrics, fetch_mode=fetch_mode,
+            part_max_bytes=part_max_bytes, header_pretriage=header_pretriage
+        )
+    else:
+        email_iter = iter_emails(limit=limit, unread_only=unread_only, reprocess_all=reprocess_all, batch_size=batch_size,
+                                 checkpoint=checkpoint, account=account, mailbox=mailbox, metrics=metrics,
+                                 fetch_mode=fetch_mode, part_max_bytes=part_max_bytes, header_pretriage=header_pretriage)
+    
+    results = run_pipeline(
+        triage_stream(email_iter, workers=triage_workers),
+        store_batch_size=store_batch_size,
+        checkpoint=checkpoint,
+        spool_key=label
+    )
+    
+    elapsed = time.monotonic() - started_at
+    results.update(metrics)
+    results["mailbox"] = label
+    results["elapsed"] = elapsed
+    results["messages_per_second"] = metrics["fetched"] / elapsed if elapsed > 0 else 0.0
+    print(f"[{label}] Done in {elapsed:.1f}s: {metrics['fetched']} fetched ({results['messages_per_second']:.1f} msg/s), "
+          f"{results['imported']} imported, {results['skipped']} skipped, {results['failed']} failed, "
+          f"{format_bytes(metrics['bytes_total'] - metrics['bytes_downloaded'])} not downloaded")
+    return results
+
+def sync_mailboxes(accounts=None, mailbox_workers=DEFAULT_MAILBOX_WORKERS, **options):
+    """
+    Run sync_mailbox for every configured (account, folder) pair concurrently.
+    
+    Connections come from the shared pool, so the per-server cap holds no
+    matter how many folders run at once.
+    
+    Args:
+        accounts: Account dicts (default: load_accounts())
+        mailbox_workers: Number of folders synced at the same time
+        **options: Passed through to sync_mailbox
+        
+    Returns:
+        dict: Totals across all folders, with per-folder results under "mailboxes"
+    """
+    if accounts is None:
+        accounts, max_connections = load_accounts()
+        imap_pool.max_connections_per_server = max_connections
+    
+    targets = [(account, mailbox) for account in accounts for mailbox in account["folders"]]
+    mailbox_results = []
+    
+    try:
+        sync_journal.prune()
+    except Exception as e:
+        print(f"Error pruning sync journal: {e}")
+    
+    def run(target):
+        account, mailbox = target
+        try:
+            return sync_mailbox(account, mailbox, **options)
+        except Exception as e:
+            print(f"[{account['name']}/{mailbox}] Error syncing mailbox: {e}")
+            return None
+    
+    if len(targets) == 1:
+        mailbox_results.append(run(targets[0]))
+    else:
+        with ThreadPoolExecutor(max_workers=max(1, min(mailbox_workers, len(targets)))) as executor:
+            mailbox_results.extend(executor.map(run, targets))
+    mailbox_results = [result for result in mailbox_results if result is not None]
+    
+    totals = {"found": 0, "imported": 0, "updated": 0, "skipped": 0, "ignored": 0, "failed": 0, "latencies": [],
+              "bytes_total": 0, "bytes_downloaded": 0, "pretriage_candidates": 0, "pretriaged": 0,
+              "pretriage_bytes_avoided": 0}
+    for result in mailbox_results:
+        for key in totals:
+            totals[key] += result[key]
+    totals["bytes_saved"] = totals["bytes_total"] - totals["bytes_downloaded"]
+    if totals["pretriage_candidates"]:
+        print(f"Header pre-triage: {totals['pretriaged']}/{totals['pretriage_candidates']} messages "
+              f"({100.0 * totals['pretriaged'] / totals['pretriage_candidates']:.1f}%) short-circuited, "
+              f"{format_bytes(totals['pretriage_bytes_avoided'])} of bodies not downloaded")
+    cache_stats = triage_cache.stats()
+    if cache_stats["hits"] + cache_stats["misses"]:
+        print(f"Triage cache: {cache_stats['hits']}/{cache_stats['hits'] + cache_stats['misses']} lookups hit "
+              f"({100.0 * cache_stats['hit_rate']:.1f}%), {cache_stats['entries']} entries, "
+              f"{cache_stats['evicted']} evicted")
+    totals["triage_cache"] = cache_stats
+    if sender_reputation.decided:
+        print(f"Sender reputation: {sender_reputation.decided} LLM calls avoided")
+    totals["reputation_decided"] = sender_reputation.decided
+    if local_classifier is not None and local_classifier.decided + local_classifier.deferred:
+        print(f"Local classifier: decided {local_classifier.decided} emails, "
+              f"left {local_classifier.deferred} to the LLM")
+    llm_stats = {"calls": 0, "llm_seconds": 0.0, "kickoff_seconds": 0.0, "overhead_seconds": 0.0}
+    for flow in list(_triage_flows.queue):
+        for key, value in flow.triage_agent.llm_stats().items():
+            llm_stats[key] += value
+    if llm_stats["calls"]:
+        print(f"LLM triage: {llm_stats['calls']} calls, {llm_stats['llm_seconds'] / llm_stats['calls']:.2f}s per request, "
+              f"{1000.0 * llm_stats['overhead_seconds'] / llm_stats['calls']:.1f}ms overhead per call")
+    totals["llm_triage"] = llm_stats
+    totals["peak_rss_mb"] = get_peak_rss_mb()
+    totals["mailboxes"] = mailbox_results
+    
+    if len(targets) > 1:
+        print("Per-mailbox summary:")
+        for result in mailbox_results:
+            print(f"  {result['mailbox']}: {result['fetched']} fetched in {result['elapsed']:.1f}s "
+                  f"({result['messages_per_second']:.1f} msg/s, {result['fetch_seconds']:.1f}s IMAP), "
+                  f"{result['imported']} imported, {result['failed']} failed")
+    
+    return totals
+
+def sync_gmail(batch_size=DEFAULT_FETCH_BATCH_SIZE, store_batch_size=DEFAULT_STORE_BATCH_SIZE,
+               triage_workers=DEFAULT_TRIAGE_WORKERS, accounts=None, fetch_mode=DEFAULT_FETCH_MODE,
+               part_max_bytes=DEFAULT_PART_MAX_BYTES, header_pretriage=DEFAULT_HEADER_PRETRIAGE):
+    """Sync new emails from every configured mailbox since its last UID checkpoint."""
+    print("Starting Gmail sync...")
+    
+    # Fetch only messages with a UID above each mailbox's stored checkpoint,
+    # persisting the checkpoints as batches land
+    results = sync_mailboxes(accounts, unread_only=False, batch_size=batch_size,
+                             store_batch_size=store_batch_size, triage_workers=triage_workers,
+                             fetch_mode=fetch_mode, part_max_bytes=part_max_bytes,
+                             header_pretriage=header_pretriage)
     
     # Update last sync time
     update_last_sync_time()
     
-    print(f"Sync completed. Results: {success_count} imported, {skip_count} skipped, {ignored_count} ignored, {fail_count} failed")
+    print(f"Sync completed. Results: {results['found']} new, {results['imported']} imported, {results['skipped']} skipped, {results['ignored']} ignored, {results['failed']} failed, {format_bytes(results['bytes_saved'])} saved")
+    
+    return results
 
-def initial_import(limit=None, unread_only=True):
-    """Perform initial import of emails."""
+def initial_import(limit=None, unread_only=True, batch_size=DEFAULT_FETCH_BATCH_SIZE,
+                   store_batch_size=DEFAULT_STORE_BATCH_SIZE, triage_workers=DEFAULT_TRIAGE_WORKERS, accounts=None,
+                   fetch_mode=DEFAULT_FETCH_MODE, part_max_bytes=DEFAULT_PART_MAX_BYTES,
+                   header_pretriage=DEFAULT_HEADER_PRETRIAGE, connections=DEFAULT_IMPORT_CONNECTIONS):
+    """Perform initial import of emails, fetching each mailbox over `connections` IMAP connections."""
     print("Starting initial Gmail import...")
     
-    # Fetch emails (with optional limit)
-    emails = fetch_emails(limit=limit, unread_only=unread_only)
-    print(f"Found {len(emails)} emails")
-    
-    # Store emails in Supabase
-    success_count, skip_count, fail_count, ignored_count = store_emails(emails)
+    # Fetch emails (with optional limit per mailbox) and store them as they are triaged
+    results = sync_mailboxes(accounts, limit=limit, unread_only=unread_only, use_checkpoint=False,
+                             batch_size=batch_size, store_batch_size=store_batch_size,
+                             triage_workers=triage_workers, fetch_mode=fetch_mode,
+                             part_max_bytes=part_max_bytes, header_pretriage=header_pretriage,
+                             connections=connections)
     
     # Update last sync time
     update_last_sync_time()
     
-    print(f"Initial import completed. Results: {success_count} imported, {skip_count} skipped, {ignored_count} ignored, {fail_count} failed")
+    print(f"Initial import completed. Results: {results['found']} found, {results['imported']} imported, {results['skipped']} skipped, {results['ignored']} ignored, {results['failed']} failed, {format_bytes(results['bytes_saved'])} saved")
+    
+    return results
 
-def reprocess_all_emails():
+def reprocess_all_emails(batch_size=DEFAULT_FETCH_BATCH_SIZE, store_batch_size=DEFAULT_STORE_BATCH_SIZE,
+                         triage_workers=DEFAULT_TRIAGE_WORKERS, accounts=None, fetch_mode=DEFAULT_FETCH_MODE,
+                         part_max_bytes=DEFAULT_PART_MAX_BYTES, header_pretriage=DEFAULT_HEADER_PRETRIAGE):
     """
     Reprocess all emails in the database with the current triage agent.
     This will update the category and reasoning for all emails.
     """
     print("Starting reprocessing of all emails...")
     
-    # Fetch all emails from Gmail that match our database
-    emails = fetch_emails(unread_only=False, reprocess_all=True)
-    print(f"Found {len(emails)} emails to reprocess")
+    # Fetch all emails from Gmail that match our database, updating them as they are triaged
+    results = sync_mailboxes(accounts, unread_only=False, reprocess_all=True, use_checkpoint=False,
+                             batch_size=batch_size, store_batch_size=store_batch_size,
+                             triage_workers=triage_workers, fetch_mode=fetch_mode,
+                             part_max_bytes=part_max_bytes, header_pretriage=header_pretriage)
+    
+    print(f"Reprocessing completed. Results: {results['found']} found, {results['imported']} new, {results['updated']} updated, {results['skipped']} skipped, {results['ignored']} ignored, {results['failed']} failed, {format_bytes(results['bytes_saved'])} saved")
+    
+    return results
+
+def iter_replayed_emails(archive, executor, mailbox=None, chunk_size=REPLAY_CHUNK_SIZE, max_pending=None):
+    """
+    Parse archived messages in worker processes and yield untriaged email objects.
+    
+    Index entries are handed to the workers `chunk_size` at a time, with at
+    most `max_pending` chunks in flight. Emails already in the database are
+    flagged so store_emails updates them instead of inserting.
+    """
+    def chunks():
+        chunk = []
+        for entry in archive.iter_entries(mailbox=mailbox):
+            chunk.append(entry)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
     
-    # Update categories and reasoning in the database
-    success_count, skip_count, fail_count, ignored_count, updated_count = store_emails(emails, reprocess_all=True)
+    max_pending = max_pending or (os.cpu_count() or 1) * 2
+    for emails in bounded_map(executor, partial(load_archived, archive.root), chunks(), max_pending):
+        yield from _flag_replayed(emails)
+
+def _flag_replayed(emails):
+    """Mark replayed emails as reparsed, and as reprocessed if already stored."""
+    existing = dedup_index.filter_existing(email_obj["gmail_id"] for email_obj in emails)
+    for email_obj in emails:
+        email_obj["category"] = None  # Set by triage
+        email_obj["triage_reasoning"] = None  # Set by triage
+        email_obj["reprocessed"] = email_obj["gmail_id"] in existing
+        email_obj["reparsed"] = True
+        email_obj["arrived_at"] = None  # Arrival-to-stored latency is meaningless for a replay
+        yield email_obj
+
+def replay_archive(archive=None, mailbox=None, store_batch_size=DEFAULT_STORE_BATCH_SIZE,
+                   triage_workers=DEFAULT_TRIAGE_WORKERS, parse_workers=None):
+    """
+    Re-run parsing, triage and storage for every message in the raw archive.
+    
+    Decompression and parsing run in a process pool (one worker per core by
+    default), so a replay is bound by local disk and CPU rather than IMAP.
+    Stored emails get their subject, body, category and reasoning updated and
+    are queued for re-embedding; archived emails missing from the database
+    are inserted.
+    """
+    archive = archive or raw_archive
+    if archive is None:
+        print("No raw archive configured (set RAW_ARCHIVE_DIR or pass --archive-dir)")
+        return None
     
-    print(f"Reprocessing completed. Results: {success_count} new, {updated_count} updated, {skip_count} skipped, {ignored_count} ignored, {fail_count} failed")
+    parse_workers = parse_workers or os.cpu_count() or 1
+    print(f"Replaying {len(archive)} archived messages from {archive.root} with {parse_workers} parser processes...")
+    started_at = time.monotonic()
+    
+    with parser_pool(parse_workers) as executor:
+        results = run_pipeline(
+            triage_stream(
+                iter_replayed_emails(archive, executor, mailbox=mailbox, max_pending=parse_workers * 2),
+                workers=triage_workers
+            ),
+            store_batch_size=store_batch_size
+        )
+    
+    elapsed = time.monotonic() - started_at
+    rate = results["found"] / elapsed if elapsed > 0 else 0.0
+    print(f"Replay completed in {elapsed:.1f}s ({rate:.1f} emails/s). Results: {results['found']} replayed, {results['imported']} imported, {results['updated']} updated, {results['ignored']} ignored, {results['failed']} failed")
+    
+    return results
+
+def get_reprocess_cursor():
+    """Get the emails.id an interrupted --reprocess-from-db run stopped at (0 to start over)."""
+    try:
+        with open(reprocess_cursor_path) as f:
+            return json.load(f).get("last_row_id", 0)
+    except FileNotFoundError:
+        return 0
+    except Exception as e:
+        print(f"Error reading reprocess cursor: {e}")
+        return 0
+
+def update_reprocess_cursor(last_row_id):
+    """Persist --reprocess-from-db progress (None clears it once a run completes)."""
+    try:
+        if last_row_id is None:
+            if os.path.exists(reprocess_cursor_path):
+                os.remove(reprocess_cursor_path)
+            return
+        os.makedirs(state_dir, exist_ok=True)
+        temp_path = reprocess_cursor_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"last_row_id": last_row_id, "updated_at": datetime.now().isoformat()}, f)
+        os.replace(temp_path, reprocess_cursor_path)
+    except Exception as e:
+        print(f"Error updating reprocess cursor: {e}")
+
+def iter_stored_emails(after_id=0, page_size=DEFAULT_REPROCESS_PAGE_SIZE):
+    """
+    Stream stored emails from the emails table as untriaged email objects.
+    
+    Uses keyset pagination on emails.id, so each page is an index range scan
+    and memory holds one page at a time. Each email carries its "row_id".
+    """
+    while True:
+        response = supabase.table("emails").select(
+            "id, gmail_id, subject, sender, body"
+        ).gt("id", after_id).order("id").limit(page_size).execute()
+        rows = response.data or []
+        
+        for row in rows:
+            yield {
+                "gmail_id": row["gmail_id"],
+                "subject": row.get("subject") or "",
+                "sender": row.get("sender") or "",
+                "body": row.get("body") or "",
+                "category": None,  # Set by triage
+                "triage_reasoning": None,  # Set by triage
+                "reprocessed": True,  # Only category and reasoning are written back
+                "row_id": row["id"]  # emails.id, not stored
+            }
+        
+        if len(rows) < page_size:
+            break
+        after_id = rows[-1]["id"]
+
+def reprocess_from_db(store_batch_size=DEFAULT_STORE_BATCH_SIZE, triage_workers=DEFAULT_TRIAGE_WORKERS,
+                      page_size=DEFAULT_REPROCESS_PAGE_SIZE, restart=False):
+    """
+    Re-triage the emails already stored in the database, without IMAP.
+    
+    Rows are streamed in id order, triaged concurrently and written back in
+    bulk (category and triage_reasoning only). The last written id is kept in
+    a local cursor after every batch, so an interrupted run resumes where it
+    stopped; `restart` ignores the cursor.
+    """
+    after_id = 0 if restart else get_reprocess_cursor()
+    if after_id:
+        print(f"Resuming reprocessing from the database after emails.id {after_id}...")
+    else:
+        print("Starting reprocessing of all emails from the database...")
+    
+    def save_progress(batch):
+        row_ids = [email["row_id"] for email in batch]
+        if row_ids:
+            update_reprocess_cursor(max(row_ids))
+    
+    started_at = time.monotonic()
+    results = run_pipeline(
+        triage_stream(iter_stored_emails(after_id, page_size=page_size), workers=triage_workers),
+        store_batch_size=store_batch_size,
+        on_flush=save_progress
+    )
+    
+    # A full pass finished: the next run starts from the beginning again
+    update_reprocess_cursor(None)
+    
+    elapsed = time.monotonic() - started_at
+    rate = results["found"] / elapsed if elapsed > 0 else 0.0
+    print(f"Reprocessing from database completed in {elapsed:.1f}s ({rate:.1f} emails/s). Results: {results['found']} found, {results['updated']} updated, {results['failed']} failed")
+    
+    return results
 
 if __name__ == "__main__":
     import argparse
@@ -467,21 +2032,112 @@ if __name__ == "__main__":
     parser.add_argument('--limit', type=int, help='Limit number of emails to import')
     parser.add_argument('--all', action='store_true', help='Include all emails, not just unread (use with caution)')
     parser.add_argument('--reprocess-all', action='store_true', help='Reprocess all emails with current triage agent')
+    parser.add_argument('--reprocess-from-db', action='store_true',
+                        help='Re-triage emails already stored in the database (no IMAP download); resumes an interrupted run')
+    parser.add_argument('--archive-dir',
+                        help='Archive raw messages to (or replay from) this directory (default: RAW_ARCHIVE_DIR)')
+    parser.add_argument('--replay-archive', action='store_true',
+                        help='Re-parse, re-triage and re-store every message in the raw archive (no IMAP)')
+    parser.add_argument('--replay-mailbox', help='With --replay-archive, only replay messages from this mailbox (e.g. default/INBOX)')
+    parser.add_argument('--parse-workers', type=int,
+                        help='Parser processes for --replay-archive (default: one per CPU core)')
+    parser.add_argument('--restart', action='store_true',
+                        help='With --reprocess-from-db, ignore the saved cursor and start from the first email')
     parser.add_argument('--debug', action='store_true', help='Print additional debug information')
+    parser.add_argument('--triage-workers', type=int, default=DEFAULT_TRIAGE_WORKERS,
+                        help=f'Number of emails triaged concurrently (default: {DEFAULT_TRIAGE_WORKERS})')
+    parser.add_argument('--store-batch-size', type=int, default=DEFAULT_STORE_BATCH_SIZE,
+                        help=f'Number of rows per database upsert (default: {DEFAULT_STORE_BATCH_SIZE})')
+    parser.add_argument('--rebuild-dedup-index', action='store_true',
+                        help='Rebuild the local gmail_id dedup index from the emails table')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_FETCH_BATCH_SIZE,
+                        help=f'Number of messages per IMAP FETCH (default: {DEFAULT_FETCH_BATCH_SIZE}, 1 = one round trip per message)')
+    parser.add_argument('--fetch-mode', choices=['full', 'parts'], default=DEFAULT_FETCH_MODE,
+                        help='full: download whole messages; parts: read BODYSTRUCTURE and download only text parts '
+                             f'(default: {DEFAULT_FETCH_MODE})')
+    parser.add_argument('--part-max-bytes', type=int, default=DEFAULT_PART_MAX_BYTES,
+                        help=f'Maximum bytes downloaded per text part in parts mode (default: {DEFAULT_PART_MAX_BYTES})')
+    parser.add_argument('--header-pretriage', action='store_true', default=DEFAULT_HEADER_PRETRIAGE,
+                        help='Fetch headers first and skip the body download for emails the header rules ignore')
+    parser.add_argument('--connections', type=int, default=DEFAULT_IMPORT_CONNECTIONS,
+                        help=f'IMAP connections per mailbox for --initial, each fetching a UID range '
+                             f'(default: {DEFAULT_IMPORT_CONNECTIONS}; Gmail allows 15 per account)')
+    parser.add_argument('--index-attachments', action='store_true', default=DEFAULT_INDEX_ATTACHMENTS,
+                        help='Record filename, type, size and SHA-256 of attachments (full fetch mode only)')
+    parser.add_argument('--no-thread-reuse', action='store_true',
+                        help='Triage every reply from scratch instead of reusing its thread\'s earlier decision')
+    parser.add_argument('--no-triage-cache', action='store_true',
+                        help='Ask the LLM for every email the rules do not decide, even repeated sender/subject templates')
+    parser.add_argument('--no-sender-reputation', action='store_true',
+                        help='Neither decide emails from their sender\'s triage history nor add to it')
+    parser.add_argument('--no-classifier', action='store_true',
+                        help='Do not let the local triage classifier decide before the LLM')
+    parser.add_argument('--drain-spool', action='store_true',
+                        help='Only write emails left in the local spool by earlier runs to Supabase')
+    parser.add_argument('--accounts', help='JSON file listing accounts and folders to sync (default: SYNC_ACCOUNTS_FILE, or GMAIL_EMAIL\'s INBOX)')
     
     args = parser.parse_args()
     
     # Print version info
     print("Gmail Sync with Email Triage v1.2")
-    print(f"Options: initial={args.initial}, limit={args.limit}, all={args.all}, reprocess={args.reprocess_all}")
+    print(f"Options: initial={args.initial}, limit={args.limit}, all={args.all}, reprocess={args.reprocess_all}, batch_size={args.batch_size}, fetch_mode={args.fetch_mode}, header_pretriage={args.header_pretriage}")
     
     # Determine if we should fetch all emails or just unread
     unread_only = not args.all
     
+    # Bring the local dedup index up to date with rows stored by other runs
+    try:
+        if args.rebuild_dedup_index:
+            print(f"Rebuilt dedup index from {dedup_index.rebuild()} stored emails")
+        else:
+            dedup_index.refresh()
+    except Exception as e:
+        print(f"Error refreshing dedup index: {e}")
+    
+    # Accounts and folders to sync (None loads SYNC_ACCOUNTS_FILE or the default INBOX)
+    accounts = None
+    if args.accounts:
+        accounts, max_connections = load_accounts(args.accounts)
+        imap_pool.max_connections_per_server = max_connections
+    
+    if args.archive_dir:
+        raw_archive = RawArchive(args.archive_dir)
+    if args.no_thread_reuse:
+        thread_reuse = False
+    if args.no_triage_cache:
+        use_triage_cache = False
+    if args.no_sender_reputation:
+        use_sender_reputation = False
+    if args.no_classifier:
+        use_local_classifier = False
+    if args.index_attachments and attachment_indexer is None:
+        attachment_indexer = AttachmentIndexer(supabase)
+        atexit.register(attachment_indexer.close)
+    
     # Check if we're reprocessing all emails
-    if args.reprocess_all:
-        reprocess_all_emails()
+    if args.drain_spool:
+        drained = {"latencies": []}
+        print(f"Drained {drain_spool(drained, args.store_batch_size)} spooled emails")
+        waiting, dead = email_spool.counts()
+        print(f"Spool: {waiting} emails waiting to be written, {dead} dead entries")
+    elif args.replay_archive:
+        replay_archive(mailbox=args.replay_mailbox, store_batch_size=args.store_batch_size,
+                       triage_workers=args.triage_workers, parse_workers=args.parse_workers)
+    elif args.reprocess_from_db:
+        reprocess_from_db(store_batch_size=args.store_batch_size, triage_workers=args.triage_workers,
+                          restart=args.restart)
+    elif args.reprocess_all:
+        reprocess_all_emails(batch_size=args.batch_size, store_batch_size=args.store_batch_size,
+                             triage_workers=args.triage_workers, accounts=accounts,
+                             fetch_mode=args.fetch_mode, part_max_bytes=args.part_max_bytes,
+                             header_pretriage=args.header_pretriage)
     elif args.initial:
-        initial_import(limit=args.limit, unread_only=unread_only)
+        initial_import(limit=args.limit, unread_only=unread_only, batch_size=args.batch_size,
+                       store_batch_size=args.store_batch_size, triage_workers=args.triage_workers,
+                       accounts=accounts, fetch_mode=args.fetch_mode, part_max_bytes=args.part_max_bytes,
+                       header_pretriage=args.header_pretriage, connections=args.connections)
     else:
-        sync_gmail()
\ No newline at end of file
+        sync_gmail(batch_size=args.batch_size, store_batch_size=args.store_batch_size,
+                   triage_workers=args.triage_workers, accounts=accounts,
+                   fetch_mode=args.fetch_mode, part_max_bytes=args.part_max_bytes,
+                   header_pretriage=args.header_pretriage)
\ No newline at end of file
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+IMAP IDLE Helpers
+
+This module holds the IMAP IDLE loop used by continuous_sync's push mode,
+plus the NOOP check run between IDLE commands. Mail that arrives while no
+IDLE is active (during a sync) is announced in the untagged responses of
+the next command, so the caller checks those before idling again.
+"""
+
+import ssl
+import time
+import select
+import imaplib
+
+
+def data_ready(mail):
+    """
+    Check whether a readline on the connection would return without waiting
+    
+    select() only sees the socket: bytes already read into imaplib's
+    buffered reader (or decrypted by the SSL layer) are invisible to it, so
+    the reader is peeked without blocking first.
+    
+    Returns:
+        bool: True if a response line is at least partly available
+    """
+    if hasattr(mail.sock, "pending") and mail.sock.pending():
+        return True
+    timeout = mail.sock.gettimeout()
+    mail.sock.setblocking(False)
+    try:
+        return bool(mail.file.peek(1))
+    except (BlockingIOError, ssl.SSLWantReadError):
+        return False
+    finally:
+        mail.sock.settimeout(timeout)
+
+
+def idle_wait(mail, timeout):
+    """
+    Hold an IMAP IDLE on the selected mailbox until new mail arrives.
+    
+    Args:
+        mail: Authenticated connection with a mailbox selected
+        timeout: Seconds to wait before ending the IDLE (keep under the
+            server's 29 minute IDLE limit)
+    
+    Returns:
+        bool: True if the server reported EXISTS, False on timeout
+    """
+    tag = mail._new_tag()
+    mail.send(tag + b" IDLE\r\n")
+    line = mail.readline()
+    if not line.startswith(b"+"):
+        raise imaplib.IMAP4.error(f"IDLE rejected by server: {line!r}")
+        
+    new_mail = False
+    deadline = time.monotonic() + timeout
+    try:
+        while not new_mail:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if not data_ready(mail):
+                readable, _, _ = select.select([mail.sock], [], [], remaining)
+                if not readable:
+                    break
+            line = mail.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("Connection closed during IDLE")
+            if line.rstrip().endswith(b"EXISTS"):
+                new_mail = True
+    finally:
+        # End the IDLE and drain untagged responses up to the tagged completion
+        mail.send(b"DONE\r\n")
+        while True:
+            line = mail.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("Connection closed while ending IDLE")
+            if line.rstrip().endswith(b"EXISTS"):
+                new_mail = True
+            if line.startswith(tag):
+                break
+        mail.tagged_commands.pop(tag, None)
+        
+    return new_mail
+
+
+def noop_new_mail(mail):
+    """
+    Send a NOOP (keeping the connection alive) and report new mail it announced
+    
+    Returns:
+        bool: True if the server sent EXISTS since the last command
+    """
+    mail.noop()
+    new_mail = mail.untagged_responses.pop("EXISTS", None) is not None
+    mail.untagged_responses.pop("RECENT", None)
+    return new_mail
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+IMAP FETCH and BODYSTRUCTURE Parsing
+
+This module parses raw imaplib FETCH responses into per-message data items
+and turns a message's BODYSTRUCTURE into a flat list of parts, so the sync
+can download only the text parts it needs (BODY.PEEK[<section>]) instead of
+the whole message with its attachments.
+"""
+
+import base64
+import quopri
+import re
+
+# A FETCH response for a new message starts with its sequence number
+FETCH_START_PATTERN = re.compile(rb"\d+ \(")
+
+
+def _join_responses(msg_data):
+    """
+    Reassemble imaplib FETCH data into one bytes string per message
+    
+    imaplib splits a response at every literal into (prefix, literal) tuples
+    followed by the remaining bytes. The literal is appended directly after
+    its "{n}" marker, so the tokenizer can read it back by length.
+    """
+    current = None
+    for item in msg_data:
+        if isinstance(item, tuple):
+            head, literal = item
+            if FETCH_START_PATTERN.match(head) and current is not None:
+                yield current
+                current = None
+            current = (current or b"") + head + literal
+        elif isinstance(item, bytes):
+            if FETCH_START_PATTERN.match(item):
+                if current is not None:
+                    yield current
+                current = item
+            elif current is not None:
+                current += item
+    if current is not None:
+        yield current
+
+
+def _parse_atom(data, pos):
+    """Read an atom, keeping bracketed sections like BODY[HEADER.FIELDS (FROM)]<0> intact"""
+    start = pos
+    depth = 0
+    while pos < len(data):
+        char = data[pos:pos + 1]
+        if char == b"[":
+            depth += 1
+        elif char == b"]":
+            depth -= 1
+        elif depth == 0 and char in (b" ", b"(", b")", b"\r", b"\n"):
+            break
+        pos += 1
+    return data[start:pos], pos
+
+
+def _parse_value(data, pos):
+    """
+    Parse one value (list, quoted string, literal, NIL or atom) starting at pos
+    
+    Raises:
+        ValueError: If the response is truncated or malformed
+    """
+    char = data[pos:pos + 1]
+    if char == b"(":
+        return _parse_list(data, pos + 1)
+    if char == b'"':
+        pos += 1
+        value = bytearray()
+        while pos < len(data) and data[pos:pos + 1] != b'"':
+            if data[pos:pos + 1] == b"\\":
+                pos += 1
+            value += data[pos:pos + 1]
+            pos += 1
+        if pos >= len(data):
+            raise ValueError(f"Unterminated quoted string in FETCH response at byte {pos}")
+        return bytes(value), pos + 1
+    if char == b"{":
+        end = data.find(b"}", pos)
+        if end == -1:
+            raise ValueError(f"Literal without a closing '}}' in FETCH response at byte {pos}")
+        length = int(data[pos + 1:end])
+        start = end + 1
+        if start + length > len(data):
+            raise ValueError(f"Literal of {length} bytes cut short in FETCH response at byte {pos}")
+        return data[start:start + length], start + length
+    atom, pos = _parse_atom(data, pos)
+    if atom.upper() == b"NIL":
+        return None, pos
+    return atom, pos
+
+
+def _parse_list(data, pos):
+    """Parse list items up to the closing parenthesis (pos is just past the opening one)"""
+    items = []
+    while pos < len(data):
+        char = data[pos:pos + 1]
+        if char in (b" ", b"\r", b"\n"):
+            pos += 1
+        elif char == b")":
+            return items, pos + 1
+        else:
+            value, pos = _parse_value(data, pos)
+            items.append(value)
+    raise ValueError("Unterminated list in FETCH response")
+
+
+def parse_fetch_response(msg_data):
+    """
+    Parse the data of a (UID) FETCH command
+    
+    Args:
+        msg_data: Data list returned by imaplib for a FETCH of one or more messages
+        
+    Returns:
+        list: One dict per message mapping upper-cased item names (e.g. "UID",
+        "BODYSTRUCTURE", "BODY[HEADER]", "BODY[1]<0>") to their values
+        
+    Raises:
+        ValueError: If a response is truncated or malformed
+    """
+    messages = []
+    for response in _join_responses(msg_data):
+        start = response.index(b"(")
+        items, _ = _parse_list(response, start + 1)
+        message = {}
+        for index in range(0, len(items) - 1, 2):
+            key = items[index]
+            if isinstance(key, bytes):
+                message[key.decode("ascii", errors="replace").upper()] = items[index + 1]
+        messages.append(message)
+    return messages
+
+
+def get_section(message, section):
+    """Get the data returned for BODY[<section>] (with or without a <partial> suffix)"""
+    prefix = f"BODY[{section}]"
+    for key, value in message.items():
+        if key == prefix or (key.startswith(prefix) and key[len(prefix):].startswith("<")):
+            return value if isinstance(value, bytes) else b""
+    return None
+
+
+def _text(value):
+    """Decode a bytes token to lower-case text"""
+    if value is None:
+        return ""
+    if isinstance(value, bytes):
+        return value.decode("ascii", errors="replace").lower()
+    return ""
+
+
+def _params(value):
+    """Turn a BODYSTRUCTURE parameter list into a dict"""
+    if not isinstance(value, list):
+        return {}
+    return {_text(value[i]): value[i + 1].decode("utf-8", errors="replace") if isinstance(value[i + 1], bytes) else ""
+            for i in range(0, len(value) - 1, 2)}
+
+
+def _disposition(value):
+    """Get the disposition type ("attachment", "inline" or "") from a disposition field"""
+    if isinstance(value, list) and value:
+        return _text(value[0])
+    return ""
+
+
+def parse_bodystructure(structure, section=""):
+    """
+    Flatten a parsed BODYSTRUCTURE into its leaf parts
+    
+    Attached messages (message/rfc822) are kept as single leaves rather than
+    walked, since their text belongs to the attachment, not the email.
+    
+    Args:
+        structure: BODYSTRUCTURE value from parse_fetch_response
+        section: Section number of this part ("" for the top level)
+        
+    Returns:
+        list: Dicts with section, type, subtype, params, encoding, size and disposition
+    """
+    if not isinstance(structure, list) or not structure:
+        return []
+        
+    if isinstance(structure[0], list):
+        # Multipart: child bodies, then the subtype and extension data
+        parts = []
+        for index, child in enumerate(structure):
+            if not isinstance(child, list):
+                break
+            child_section = f"{section}.{index + 1}" if section else str(index + 1)
+            parts.extend(parse_bodystructure(child, child_section))
+        return parts
+        
+    content_type = _text(structure[0])
+    subtype = _text(structure[1]) if len(structure) > 1 else ""
+    size = structure[6] if len(structure) > 6 else None
+    
+    # Extension data follows the type-specific fields
+    if content_type == "text":
+        disposition_index = 9
+    elif content_type == "message" and subtype == "rfc822":
+        disposition_index = 11
+    else:
+        disposition_index = 8
+        
+    return [{
+        "section": section or "1",  # A single-part message's body is section 1
+        "type": content_type,
+        "subtype": subtype,
+        "params": _params(structure[2] if len(structure) > 2 else None),
+        "encoding": _text(structure[5]) if len(structure) > 5 else "",
+        "size": int(size) if isinstance(size, bytes) and size.isdigit() else 0,
+        "disposition": _disposition(structure[disposition_index]) if len(structure) > disposition_index else ""
+    }]
+
+
+def select_text_parts(parts):
+    """
+    Choose the parts needed for the email body
+    
+    Returns the inline text/plain parts, or the text/html parts if there is
+    no plain text. Attachments are never selected.
+    """
+    inline_text = [part for part in parts if part["type"] == "text" and part["disposition"] != "attachment"]
+    plain = [part for part in inline_text if part["subtype"] == "plain"]
+    if plain:
+        return plain
+    return [part for part in inline_text if part["subtype"] == "html"]
+
+
+def decode_part(data, part):
+    """
+    Decode a downloaded part using its transfer encoding and charset
+    
+    The data may have been cut at a byte cap, so base64 input is trimmed to
+    whole 4-character groups before decoding.
+    """
+    if not data:
+        return ""
+        
+    encoding = part.get("encoding", "")
+    try:
+        if encoding == "base64":
+            compact = re.sub(rb"[^A-Za-z0-9+/=]", b"", data)
+            compact = compact[:len(compact) - len(compact) % 4]
+            data = base64.b64decode(compact)
+        elif encoding == "quoted-printable":
+            data = quopri.decodestring(data)
+    except Exception:
+        pass
+        
+    charset = part.get("params", {}).get("charset") or "utf-8"
+    for candidate in (charset, "latin1"):
+        try:
+            return data.decode(candidate)
+        except (LookupError, UnicodeDecodeError):
+            continue
+    return ""
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+IMAP Connection Pool
+
+This module keeps authenticated IMAP connections open for reuse across
+mailboxes and sync cycles, and caps how many connections are open against
+each server at once (Gmail, for example, allows 15 per account).
+"""
+
+import threading
+from contextlib import contextmanager
+
+
+class ImapConnectionPool:
+    """Pool of authenticated IMAP connections with a per-server connection cap"""
+    
+    def __init__(self, connect, max_connections_per_server=10):
+        """
+        Initialize the pool
+        
+        Args:
+            connect: Callable taking an account dict and returning a logged-in connection
+            max_connections_per_server: Maximum open connections (idle or in use) per host
+        """
+        self._connect = connect
+        self.max_connections_per_server = max_connections_per_server
+        self._condition = threading.Condition()
+        self._idle = {}      # (host, email) -> idle connections
+        self._open = {}      # host -> number of open connections
+        self._owners = {}    # id(connection) -> (host, email)
+        
+    def acquire(self, account):
+        """
+        Get a connection for an account, waiting if the server's cap is reached
+        
+        Idle connections are checked with NOOP before being handed out; stale
+        ones are dropped and replaced.
+        """
+        host = account["host"]
+        key = (host, account["email"])
+        
+        while True:
+            with self._condition:
+                while True:
+                    idle = self._idle.get(key)
+                    if idle:
+                        connection = idle.pop()
+                        break
+                    if self._open.get(host, 0) < self.max_connections_per_server:
+                        self._open[host] = self._open.get(host, 0) + 1
+                        connection = None
+                        break
+                    # Cap reached: reclaim an idle connection held for another account
+                    evicted = self._pop_idle_for_host(host)
+                    if evicted is not None:
+                        self._logout(evicted)
+                        continue
+                    self._condition.wait()
+            
+            if connection is None:
+                try:
+                    connection = self._connect(account)
+                except Exception:
+                    with self._condition:
+                        self._open[host] -= 1
+                        self._condition.notify()
+                    raise
+                with self._condition:
+                    self._owners[id(connection)] = key
+                return connection
+                
+            try:
+                connection.noop()
+                return connection
+            except Exception:
+                self._discard(connection)
+    
+    def release(self, connection, discard=False):
+        """
+        Return a connection to the pool
+        
+        Args:
+            connection: Connection obtained from acquire()
+            discard: Log out instead of keeping it (e.g. after an error mid-command)
+        """
+        if discard:
+            self._discard(connection)
+            return
+        with self._condition:
+            key = self._owners.get(id(connection))
+            if key is None:
+                return
+            self._idle.setdefault(key, []).append(connection)
+            self._condition.notify()
+    
+    @contextmanager
+    def connection(self, account):
+        """Context manager that acquires a connection and releases it afterwards"""
+        connection = self.acquire(account)
+        try:
+            yield connection
+        except Exception:
+            self.release(connection, discard=True)
+            raise
+        self.release(connection)
+        
+    def close_all(self):
+        """Log out every idle connection"""
+        with self._condition:
+            idle = [connection for connections in self._idle.values() for connection in connections]
+            self._idle = {}
+        for connection in idle:
+            self._discard(connection)
+    
+    def _pop_idle_for_host(self, host):
+        """Remove and return any idle connection to `host` (caller holds the lock)"""
+        for (idle_host, _), connections in self._idle.items():
+            if idle_host == host and connections:
+                return connections.pop()
+        return None
+        
+    def _logout(self, connection):
+        """Close an idle connection taken out of the pool (caller holds the lock)"""
+        key = self._owners.pop(id(connection), None)
+        if key is not None:
+            self._open[key[0]] -= 1
+        try:
+            connection.logout()
+        except Exception:
+            pass
+    
+    def _discard(self, connection):
+        """Log out a connection and free its slot"""
+        with self._condition:
+            key = self._owners.pop(id(connection), None)
+            if key is not None:
+                self._open[key[0]] -= 1
+            self._condition.notify()
+        try:
+            connection.logout()
+        except Exception:
+            pass
@@ -77,6 +77,9 @@ def process_pending_emails():
                 # Mark as processing
                 supabase.table("emails").update({"processing_status": "processing"}).eq("id", email_id).execute()
                 
+                # Drop sections from an earlier pass (the body may have been re-parsed)
+                supabase.table("email_sections").delete().eq("email_id", email_id).execute()
+                
                 # Split into chunks
                 chunks = split_into_chunks(body)
                 print(f"Split into {len(chunks)} chunks")
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Token-Bucket Rate Limiter
+
+This module provides a thread-safe limiter for LLM API calls, enforcing both
+a requests-per-minute and a tokens-per-minute budget. Triage workers call
+acquire() right before a model request, so emails decided by the rule engine
+never wait on it.
+"""
+
+import threading
+import time
+
+
+def estimate_tokens(text):
+    """Rough token estimate for English text (about 4 characters per token)"""
+    return len(text or "") // 4
+
+
+class RateLimiter:
+    """Requests/tokens per minute limiter shared by all triage workers"""
+    
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        """
+        Initialize the limiter
+        
+        Args:
+            requests_per_minute: Maximum requests per minute (None or 0 for no limit)
+            tokens_per_minute: Maximum tokens per minute (None or 0 for no limit)
+        """
+        self.requests_per_minute = requests_per_minute or 0
+        self.tokens_per_minute = tokens_per_minute or 0
+        
+        # Buckets start full, so a burst of up to one minute's budget is allowed
+        self._request_allowance = float(self.requests_per_minute)
+        self._token_allowance = float(self.tokens_per_minute)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+        
+        self.total_requests = 0
+        self.total_wait_seconds = 0.0
+        
+    def _refill(self, now):
+        """Add the allowance accrued since the last refill (caller holds the lock)"""
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        if self.requests_per_minute:
+            self._request_allowance = min(
+                self.requests_per_minute,
+                self._request_allowance + elapsed * self.requests_per_minute / 60.0
+            )
+        if self.tokens_per_minute:
+            self._token_allowance = min(
+                self.tokens_per_minute,
+                self._token_allowance + elapsed * self.tokens_per_minute / 60.0
+            )
+    
+    def acquire(self, tokens=0):
+        """
+        Block until one request using `tokens` tokens fits within both limits
+        
+        Args:
+            tokens: Estimated tokens for the request (prompt plus completion)
+            
+        Returns:
+            float: Seconds spent waiting
+        """
+        if self.tokens_per_minute:
+            # A single request larger than the whole budget would otherwise wait forever
+            tokens = min(tokens, self.tokens_per_minute)
+        waited = 0.0
+        
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                
+                request_ok = not self.requests_per_minute or self._request_allowance >= 1
+                tokens_ok = not self.tokens_per_minute or self._token_allowance >= tokens
+                
+                if request_ok and tokens_ok:
+                    if self.requests_per_minute:
+                        self._request_allowance -= 1
+                    if self.tokens_per_minute:
+                        self._token_allowance -= tokens
+                    self.total_requests += 1
+                    self.total_wait_seconds += waited
+                    return waited
+                    
+                # Sleep just long enough for the scarcer bucket to refill
+                delay = 0.0
+                if not request_ok:
+                    delay = max(delay, (1 - self._request_allowance) * 60.0 / self.requests_per_minute)
+                if not tokens_ok:
+                    delay = max(delay, (tokens - self._token_allowance) * 60.0 / self.tokens_per_minute)
+            
+            time.sleep(delay)
+            waited += delay
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Local Raw-Message Archive
+
+This module keeps a content-addressed copy of the raw RFC822 bytes of every
+fetched message, so parsing and triage can be re-run from local disk instead
+of going back to Gmail over IMAP.
+
+Each message is zstd-compressed and stored under its SHA-256, sharded into
+two levels of directories (ab/cd/abcd....eml.zst). A SQLite index next to
+the objects records which gmail_id, mailbox and UID each hash came from, in
+the order they were archived.
+"""
+
+import os
+import email
+import hashlib
+import sqlite3
+import threading
+
+from email_parsing import parse_email
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# zstd level used for new objects (3 is zstd's default speed/ratio tradeoff)
+DEFAULT_COMPRESSION_LEVEL = 3
+
+# Index rows read per query when iterating the archive
+ITER_PAGE_SIZE = 1000
+
+
+def object_path(root, key):
+    """Path of the compressed object for a message hash"""
+    return os.path.join(root, key[:2], key[2:4], key + ".eml.zst")
+
+
+def read_object(root, key):
+    """Read and decompress one archived message"""
+    with open(object_path(root, key), "rb") as f:
+        return zstandard.ZstdDecompressor().decompress(f.read())
+
+
+def load_archived(root, entries):
+    """
+    Decompress and parse archived messages
+    
+    Runs in worker processes during replay, so it only depends on the
+    archive files and email_parsing.
+    
+    Args:
+        root: Archive directory
+        entries: Index entries from RawArchive.iter_entries()
+        
+    Returns:
+        list: Email dicts (see email_parsing.parse_email) with "uid" and "arrived_at"
+    """
+    emails = []
+    for entry in entries:
+        try:
+            msg = email.message_from_bytes(read_object(root, entry["key"]))
+        except Exception as e:
+            print(f"Error reading archived message {entry['key']}: {e}")
+            continue
+        email_obj = parse_email(msg, entry["gmail_id"])
+        email_obj["uid"] = entry["uid"]
+        email_obj["arrived_at"] = entry["arrived_at"]
+        emails.append(email_obj)
+    return emails
+
+
+class RawArchive:
+    """Content-addressed, zstd-compressed store of raw messages"""
+    
+    def __init__(self, root, level=DEFAULT_COMPRESSION_LEVEL):
+        """
+        Open (or create) the archive
+        
+        Args:
+            root: Archive directory
+            level: zstd compression level for new objects
+        """
+        if zstandard is None:
+            raise RuntimeError("The raw archive needs the zstandard package (pip install zstandard)")
+            
+        self.root = root
+        self.level = level
+        self._lock = threading.Lock()
+        
+        os.makedirs(root, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(root, "index.sqlite3"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "key TEXT PRIMARY KEY, gmail_id TEXT, mailbox TEXT, uid INTEGER, "
+            "arrived_at REAL, size INTEGER, stored_size INTEGER)"
+        )
+        self._db.commit()
+        
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+    
+    def __contains__(self, key):
+        return os.path.exists(object_path(self.root, key))
+        
+    def put(self, raw, gmail_id=None, mailbox=None, uid=None, arrived_at=None):
+        """
+        Archive a raw message (a no-op if the same bytes are already stored)
+        
+        Returns:
+            str: The message's SHA-256 key
+        """
+        key = hashlib.sha256(raw).hexdigest()
+        path = object_path(self.root, key)
+        stored_size = None
+        
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            compressed = zstandard.ZstdCompressor(level=self.level).compress(raw)
+            # Write under a unique name and rename, so readers never see a partial object
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(compressed)
+            os.replace(temp_path, path)
+            stored_size = len(compressed)
+            
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO messages (key, gmail_id, mailbox, uid, arrived_at, size, stored_size) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, gmail_id, mailbox, uid, arrived_at, len(raw), stored_size)
+            )
+            self._db.commit()
+        return key
+        
+    def get(self, key):
+        """Get the raw bytes of an archived message"""
+        return read_object(self.root, key)
+        
+    def iter_entries(self, mailbox=None):
+        """
+        Yield index entries in the order they were archived
+        
+        Args:
+            mailbox: Only entries from this mailbox label (e.g. "default/INBOX")
+        """
+        last_rowid = 0
+        while True:
+            query = "SELECT rowid, key, gmail_id, mailbox, uid, arrived_at FROM messages WHERE rowid > ?"
+            params = [last_rowid]
+            if mailbox:
+                query += " AND mailbox = ?"
+                params.append(mailbox)
+            query += " ORDER BY rowid LIMIT ?"
+            params.append(ITER_PAGE_SIZE)
+            
+            with self._lock:
+                rows = self._db.execute(query, params).fetchall()
+            for rowid, key, gmail_id, mailbox_label, uid, arrived_at in rows:
+                yield {
+                    "key": key,
+                    "gmail_id": gmail_id,
+                    "mailbox": mailbox_label,
+                    "uid": uid,
+                    "arrived_at": arrived_at
+                }
+            if len(rows) < ITER_PAGE_SIZE:
+                break
+            last_rowid = rows[-1][0]
+    
+    def close(self):
+        """Close the index"""
+        with self._lock:
+            self._db.close()
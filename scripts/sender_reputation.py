@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Learned Sender Reputation
+
+This module keeps per-sender and per-domain counts of triage outcomes in
+the Supabase sender_stats table. Every LLM decision adds to them when
+gmail_sync stores (or ignores) the email, and so do recategorizations made
+in the inbox app. Once a sender's history is
+overwhelmingly one category, EmailTriageAgent takes that category without
+asking the LLM (the safeguards still apply). A domain's history is used for
+senders with too little history of their own, except for free-mail domains
+where one address says nothing about the next.
+
+Decisions made this way are counted per day in triage_savings (counted in
+memory and written by flush_savings); run this module to see how many LLM
+calls they removed.
+"""
+
+import time
+import threading
+import email.utils
+from datetime import date
+
+# Earlier emails needed before a sender's (or a domain's) history decides
+DEFAULT_MIN_SENDER_EMAILS = 10
+DEFAULT_MIN_DOMAIN_EMAILS = 30
+
+# Share of that history one category needs to decide
+DEFAULT_MIN_SHARE = 0.95
+
+# Seconds fetched statistics are reused before being read again
+STATS_TTL_SECONDS = 3600
+
+# Statistics kept in memory
+STATS_CACHE_SIZE = 20000
+
+# Domains shared by unrelated people, never judged as a whole
+FREEMAIL_DOMAINS = {
+    "gmail.com", "googlemail.com", "yahoo.com", "hotmail.com", "outlook.com", "live.com",
+    "msn.com", "aol.com", "icloud.com", "me.com", "protonmail.com", "proton.me", "comcast.net"
+}
+
+# triage_savings source of decisions made from sender reputation
+SAVINGS_SOURCE = "sender_reputation"
+
+# Reasoning of decisions taken from sender reputation
+REPUTATION_PREFIX = "Sender reputation:"
+
+TRIAGE_CATEGORIES = ("ignore", "notify", "respond")
+
+
+def sender_keys(sender):
+    """
+    Get the sender_stats keys of a sender
+    
+    Returns:
+        tuple: (address, "@domain"), or (None, None) without a usable address
+    """
+    address = (email.utils.parseaddr(sender or "")[1] or "").strip().lower()
+    if "@" not in address:
+        return None, None
+    return address, "@" + address.rsplit("@", 1)[1]
+
+
+class SenderReputation:
+    """Per-sender and per-domain triage history, read before the LLM is asked"""
+    
+    def __init__(self, supabase, min_sender_emails=DEFAULT_MIN_SENDER_EMAILS,
+                 min_domain_emails=DEFAULT_MIN_DOMAIN_EMAILS, min_share=DEFAULT_MIN_SHARE):
+        """
+        Create the reputation lookup
+        
+        Args:
+            supabase: Supabase client
+            min_sender_emails: Earlier emails from an address before its history decides
+            min_domain_emails: Earlier emails from a domain before its history decides
+            min_share: Share of the history one category needs to decide
+        """
+        self.supabase = supabase
+        self.min_sender_emails = min_sender_emails
+        self.min_domain_emails = min_domain_emails
+        self.min_share = min_share
+        self._lock = threading.Lock()
+        self._stats = {}
+        self.decided = 0
+        self.recorded = 0
+        self._unflushed_savings = 0
+        
+    def _get_stats(self, keys):
+        """Get {key: [ignore, notify, respond]} for keys, reading stale or unknown ones from Supabase"""
+        now = time.time()
+        with self._lock:
+            missing = [key for key in keys if key not in self._stats or now - self._stats[key][0] > STATS_TTL_SECONDS]
+            
+        if missing:
+            response = self.supabase.table("sender_stats").select(
+                "sender_key, ignore_count, notify_count, respond_count"
+            ).in_("sender_key", missing).execute()
+            fetched = {key: [0, 0, 0] for key in missing}
+            for row in response.data or []:
+                fetched[row["sender_key"]] = [row["ignore_count"], row["notify_count"], row["respond_count"]]
+            with self._lock:
+                if len(self._stats) + len(fetched) > STATS_CACHE_SIZE:
+                    self._stats.clear()
+                for key, counts in fetched.items():
+                    self._stats[key] = (now, counts)
+        
+        with self._lock:
+            return {key: list(self._stats[key][1]) for key in keys if key in self._stats}
+    
+    def _verdict(self, counts, minimum):
+        """Return (category, count, total) when one category dominates enough history"""
+        total = sum(counts)
+        if total < minimum:
+            return None
+        best = max(range(len(TRIAGE_CATEGORIES)), key=lambda index: counts[index])
+        if counts[best] < self.min_share * total:
+            return None
+        return TRIAGE_CATEGORIES[best], counts[best], total
+        
+    def lookup(self, sender):
+        """
+        Decide an email from its sender's history, if that history is overwhelming
+        
+        An address with enough history of its own is judged on it alone;
+        otherwise its domain's history is used (never for free-mail domains).
+        
+        Returns:
+            tuple: (category, reasoning), or None if the LLM has to decide
+        """
+        address, domain = sender_keys(sender)
+        if address is None:
+            return None
+            
+        try:
+            stats = self._get_stats([address, domain])
+        except Exception as e:
+            print(f"Error reading sender reputation for {address}: {e}")
+            return None
+            
+        sender_counts = stats.get(address, [0, 0, 0])
+        if sum(sender_counts) >= self.min_sender_emails:
+            verdict, source = self._verdict(sender_counts, self.min_sender_emails), address
+        elif domain[1:] not in FREEMAIL_DOMAINS:
+            verdict, source = self._verdict(stats.get(domain, [0, 0, 0]), self.min_domain_emails), domain
+        else:
+            verdict = None
+        if verdict is None:
+            return None
+            
+        category, count, total = verdict
+        with self._lock:
+            self.decided += 1
+            self._unflushed_savings += 1
+        return category, f"{REPUTATION_PREFIX} {count} of {total} earlier emails from {source} were triaged '{category}'."
+        
+    def record(self, sender, category, delta=1):
+        """
+        Add a triage outcome to the history of a sender and its domain
+        
+        Args:
+            sender: Email sender
+            category: ignore, notify or respond (anything else is not counted)
+            delta: Weight of the outcome (negative to withdraw one)
+            
+        Returns:
+            bool: True if the outcome was recorded
+        """
+        return self.record_many([(sender, category, delta)]) == 1
+        
+    def record_many(self, outcomes):
+        """
+        Add a batch of triage outcomes with one request
+        
+        Args:
+            outcomes: (sender, category, delta) tuples, as for record
+            
+        Returns:
+            int: Number of outcomes recorded (0 if the request failed)
+        """
+        rows = []
+        for sender, category, delta in outcomes:
+            address, domain = sender_keys(sender)
+            if address is not None and category in TRIAGE_CATEGORIES:
+                rows.append((address, domain, category, delta))
+        if not rows:
+            return 0
+        try:
+            self.supabase.rpc("record_sender_outcomes", {"outcomes": [
+                {"sender": address, "category": category, "delta": delta} for address, _, category, delta in rows
+            ]}).execute()
+        except Exception as e:
+            print(f"Error recording {len(rows)} sender outcomes: {e}")
+            return 0
+            
+        with self._lock:
+            self.recorded += len(rows)
+            # Keep this run's view current without reading the rows again
+            for address, domain, category, delta in rows:
+                index = TRIAGE_CATEGORIES.index(category)
+                for key in (address, domain):
+                    if key in self._stats:
+                        fetched_at, counts = self._stats[key]
+                        counts[index] = max(0, counts[index] + delta)
+        return len(rows)
+        
+    def flush_savings(self):
+        """Write the LLM calls avoided since the last flush to triage_savings with one request"""
+        with self._lock:
+            calls, self._unflushed_savings = self._unflushed_savings, 0
+        if not calls:
+            return
+        try:
+            self.supabase.rpc("record_triage_savings", {"source": SAVINGS_SOURCE, "calls": calls}).execute()
+        except Exception as e:
+            print(f"Error recording triage savings: {e}")
+            with self._lock:
+                self._unflushed_savings += calls
+
+
+def print_report(supabase, days=30):
+    """Print the LLM calls sender reputation removed per day"""
+    since = date.fromordinal(date.today().toordinal() - days + 1).isoformat()
+    response = supabase.table("triage_savings").select("day, calls_avoided").eq(
+        "source", SAVINGS_SOURCE
+    ).gte("day", since).order("day").execute()
+    rows = response.data or []
+    
+    print(f"LLM calls removed by sender reputation, last {days} days:")
+    for row in rows:
+        print(f"  {row['day']}: {row['calls_avoided']}")
+    total = sum(row["calls_avoided"] for row in rows)
+    print(f"Total: {total} ({total / days:.1f} per day)")
+
+
+def main():
+    import os
+    import argparse
+    from dotenv import load_dotenv
+    from supabase import create_client
+    
+    parser = argparse.ArgumentParser(description='Report the LLM calls removed by sender reputation')
+    parser.add_argument('--days', type=int, default=30, help='Number of days to report (default: 30)')
+    args = parser.parse_args()
+    
+    load_dotenv()
+    supabase = create_client(os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_KEY"))
+    print_report(supabase, args.days)
+
+
+if __name__ == "__main__":
+    main()
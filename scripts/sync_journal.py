@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Per-Message Sync Progress Journal
+
+This module records how far each fetched message got through a sync run:
+"fetched" when it comes off IMAP, "triaged" once it has a category, and
+"stored" once it is committed to the spool (which then owns the database
+write). After a crash, a restarted run re-fetches every message that never
+reached "stored" and reuses the recorded triage decision instead of calling
+the LLM again. Decisions for "stored" messages are kept for a while too, so
+mail that is never written to the database (ignored) is not re-triaged by
+every run that sees it.
+
+UIDs are only meaningful under their mailbox's UIDVALIDITY, so each entry
+records it and a run only resumes the UIDs of the current one.
+"""
+
+import os
+import time
+import sqlite3
+import threading
+
+# Entries are forgotten after this many days without progress
+DEFAULT_RETENTION_DAYS = 90
+
+
+class SyncJournal:
+    """SQLite journal of per-message sync progress"""
+    
+    def __init__(self, path):
+        """
+        Open (or create) the journal
+        
+        Args:
+            path: Path of the SQLite journal file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "gmail_id TEXT PRIMARY KEY, mailbox TEXT, uid INTEGER, stage TEXT NOT NULL, "
+            "category TEXT, triage_reasoning TEXT, updated_at REAL, uidvalidity INTEGER)"
+        )
+        # Journals from before entries had a UIDVALIDITY get the column (their entries keep NULL)
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(messages)")]
+        if "uidvalidity" not in columns:
+            self._db.execute("ALTER TABLE messages ADD COLUMN uidvalidity INTEGER")
+        self._db.execute("CREATE INDEX IF NOT EXISTS messages_mailbox_stage ON messages (mailbox, stage)")
+        self._db.commit()
+        
+    def record_fetched(self, mailbox, messages, uidvalidity=None):
+        """
+        Record messages as fetched (messages already triaged keep their stage)
+        
+        Args:
+            mailbox: Mailbox label (e.g. "default/INBOX")
+            messages: (gmail_id, uid) tuples
+            uidvalidity: UIDVALIDITY of the mailbox the UIDs belong to
+        """
+        now = time.time()
+        rows = [(gmail_id, mailbox, int(uid) if uid is not None else None, now, uidvalidity)
+                for gmail_id, uid in messages]
+        if not rows:
+            return
+        with self._lock:
+            self._db.executemany(
+                "INSERT INTO messages (gmail_id, mailbox, uid, stage, updated_at, uidvalidity) "
+                "VALUES (?, ?, ?, 'fetched', ?, ?) "
+                "ON CONFLICT (gmail_id) DO UPDATE SET mailbox = excluded.mailbox, uid = excluded.uid, "
+                "updated_at = excluded.updated_at, uidvalidity = excluded.uidvalidity",
+                rows
+            )
+            self._db.commit()
+    
+    def record_triaged(self, gmail_id, category, reasoning):
+        """Record the triage decision of a journaled message"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE messages SET stage = 'triaged', category = ?, triage_reasoning = ?, updated_at = ? "
+                "WHERE gmail_id = ? AND stage = 'fetched'",
+                (category, reasoning, time.time(), gmail_id)
+            )
+            self._db.commit()
+    
+    def record_stored(self, gmail_ids):
+        """Record journaled messages as handed over for storage"""
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "UPDATE messages SET stage = 'stored', updated_at = ? WHERE gmail_id = ?",
+                [(now, gmail_id) for gmail_id in gmail_ids]
+            )
+            self._db.commit()
+    
+    def get_decisions(self, gmail_ids):
+        """
+        Get the recorded triage decisions of messages
+        
+        Returns:
+            dict: gmail_id -> (category, reasoning) for messages that were triaged
+        """
+        decisions = {}
+        gmail_ids = list(gmail_ids)
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(gmail_ids), 500):
+                chunk = gmail_ids[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._db.execute(
+                    f"SELECT gmail_id, category, triage_reasoning FROM messages "
+                    f"WHERE gmail_id IN ({placeholders}) AND category IS NOT NULL", chunk
+                ).fetchall()
+                for gmail_id, category, reasoning in rows:
+                    decisions[gmail_id] = (category, reasoning)
+        return decisions
+        
+    def get_unfinished(self, mailbox, uidvalidity=None):
+        """
+        Get the UIDs of a mailbox's messages that were fetched but never stored
+        
+        Only entries recorded under `uidvalidity` count: after a UIDVALIDITY
+        change the old UIDs name other messages, or none.
+        
+        Returns:
+            list: UIDs in ascending order
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT uid FROM messages WHERE mailbox = ? AND uidvalidity IS ? AND stage != 'stored' "
+                "AND uid IS NOT NULL ORDER BY uid",
+                (mailbox, uidvalidity)
+            ).fetchall()
+        return [row[0] for row in rows]
+        
+    def prune(self, retention_days=DEFAULT_RETENTION_DAYS):
+        """
+        Forget entries that have not changed for `retention_days`
+        
+        Unfinished entries go too, so a message deleted from the server
+        before it could be re-fetched is not resumed forever.
+        
+        Returns:
+            int: Number of entries removed
+        """
+        with self._lock:
+            cursor = self._db.execute(
+                "DELETE FROM messages WHERE updated_at < ?",
+                (time.time() - retention_days * 86400,)
+            )
+            self._db.commit()
+        return cursor.rowcount
+        
+    def close(self):
+        """Close the underlying SQLite connection"""
+        with self._lock:
+            self._db.close()
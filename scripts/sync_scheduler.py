@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Adaptive Sync Scheduling
+
+This module chooses how long continuous_sync waits between sync cycles.
+Instead of a fixed interval, the wait follows the recent arrival rate: it
+shrinks towards the minimum while mail is pouring in (so bursts are picked
+up quickly) and grows towards the maximum while nothing arrives (so IMAP is
+not polled for nothing). Quiet hours pin the wait to the maximum, the last
+cycle's duration puts a floor under it, and random jitter keeps several
+workers from polling in lockstep.
+"""
+
+import random
+from datetime import datetime
+
+# Bounds of the wait between cycles, in seconds
+DEFAULT_MIN_INTERVAL = 60
+DEFAULT_MAX_INTERVAL = 1800
+
+# Aim for about this many new emails per cycle at the current arrival rate
+DEFAULT_TARGET_ARRIVALS = 2
+
+# Weight of the latest cycle in the smoothed arrival rate
+DEFAULT_RATE_SMOOTHING = 0.3
+
+# Wait at least this multiple of the last cycle's duration, so syncing never
+# takes more than about half of the time
+DEFAULT_DURATION_FACTOR = 1.0
+
+# Random +/- fraction applied to every interval
+DEFAULT_JITTER = 0.1
+
+
+def parse_quiet_hours(value):
+    """
+    Parse a quiet-hours range like "22-6" or "22:30-06:00"
+    
+    Returns:
+        tuple: (start_minute, end_minute) of the day, or None if value is empty
+    """
+    if not value:
+        return None
+        
+    def to_minutes(text):
+        hours, _, minutes = text.strip().partition(":")
+        return (int(hours) % 24) * 60 + int(minutes or 0)
+        
+    start, separator, end = value.partition("-")
+    if not separator:
+        raise ValueError(f"Quiet hours must look like 22-6 or 22:30-06:00, got {value!r}")
+    return to_minutes(start), to_minutes(end)
+
+
+class AdaptiveScheduler:
+    """Polling interval that follows the observed arrival rate"""
+    
+    def __init__(self, min_interval=DEFAULT_MIN_INTERVAL, max_interval=DEFAULT_MAX_INTERVAL,
+                 initial_interval=None, quiet_hours=None, jitter=DEFAULT_JITTER,
+                 target_arrivals=DEFAULT_TARGET_ARRIVALS, smoothing=DEFAULT_RATE_SMOOTHING,
+                 duration_factor=DEFAULT_DURATION_FACTOR):
+        """
+        Create a scheduler
+        
+        Args:
+            min_interval: Shortest wait between cycles, in seconds
+            max_interval: Longest wait between cycles, in seconds
+            initial_interval: Wait before the rate is known (default: max_interval)
+            quiet_hours: "HH[:MM]-HH[:MM]" local-time range that always waits max_interval
+            jitter: Random +/- fraction applied to every interval
+            target_arrivals: New emails per cycle to aim for at the current rate
+            smoothing: Weight of the latest cycle in the smoothed arrival rate (0-1)
+            duration_factor: Minimum wait as a multiple of the last cycle's duration
+        """
+        if min_interval <= 0 or max_interval < min_interval:
+            raise ValueError("Intervals must satisfy 0 < min_interval <= max_interval")
+            
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.initial_interval = initial_interval or max_interval
+        self.quiet_hours = parse_quiet_hours(quiet_hours)
+        self.jitter = jitter
+        self.target_arrivals = target_arrivals
+        self.smoothing = smoothing
+        self.duration_factor = duration_factor
+        
+        self.rate = None  # Smoothed arrivals per second
+        self.last_cycle_started = None
+        self.last_duration = 0.0
+        self.reason = "initial"
+        
+    def in_quiet_hours(self, now=None):
+        """Check whether a local time (default: now) falls inside the quiet hours"""
+        if self.quiet_hours is None:
+            return False
+        now = now or datetime.now()
+        minute = now.hour * 60 + now.minute
+        start, end = self.quiet_hours
+        if start <= end:
+            return start <= minute < end
+        # Range wraps past midnight
+        return minute >= start or minute < end
+        
+    def record_cycle(self, started_at, duration, found):
+        """
+        Record a finished sync cycle
+        
+        Args:
+            started_at: time.monotonic() when the cycle started
+            duration: Seconds the cycle took
+            found: New emails the cycle found (None if unknown)
+        """
+        if found is not None and self.last_cycle_started is not None:
+            # The cycle picked up what arrived since the previous cycle started
+            window = started_at - self.last_cycle_started
+            if window > 0:
+                observed = found / window
+                if self.rate is None:
+                    self.rate = observed
+                else:
+                    self.rate = self.smoothing * observed + (1 - self.smoothing) * self.rate
+        self.last_cycle_started = started_at
+        self.last_duration = duration
+        
+    def next_interval(self, now=None):
+        """
+        Choose the wait before the next cycle (also sets self.reason)
+        
+        Returns:
+            float: Seconds to wait
+        """
+        if self.in_quiet_hours(now):
+            interval = self.max_interval
+            self.reason = "quiet hours"
+        elif self.rate is None:
+            interval = self.initial_interval
+            self.reason = "initial"
+        elif self.rate <= 0:
+            interval = self.max_interval
+            self.reason = "no recent arrivals"
+        else:
+            interval = self.target_arrivals / self.rate
+            self.reason = f"arrival rate {self.rate * 3600:.1f}/h"
+            
+        duration_floor = self.last_duration * self.duration_factor
+        if duration_floor > interval:
+            interval = duration_floor
+            self.reason += f", last cycle took {self.last_duration:.0f}s"
+            
+        if self.jitter:
+            interval *= 1 + random.uniform(-self.jitter, self.jitter)
+        return min(self.max_interval, max(self.min_interval, interval))
@@ -0,0 +1,70 @@
+import os
+import sys
+
+import pytest
+
+# The scripts import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeQuery:
+    """The select queries the sync modules build, run over in-memory rows"""
+    
+    def __init__(self, supabase, table):
+        self.supabase = supabase
+        self.table = table
+        self.filters = []
+        self.sort = None
+        self.count = None
+        
+    def select(self, columns):
+        self.columns = [column.strip() for column in columns.split(",")]
+        return self
+        
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+        
+    def gt(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row[column] > value)
+        return self
+        
+    def like(self, column, pattern):
+        prefix = pattern.rstrip("%")
+        self.filters.append(lambda row: (row.get(column) or "").startswith(prefix))
+        return self
+        
+    def order(self, column):
+        self.sort = column
+        return self
+        
+    def limit(self, count):
+        self.count = count
+        return self
+        
+    def execute(self):
+        self.supabase.queries.append(self.table)
+        rows = [row for row in self.supabase.tables.get(self.table, []) if all(check(row) for check in self.filters)]
+        if self.sort:
+            rows.sort(key=lambda row: row[self.sort])
+        if self.count is not None:
+            rows = rows[:self.count]
+        data = [{column: row.get(column) for column in self.columns} for row in rows]
+        return type("Response", (), {"data": data})()
+
+
+class FakeSupabase:
+    """Supabase client stand-in holding each table as a list of row dicts"""
+    
+    def __init__(self, **tables):
+        self.tables = tables
+        self.queries = []
+        
+    def table(self, name):
+        return FakeQuery(self, name)
+
+
+@pytest.fixture
+def fake_supabase():
+    return FakeSupabase
@@ -0,0 +1,63 @@
+"""Chunked decoding and hashing of attachments"""
+
+import base64
+import quopri
+import hashlib
+from email.message import EmailMessage
+
+import pytest
+
+import attachments
+from attachments import extract_attachments
+
+
+def message_with(data, encoding, filename="report.pdf"):
+    msg = EmailMessage()
+    msg.set_content("See attached")
+    msg.add_attachment(data, maintype="application", subtype="octet-stream", filename=filename)
+    part = list(msg.iter_attachments())[0]
+    if encoding == "base64":
+        encoded = base64.encodebytes(data).decode("ascii")
+    else:
+        encoded = quopri.encodestring(data).decode("ascii")
+    part.set_payload(encoded)
+    del part["Content-Transfer-Encoding"]
+    part["Content-Transfer-Encoding"] = encoding
+    return msg
+
+
+@pytest.fixture(params=[7, 64, 77, 1000])
+def chunk_size(request, monkeypatch):
+    """Decode in chunks that split base64 groups, line breaks and =XX escapes"""
+    monkeypatch.setattr(attachments, "DECODE_CHUNK_SIZE", request.param)
+    return request.param
+
+
+@pytest.mark.parametrize("length", [0, 1, 2, 3, 100, 1001])
+def test_base64_chunk_boundaries(chunk_size, length):
+    data = bytes(range(256)) * (length // 256) + bytes(range(length % 256))
+    [attachment] = extract_attachments(message_with(data, "base64"))
+    assert attachment["size"] == len(data)
+    assert attachment["sha256"] == hashlib.sha256(data).hexdigest()
+
+
+@pytest.mark.parametrize("data", [
+    b"plain text attachment\n" * 40,
+    "café = naïve — résumé ".encode("utf-8") * 30,
+    b"x" * 300 + b"=" * 50 + b"\t \n",
+    bytes(range(256)) * 3,
+])
+def test_quoted_printable_chunk_boundaries(chunk_size, data):
+    [attachment] = extract_attachments(message_with(data, "quoted-printable"))
+    assert attachment["size"] == len(data)
+    assert attachment["sha256"] == hashlib.sha256(data).hexdigest()
+
+
+def test_attachment_metadata():
+    msg = message_with(b"%PDF-1.4", "base64")
+    msg.add_attachment(b"second", maintype="text", subtype="plain", filename="notes.txt")
+    described = extract_attachments(msg)
+    assert [(item["filename"], item["mime_type"]) for item in described] == [
+        ("report.pdf", "application/octet-stream"), ("notes.txt", "text/plain")
+    ]
+    assert described[0]["part_index"] < described[1]["part_index"]
@@ -0,0 +1,33 @@
+"""Local and server-side dedup lookups of DedupIndex"""
+
+from dedup_index import DedupIndex
+
+
+def test_filter_existing_checks_server_once_per_unknown_id(tmp_path, fake_supabase):
+    supabase = fake_supabase(emails=[{"id": 1, "gmail_id": "a"}, {"id": 2, "gmail_id": "b"}])
+    index = DedupIndex(supabase, str(tmp_path / "dedup.sqlite3"))
+    
+    assert index.filter_existing(["a", "c", None]) == {"a"}
+    assert len(supabase.queries) == 1
+    # "a" is now known locally, so only "b" and "c" go to the server
+    assert index.filter_existing(["a", "b", "c"]) == {"a", "b"}
+    assert len(index) == 2
+    
+    supabase.queries.clear()
+    assert index.filter_existing(["a", "b"]) == {"a", "b"}
+    assert supabase.queries == []
+
+
+def test_refresh_only_reads_new_rows(tmp_path, fake_supabase, monkeypatch):
+    monkeypatch.setattr("dedup_index.REFRESH_PAGE_SIZE", 2)
+    rows = [{"id": row_id, "gmail_id": f"m{row_id}"} for row_id in range(1, 6)]
+    supabase = fake_supabase(emails=rows)
+    path = str(tmp_path / "dedup.sqlite3")
+    
+    assert DedupIndex(supabase, path).refresh() == 5
+    rows.append({"id": 6, "gmail_id": "m6"})
+    index = DedupIndex(supabase, path)
+    assert index.refresh() == 1
+    assert len(index) == 6
+    
+    assert index.rebuild() == 6
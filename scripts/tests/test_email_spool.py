@@ -0,0 +1,82 @@
+"""Claiming, acknowledging and retrying entries of EmailSpool"""
+
+import sqlite3
+
+import email_spool
+from email_spool import EmailSpool
+
+
+def make_emails(count):
+    return [{"gmail_id": f"m{number}", "subject": f"Email {number}"} for number in range(count)]
+
+
+def test_failed_flush_is_replayed(tmp_path, monkeypatch):
+    spool = EmailSpool(str(tmp_path / "spool.sqlite3"))
+    spool.put(make_emails(3))
+    
+    claimed = spool.claim(10)
+    assert [email["gmail_id"] for _, email in claimed] == ["m0", "m1", "m2"]
+    assert spool.claim(10) == []
+    
+    # A failed write releases the entries, due again after the backoff
+    assert spool.retry([entry_id for entry_id, _ in claimed], "database unavailable") == 0
+    assert spool.claim(10) == []
+    assert 0 < spool.next_attempt_in() <= email_spool.SPOOL_BASE_BACKOFF
+    
+    now = email_spool.time.time()
+    monkeypatch.setattr(email_spool.time, "time", lambda: now + email_spool.SPOOL_BASE_BACKOFF + 1)
+    replayed = spool.claim(10)
+    assert [email for _, email in replayed] == make_emails(3)
+    spool.ack([entry_id for entry_id, _ in replayed])
+    assert spool.counts() == (0, 0)
+    assert spool.next_attempt_in() is None
+
+
+def test_claims_are_released_when_reopened(tmp_path):
+    path = str(tmp_path / "spool.sqlite3")
+    spool = EmailSpool(path)
+    spool.put(make_emails(2))
+    assert len(spool.claim(10)) == 2
+    spool.close()
+    
+    # The process that claimed them crashed before writing
+    assert len(EmailSpool(path).claim(10)) == 2
+
+
+def test_entries_die_after_max_attempts(tmp_path):
+    spool = EmailSpool(str(tmp_path / "spool.sqlite3"), max_attempts=2)
+    spool.put(make_emails(1))
+    entry_ids = [entry_id for entry_id, _ in spool.claim(10)]
+    assert spool.retry(entry_ids, "bad row") == 0
+    assert spool.retry(entry_ids, "bad row") == 1
+    assert spool.counts() == (0, 1)
+
+
+def test_sources_are_drained_separately(tmp_path):
+    spool = EmailSpool(str(tmp_path / "spool.sqlite3"))
+    spool.put(make_emails(2), source="work/INBOX")
+    spool.put(make_emails(1), source="home/INBOX")
+    
+    assert [email["gmail_id"] for _, email in spool.claim(10, source="home/INBOX")] == ["m0"]
+    assert spool.claim(10, source="home/INBOX") == []
+    assert spool.next_attempt_in("home/INBOX") is None
+    assert spool.counts("work/INBOX") == (2, 0)
+    # Without a source every entry is due
+    assert len(spool.claim(10)) == 2
+
+
+def test_spool_without_sources_is_upgraded(tmp_path):
+    path = str(tmp_path / "spool.sqlite3")
+    db = sqlite3.connect(path)
+    db.execute(
+        "CREATE TABLE spool (id INTEGER PRIMARY KEY AUTOINCREMENT, gmail_id TEXT, payload TEXT NOT NULL, "
+        "enqueued_at REAL, attempts INTEGER DEFAULT 0, next_attempt_at REAL DEFAULT 0, "
+        "claimed INTEGER DEFAULT 0, dead INTEGER DEFAULT 0, last_error TEXT)"
+    )
+    db.execute("INSERT INTO spool (gmail_id, payload, enqueued_at) VALUES ('old', '{\"gmail_id\": \"old\"}', 0)")
+    db.commit()
+    db.close()
+    
+    spool = EmailSpool(path)
+    assert spool.claim(10, source="home/INBOX") == []
+    assert [email for _, email in spool.claim(10)] == [{"gmail_id": "old"}]
@@ -0,0 +1,87 @@
+"""The warm Crew of EmailTriageAgent, with the LLM request replaced by a stub"""
+
+import os
+
+import pytest
+
+os.environ.setdefault("OTEL_SDK_DISABLED", "true")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+pytest.importorskip("crewai")
+
+from crewai.llm import LLM
+
+import email_triage_agent
+from email_triage_agent import EmailTriageAgent, LLM_PREFIX
+
+
+@pytest.fixture
+def prompts(monkeypatch):
+    """Record each prompt the LLM gets and answer with the subject it saw"""
+    seen = []
+    
+    def call(self, messages, tools=None, callbacks=None, available_functions=None):
+        prompt = messages[-1]["content"]
+        seen.append(prompt)
+        subject = prompt.split("Subject: ", 1)[1].split("\n", 1)[0]
+        return f"Thought: done\nFinal Answer: respond\nAnswered {subject}"
+        
+    monkeypatch.setattr(LLM, "call", call)
+    return seen
+
+
+def triage(agent, subject, body):
+    return agent.triage_email(subject, body, "pal@example.com", use_cache=False, use_reputation=False,
+                              use_classifier=False)
+
+
+def test_reused_crew_does_not_leak_the_previous_email(prompts):
+    agent = EmailTriageAgent()
+    crew = agent.crew
+    
+    first = triage(agent, "Lunch plans", "first body with {braces}")
+    second = triage(agent, "Quarterly numbers", "second body")
+    
+    assert agent.crew is crew
+    assert "first body with {braces}" in prompts[0]
+    assert "second body" in prompts[1]
+    assert "first body" not in prompts[1] and "Lunch plans" not in prompts[1]
+    assert "Answered Lunch plans" not in prompts[1]
+    assert first == ("respond", f"{LLM_PREFIX} Answered Lunch plans")
+    assert second == ("respond", f"{LLM_PREFIX} Answered Quarterly numbers")
+    assert agent.task.output.raw.endswith("Answered Quarterly numbers")
+    assert agent.llm_stats()["calls"] == 2
+
+
+def test_replay_log_is_only_replaced_on_the_pinned_release(prompts, monkeypatch):
+    assert isinstance(EmailTriageAgent(replay_log=False).crew._task_output_handler, email_triage_agent._NoReplayLog)
+    assert not isinstance(EmailTriageAgent(replay_log=True).crew._task_output_handler, email_triage_agent._NoReplayLog)
+    
+    monkeypatch.setattr(email_triage_agent.crewai, "__version__", "9.9.9")
+    assert not isinstance(EmailTriageAgent(replay_log=False).crew._task_output_handler, email_triage_agent._NoReplayLog)
+
+
+def test_other_release_notice_is_printed_once(prompts, monkeypatch, capsys):
+    monkeypatch.setattr(email_triage_agent.crewai, "__version__", "9.9.9")
+    monkeypatch.setattr(email_triage_agent, "_replay_log_notice_printed", False)
+    for _ in range(3):
+        EmailTriageAgent(replay_log=False)
+    assert capsys.readouterr().out.count("keeping its replay log") == 1
+
+
+def test_thread_is_looked_up_only_when_the_rules_do_not_decide(prompts):
+    agent = EmailTriageAgent()
+    lookups = []
+    
+    def lookup():
+        lookups.append(True)
+        return "ignore", "Earlier newsletter"
+        
+    category, _ = agent.triage_email("Re: Court hearing moved", "", "pal@example.com", thread_lookup=lookup)
+    assert category == "respond"
+    assert lookups == []
+    
+    category, reasoning = agent.triage_email("Re: Lunch plans", "", "pal@example.com", thread_lookup=lookup,
+                                             use_cache=False, use_reputation=False, use_classifier=False)
+    assert (category, lookups) == ("ignore", [True])
+    assert reasoning.startswith(email_triage_agent.THREAD_REUSE_PREFIX)
+    assert prompts == []
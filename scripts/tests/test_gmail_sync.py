@@ -0,0 +1,385 @@
+"""gmail_sync against stand-ins for Supabase and IMAP"""
+
+import os
+import email
+import email.policy
+import tempfile
+
+import pytest
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("GMAIL_EMAIL", "me@example.com")
+os.environ.setdefault("GMAIL_APP_PASSWORD", "test-password")
+os.environ.setdefault("SYNC_STATE_DIR", tempfile.mkdtemp(prefix="gmail-sync-state-"))
+os.environ.setdefault("OTEL_SDK_DISABLED", "true")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+pytest.importorskip("supabase")
+pytest.importorskip("crewai")
+
+import gmail_sync
+from attachments import AttachmentIndexer
+from dedup_index import DedupIndex
+from email_spool import EmailSpool
+from sync_journal import SyncJournal
+
+
+class FakeWrite:
+    """An upsert or RPC call, failing if any of its rows is marked bad"""
+    
+    def __init__(self, supabase, rows, respond):
+        self.supabase = supabase
+        self.rows = rows
+        self.respond = respond
+    
+    def execute(self):
+        self.supabase.requests.append([row.get("gmail_id") for row in self.rows])
+        if any(row.get("subject") == "bad" for row in self.rows):
+            raise ValueError("invalid row")
+        return type("Response", (), {"data": self.respond(self.rows)})()
+
+
+class FakeTable:
+    def __init__(self, supabase, name):
+        self.supabase = supabase
+        self.name = name
+    
+    def upsert(self, rows, on_conflict="gmail_id", ignore_duplicates=False):
+        stored = self.supabase.tables.setdefault(self.name, {})
+        columns = on_conflict.split(",")
+        
+        def key(row):
+            return row[columns[0]] if len(columns) == 1 else tuple(row[column] for column in columns)
+        
+        def respond(rows):
+            written = [row for row in rows if key(row) not in stored]
+            for row in written:
+                stored[key(row)] = dict(row)
+            return [dict(row) for row in written]
+        return FakeWrite(self.supabase, rows, respond)
+
+
+class FakeSupabase:
+    """Supabase client stand-in for the writes store_emails makes"""
+    
+    def __init__(self, emails=()):
+        self.tables = {"emails": {gmail_id: {"gmail_id": gmail_id} for gmail_id in emails}}
+        self.requests = []
+    
+    def table(self, name):
+        return FakeTable(self, name)
+    
+    def rpc(self, name, params):
+        stored = self.tables["emails"]
+        
+        def respond(rows):
+            updated = [row for row in rows if row["gmail_id"] in stored]
+            for row in updated:
+                stored[row["gmail_id"]].update(row)
+            return [{"gmail_id": row["gmail_id"]} for row in updated]
+        return FakeWrite(self, params["updates"], respond)
+
+
+@pytest.fixture
+def database(monkeypatch):
+    def install(emails=()):
+        supabase = FakeSupabase(emails)
+        monkeypatch.setattr(gmail_sync, "supabase", supabase)
+        monkeypatch.setattr(gmail_sync, "use_sender_reputation", False)
+        return supabase
+    return install
+
+
+def make_email(gmail_id, subject="Hello", category="notify", reprocessed=False):
+    return {
+        "gmail_id": gmail_id, "subject": subject, "sender": "pal@example.com", "recipient": "me@example.com",
+        "cc": "", "bcc": "", "body": "Body", "date": "2026-10-01T09:00:00+00:00", "category": category,
+        "triage_reasoning": "Rules", "reprocessed": reprocessed
+    }
+
+
+def test_bisection_isolates_bad_rows():
+    written_ids = []
+    
+    def write(rows):
+        if any(row["bad"] for row in rows):
+            raise ValueError("invalid row")
+        written_ids.extend(row["gmail_id"] for row in rows)
+        return type("Response", (), {"data": [{"gmail_id": row["gmail_id"]} for row in rows]})()
+    
+    rows = [{"gmail_id": f"m{number}", "bad": number == 5} for number in range(8)]
+    written, failures, requests = gmail_sync.write_email_rows(rows, write)
+    
+    assert written == {f"m{number}" for number in range(8) if number != 5}
+    assert [row["gmail_id"] for row, _ in failures] == ["m5"]
+    assert sorted(written_ids) == sorted(written)
+    # The full batch, then one failing and one passing half on each of three levels
+    assert requests == 7
+
+
+def test_new_emails_are_stored_in_batches(database):
+    supabase = database(emails=["m1"])
+    emails = [make_email(f"m{number}") for number in range(5)] + [make_email("m5", category="ignore")]
+    
+    assert gmail_sync.store_emails(emails, batch_size=2) == (4, 1, 0, 1)
+    assert supabase.requests == [["m0", "m1"], ["m2", "m3"], ["m4"]]
+    assert [email["store_status"] for email in emails] == ["stored", "skipped", "stored", "stored", "stored", "ignored"]
+    assert set(supabase.tables["emails"]) == {"m0", "m1", "m2", "m3", "m4"}
+
+
+def test_bad_row_fails_alone(database):
+    supabase = database()
+    emails = [make_email("m0"), make_email("m1", subject="bad"), make_email("m2"), make_email("m3")]
+    
+    assert gmail_sync.store_emails(emails, batch_size=4) == (3, 0, 1, 0)
+    assert [email["store_status"] for email in emails] == ["stored", "failed", "stored", "stored"]
+    assert supabase.requests[0] == ["m0", "m1", "m2", "m3"]
+
+
+def test_reprocessed_emails_only_update_stored_rows(database):
+    supabase = database(emails=["m0"])
+    emails = [make_email("m0", category="respond", reprocessed=True),
+              make_email("m1", category="respond", reprocessed=True)]
+    
+    assert gmail_sync.store_emails(emails, reprocess_all=True) == (0, 0, 1, 0, 1)
+    assert [email["store_status"] for email in emails] == ["updated", "failed"]
+    assert supabase.tables["emails"]["m0"]["category"] == "respond"
+    assert "m1" not in supabase.tables["emails"]
+
+
+class FakeImap:
+    """IMAP connection stand-in serving a mailbox of numbered messages"""
+    
+    capabilities = ()
+    
+    def __init__(self, uids):
+        self.messages = {uid: make_raw(uid) for uid in uids}
+        # FETCH commands asking for `failing_items` fail for these UIDs, leave out `dropped` ones
+        # or cut the response short at `truncated` ones
+        self.failing = set()
+        self.dropped = set()
+        self.truncated = set()
+        self.failing_items = ""
+        self.uidvalidity = 7
+        
+    def status(self, mailbox, items):
+        return "OK", [b'"INBOX" (UIDVALIDITY %d UIDNEXT %d)' % (self.uidvalidity, max(self.messages) + 1)]
+        
+    def select(self, mailbox, readonly=False):
+        return "OK", [str(len(self.messages)).encode()]
+        
+    def close(self):
+        return "OK", []
+        
+    def response(self, code):
+        return code, [str(self.uidvalidity).encode()]
+        
+    def uid(self, command, *args):
+        if command == "search":
+            first = int(args[1].split()[1].split(":")[0]) if args[1].startswith("UID ") else 1
+            return "OK", [b" ".join(str(uid).encode() for uid in sorted(self.messages) if uid >= first)]
+        uids = [int(uid) for uid in args[0].split(b",")]
+        items = args[1]
+        if self.failing_items in items:
+            if self.failing & set(uids):
+                return "NO", [b"Server unavailable"]
+            uids = [uid for uid in uids if uid not in self.dropped]
+        response = []
+        for seq, uid in enumerate(uids, 1):
+            if self.failing_items in items and uid in self.truncated:
+                response.append(b'%d (UID %d ENVELOPE ("Email' % (seq, uid))
+                break
+            raw = self.messages[uid]
+            header, body = raw.split(b"\r\n\r\n", 1)
+            if "HEADER.FIELDS" in items:
+                header += b"\r\n\r\n"
+                structure = b' BODYSTRUCTURE ("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" %d 1)' % len(body)
+                response.append((b'%d (UID %d INTERNALDATE "01-Oct-2026 09:00:00 +0000" RFC822.SIZE %d%s '
+                                 b'BODY[HEADER.FIELDS (%s)] {%d}' % (
+                                     seq, uid, len(raw), structure if "BODYSTRUCTURE" in items else b"",
+                                     gmail_sync.HEADER_FIELDS.encode(), len(header)), header))
+            elif "BODY.PEEK[1]" in items:
+                response.append((b'%d (UID %d BODY[1]<0> {%d}' % (seq, uid, len(body)), body))
+            else:
+                response.append((b'%d (UID %d INTERNALDATE "01-Oct-2026 09:00:00 +0000" BODY[] {%d}' % (
+                    seq, uid, len(raw)), raw))
+            response.append(b")")
+        return "OK", response
+
+
+class FakePool:
+    def __init__(self, mail):
+        self.mail = mail
+        
+    def acquire(self, account):
+        return self.mail
+        
+    def release(self, mail, discard=False):
+        pass
+
+
+def make_raw(uid):
+    return (f"Message-ID: <m{uid}@example.com>\r\nFrom: pal@example.com\r\nTo: me@example.com\r\n"
+            f"Subject: Email {uid}\r\nDate: Thu, 01 Oct 2026 09:00:00 +0000\r\n\r\nBody {uid}\r\n").encode()
+
+
+@pytest.fixture
+def mailbox(database, fake_supabase, tmp_path, monkeypatch):
+    """Serve messages over a stand-in IMAP connection, with local state in tmp_path"""
+    def install(uids):
+        mail = FakeImap(uids)
+        database()
+        monkeypatch.setattr(gmail_sync, "imap_pool", FakePool(mail))
+        monkeypatch.setattr(gmail_sync, "dedup_index", DedupIndex(fake_supabase(emails=[]), str(tmp_path / "dedup.sqlite3")))
+        monkeypatch.setattr(gmail_sync, "sync_journal", SyncJournal(str(tmp_path / "journal.sqlite3")))
+        monkeypatch.setattr(gmail_sync, "email_spool", EmailSpool(str(tmp_path / "spool.sqlite3")))
+        monkeypatch.setattr(gmail_sync, "update_sync_checkpoint", lambda checkpoint: None)
+        monkeypatch.setattr(gmail_sync, "raw_archive", None)
+        monkeypatch.setattr(gmail_sync, "attachment_indexer", None)
+        return mail
+    return install
+
+
+def triaged(emails):
+    for email_obj in emails:
+        email_obj["category"] = email_obj["category"] or "notify"
+        email_obj["triage_reasoning"] = email_obj["triage_reasoning"] or "Rules"
+        yield email_obj
+
+
+def sync_checkpoint(checkpoint, **options):
+    return gmail_sync.run_pipeline(
+        triaged(gmail_sync.iter_emails(checkpoint=checkpoint, batch_size=2, **options)), checkpoint=checkpoint
+    )
+
+
+def test_failed_fetch_keeps_the_checkpoint_below_it(mailbox):
+    mail = mailbox(range(1, 7))
+    mail.failing = {3}
+    checkpoint = {"mailbox": "INBOX", "uidvalidity": 7, "last_uid": 0, "highest_modseq": None}
+    
+    assert sync_checkpoint(checkpoint)["imported"] == 4
+    assert checkpoint["failed_uid"] == 3
+    assert checkpoint["last_uid"] == 2
+    
+    # The next run fetches the failed batch again; what was stored is skipped
+    mail.failing.clear()
+    checkpoint = {"mailbox": "INBOX", "uidvalidity": 7, "last_uid": 2, "highest_modseq": None}
+    assert sync_checkpoint(checkpoint)["imported"] == 2
+    assert checkpoint["last_uid"] == 6
+    assert "failed_uid" not in checkpoint
+
+
+def test_checkpoint_only_covers_handled_messages(mailbox, monkeypatch):
+    mailbox(range(1, 7))
+    parse_email = gmail_sync.parse_email
+    
+    def parse_or_fail(msg, message_id, body):
+        if msg["Subject"] == "Email 4":
+            raise ValueError("unparseable")
+        return parse_email(msg, message_id, body)
+    monkeypatch.setattr(gmail_sync, "parse_email", parse_or_fail)
+    checkpoint = {"mailbox": "INBOX", "uidvalidity": 7, "last_uid": 0, "highest_modseq": None}
+    
+    # UID 4 was fetched with UID 3, but the scan ends before it is handed on
+    assert sync_checkpoint(checkpoint)["imported"] == 3
+    assert checkpoint["scanned_uid"] == 3
+    assert checkpoint["last_uid"] == 3
+
+
+def test_limit_takes_the_oldest_uids_above_the_checkpoint(mailbox):
+    mailbox(range(1, 7))
+    checkpoint = {"mailbox": "INBOX", "uidvalidity": 7, "last_uid": 1, "highest_modseq": None}
+    
+    assert sync_checkpoint(checkpoint, limit=3)["imported"] == 3
+    assert checkpoint["last_uid"] == 4
+
+
+@pytest.mark.parametrize("failing, dropped, truncated, stored", [
+    ({3}, set(), set(), 2), (set(), {4}, set(), 3), (set(), set(), {4}, 2)
+])
+def test_missing_text_parts_are_fetched_again(mailbox, failing, dropped, truncated, stored):
+    mail = mailbox(range(1, 5))
+    mail.failing, mail.dropped, mail.truncated = failing, dropped, truncated
+    mail.failing_items = "BODY.PEEK[1]"
+    checkpoint = {"mailbox": "INBOX", "uidvalidity": 7, "last_uid": 0, "highest_modseq": None}
+    
+    assert sync_checkpoint(checkpoint, fetch_mode="parts")["imported"] == stored
+    assert checkpoint["last_uid"] == stored
+    assert all(row["body"] for row in gmail_sync.supabase.tables["emails"].values())
+    assert gmail_sync.sync_journal.get_unfinished("default/INBOX", 7) == list(range(stored + 1, 5))
+
+
+def test_failed_full_download_after_header_pretriage(mailbox):
+    mail = mailbox(range(1, 5))
+    mail.failing, mail.failing_items = {3}, "BODY.PEEK[]"
+    checkpoint = {"mailbox": "INBOX", "uidvalidity": 7, "last_uid": 0, "highest_modseq": None}
+    
+    assert sync_checkpoint(checkpoint, header_pretriage=True)["imported"] == 2
+    assert checkpoint["last_uid"] == 2
+    assert all(row["body"] for row in gmail_sync.supabase.tables["emails"].values())
+
+
+def test_truncated_header_fetch_fails_its_batch(mailbox):
+    mail = mailbox(range(1, 7))
+    mail.truncated, mail.failing_items = {4}, "HEADER.FIELDS"
+    checkpoint = {"mailbox": "INBOX", "uidvalidity": 7, "last_uid": 0, "highest_modseq": None}
+    
+    assert sync_checkpoint(checkpoint, fetch_mode="parts", header_pretriage=True)["imported"] == 4
+    assert checkpoint["failed_uid"] == 3
+    assert checkpoint["last_uid"] == 2
+
+
+def test_pipeline_drains_only_its_own_mailbox(mailbox):
+    mailbox(range(1, 3))
+    gmail_sync.email_spool.put([make_email("other")], source="work/INBOX")
+    checkpoint = {"mailbox": "INBOX", "uidvalidity": 7, "last_uid": 0, "highest_modseq": None}
+    
+    results = gmail_sync.run_pipeline(triaged(gmail_sync.iter_emails(checkpoint=checkpoint)),
+                                      checkpoint=checkpoint, spool_key="default/INBOX")
+    assert results["imported"] == 2
+    assert results["spooled"] == 0
+    assert "other" not in gmail_sync.supabase.tables["emails"]
+    assert gmail_sync.email_spool.counts("work/INBOX") == (1, 0)
+
+
+def test_attachments_are_only_written_for_stored_emails(mailbox, monkeypatch):
+    mail = mailbox(range(1, 3))
+    for uid in (1, 2):
+        msg = email.message_from_bytes(mail.messages[uid], policy=email.policy.default)
+        msg.add_attachment(b"%PDF-1.4 report", maintype="application", subtype="pdf", filename="report.pdf")
+        mail.messages[uid] = msg.as_bytes(policy=email.policy.SMTP)
+    indexer = AttachmentIndexer(gmail_sync.supabase)
+    monkeypatch.setattr(gmail_sync, "attachment_indexer", indexer)
+    
+    def triage(emails):
+        for email_obj in triaged(emails):
+            if email_obj["subject"] == "Email 2":
+                email_obj["category"] = "ignore"
+            yield email_obj
+    
+    gmail_sync.run_pipeline(triage(gmail_sync.iter_emails(unread_only=False)))
+    indexer.close()
+    assert list(gmail_sync.supabase.tables["email_attachments"]) == [("m1@example.com", 1)]
+    assert len(gmail_sync.supabase.tables["attachment_blobs"]) == 1
+
+
+def test_generated_ids_are_stable_across_fetches(mailbox):
+    mail = mailbox(range(1, 3))
+    for uid in (1, 2):
+        mail.messages[uid] = mail.messages[uid].replace(b"Message-ID: <m%d@example.com>\r\n" % uid, b"")
+    
+    assert gmail_sync.run_pipeline(triaged(gmail_sync.iter_emails(unread_only=False)))["imported"] == 2
+    assert gmail_sync.run_pipeline(triaged(gmail_sync.iter_emails(unread_only=False)))["found"] == 0
+    
+    # The same UIDs under a new UIDVALIDITY are different messages
+    mail.uidvalidity = 8
+    assert gmail_sync.run_pipeline(triaged(gmail_sync.iter_emails(unread_only=False)))["imported"] == 2
+
+
+def test_unfinished_uids_of_an_old_uidvalidity_are_not_resumed(mailbox):
+    mailbox(range(1, 3))
+    gmail_sync.sync_journal.record_fetched("default/INBOX", [("old", 5)], uidvalidity=6)
+    gmail_sync.sync_journal.record_fetched("default/INBOX", [("m2@example.com", 2)], uidvalidity=7)
+    
+    assert gmail_sync.add_unfinished_uids([b"1"], "default/INBOX", 7) == [b"1", b"2"]
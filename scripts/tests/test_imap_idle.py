@@ -0,0 +1,101 @@
+"""IDLE and NOOP handling of push mode against a local IMAP stand-in"""
+
+import time
+import imaplib
+import threading
+import socketserver
+
+import pytest
+
+from imap_idle import idle_wait, noop_new_mail
+
+
+class StandInHandler(socketserver.StreamRequestHandler):
+    """Just enough IMAP for push mode: LOGIN, SELECT, NOOP, IDLE and LOGOUT"""
+    
+    def send(self, *lines):
+        self.wfile.write(b"".join(line + b"\r\n" for line in lines))
+        self.wfile.flush()
+        
+    def handle(self):
+        server = self.server
+        self.send(b"* OK [CAPABILITY IMAP4rev1 IDLE] stand-in ready")
+        for line in self.rfile:
+            tag, command = line.split()[:2]
+            command = command.upper()
+            if command == b"CAPABILITY":
+                self.send(b"* CAPABILITY IMAP4rev1 IDLE", tag + b" OK CAPABILITY completed")
+            elif command == b"LOGIN":
+                self.send(tag + b" OK LOGIN completed")
+            elif command == b"SELECT" or command == b"EXAMINE":
+                self.send(b"* 2 EXISTS", b"* FLAGS ()", tag + b" OK [READ-ONLY] selected")
+            elif command == b"NOOP":
+                self.send(*server.noop_untagged, tag + b" OK NOOP completed")
+                server.noop_untagged = []
+            elif command == b"IDLE":
+                if server.idle_mode == "same-packet":
+                    # The notification arrives with the continuation, so readline buffers it
+                    self.send(b"+ idling", b"* 3 EXISTS")
+                else:
+                    self.send(b"+ idling")
+                    if server.idle_mode == "notify":
+                        time.sleep(0.1)
+                        self.send(b"* 3 EXISTS")
+                self.rfile.readline()  # DONE
+                self.send(tag + b" OK IDLE terminated")
+            elif command == b"LOGOUT":
+                self.send(b"* BYE logging out", tag + b" OK LOGOUT completed")
+                return
+            else:
+                self.send(tag + b" BAD unknown command")
+
+
+@pytest.fixture
+def imap_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), StandInHandler)
+    server.daemon_threads = True
+    server.idle_mode = "quiet"
+    server.noop_untagged = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def mail(imap_server):
+    connection = imaplib.IMAP4("127.0.0.1", imap_server.server_address[1])
+    connection.login("user", "password")
+    connection.select("INBOX", readonly=True)
+    yield connection
+    connection.logout()
+
+
+def test_idle_wait_reports_exists(imap_server, mail):
+    imap_server.idle_mode = "notify"
+    started = time.monotonic()
+    assert idle_wait(mail, 5) is True
+    assert time.monotonic() - started < 2
+
+
+def test_idle_wait_times_out_without_mail(imap_server, mail):
+    imap_server.idle_mode = "quiet"
+    started = time.monotonic()
+    assert idle_wait(mail, 0.3) is False
+    assert time.monotonic() - started < 2
+    # The connection is still usable after ending the IDLE
+    assert mail.noop()[0] == "OK"
+
+
+def test_idle_wait_sees_notification_already_buffered(imap_server, mail):
+    imap_server.idle_mode = "same-packet"
+    started = time.monotonic()
+    assert idle_wait(mail, 5) is True
+    assert time.monotonic() - started < 2
+
+
+def test_noop_reports_mail_that_arrived_between_idles(imap_server, mail):
+    imap_server.noop_untagged = [b"* 4 EXISTS", b"* 1 RECENT"]
+    assert noop_new_mail(mail) is True
+    assert noop_new_mail(mail) is False
@@ -0,0 +1,90 @@
+"""The FETCH tokenizer and BODYSTRUCTURE helpers of imap_parts"""
+
+import base64
+
+import pytest
+
+from imap_parts import (_join_responses, decode_part, get_section, parse_bodystructure, parse_fetch_response,
+                        select_text_parts)
+
+
+def test_literals_are_joined_per_message():
+    msg_data = [
+        (b'1 (UID 5 BODY[HEADER] {9}', b"Subject:\r\n"[:9]),
+        b" FLAGS (\\Seen))",
+        (b'2 (UID 6 BODY[1]<0> {5}', b"Hi ()"),
+        b")",
+        b'3 (UID 7 FLAGS ())',
+    ]
+    responses = list(_join_responses(msg_data))
+    assert responses == [b'1 (UID 5 BODY[HEADER] {9}Subject:\r FLAGS (\\Seen))',
+                         b'2 (UID 6 BODY[1]<0> {5}Hi ())', b'3 (UID 7 FLAGS ())']
+    
+    messages = parse_fetch_response(msg_data)
+    assert messages[0] == {"UID": b"5", "BODY[HEADER]": b"Subject:\r", "FLAGS": [b"\\Seen"]}
+    assert get_section(messages[1], "1") == b"Hi ()"
+    assert messages[2]["FLAGS"] == []
+
+
+def test_quoted_strings_and_nil():
+    message, = parse_fetch_response([b'1 (UID 5 ENVELOPE ("a \\"quoted\\" \\\\ word" NIL))'])
+    assert message["ENVELOPE"] == [b'a "quoted" \\ word', None]
+
+
+@pytest.mark.parametrize("msg_data", [
+    [b'1 (UID 5 ENVELOPE ("abc)'],
+    [b'1 (UID 5 ENVELOPE ("abc\\'],
+    [b'1 (UID 5 BODY[1] {12'],
+    [(b'1 (UID 5 BODY[1] {12}', b"short")],
+    [b'1 (UID 5 FLAGS (\\Seen)'],
+])
+def test_malformed_responses_are_rejected(msg_data):
+    with pytest.raises(ValueError):
+        parse_fetch_response(msg_data)
+
+
+def test_nested_multipart_sections():
+    message, = parse_fetch_response([
+        b'1 (UID 9 BODYSTRUCTURE ((("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 12 1 NIL NIL NIL)'
+        b'("TEXT" "HTML" ("CHARSET" "utf-8") NIL NIL "QUOTED-PRINTABLE" 40 2 NIL NIL NIL) "ALTERNATIVE")'
+        b'("APPLICATION" "PDF" ("NAME" "a.pdf") NIL NIL "BASE64" 5000 NIL ("ATTACHMENT" ("FILENAME" "a.pdf")) NIL)'
+        b'("MESSAGE" "RFC822" NIL NIL NIL "7BIT" 300 NIL NIL 10 NIL NIL NIL) "MIXED"))'
+    ])
+    parts = parse_bodystructure(message["BODYSTRUCTURE"])
+    assert [(part["section"], part["type"], part["subtype"]) for part in parts] == [
+        ("1.1", "text", "plain"), ("1.2", "text", "html"), ("2", "application", "pdf"), ("3", "message", "rfc822")
+    ]
+    assert parts[1]["encoding"] == "quoted-printable"
+    assert parts[2]["disposition"] == "attachment"
+    assert parts[0]["params"] == {"charset": "utf-8"}
+    assert [part["section"] for part in select_text_parts(parts)] == ["1.1"]
+
+
+def test_single_part_body_is_section_one():
+    parts = parse_bodystructure([b"TEXT", b"PLAIN", None, None, None, b"7BIT", b"10", b"1"])
+    assert parts[0]["section"] == "1"
+    assert parts[0]["size"] == 10
+
+
+def test_html_is_selected_without_plain_text():
+    parts = [
+        {"section": "1", "type": "text", "subtype": "html", "disposition": ""},
+        {"section": "2", "type": "text", "subtype": "plain", "disposition": "attachment"},
+    ]
+    assert [part["section"] for part in select_text_parts(parts)] == ["1"]
+
+
+def test_base64_cut_at_a_byte_cap():
+    text = "Grüße aus Köln, " * 20
+    encoded = base64.encodebytes(text.encode("utf-8"))
+    part = {"encoding": "base64", "params": {"charset": "utf-8"}}
+    # Both caps end inside a 4-character group, one of them past a line break
+    for cap in (103, 50):
+        decoded = decode_part(encoded[:cap], part)
+        assert decoded and text.startswith(decoded)
+    assert decode_part(encoded, part) == text
+
+
+def test_quoted_printable_and_unknown_charset():
+    assert decode_part(b"caf=C3=A9", {"encoding": "quoted-printable", "params": {"charset": "utf-8"}}) == "café"
+    assert decode_part(b"caf\xe9", {"encoding": "7bit", "params": {"charset": "x-unknown"}}) == "café"
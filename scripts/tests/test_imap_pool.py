@@ -0,0 +1,85 @@
+"""Connection reuse and the per-server cap of ImapConnectionPool"""
+
+import threading
+
+import pytest
+
+from imap_pool import ImapConnectionPool
+
+
+class FakeConnection:
+    def __init__(self, account):
+        self.account = account
+        self.stale = False
+        self.logged_out = False
+        
+    def noop(self):
+        if self.stale:
+            raise OSError("connection reset")
+        
+    def logout(self):
+        self.logged_out = True
+
+
+ALICE = {"host": "imap.example.com", "email": "alice@example.com"}
+BOB = {"host": "imap.example.com", "email": "bob@example.com"}
+
+
+@pytest.fixture
+def opened():
+    return []
+
+
+@pytest.fixture
+def pool(opened):
+    def connect(account):
+        connection = FakeConnection(account)
+        opened.append(connection)
+        return connection
+    return ImapConnectionPool(connect, max_connections_per_server=2)
+
+
+def test_released_connections_are_reused(pool, opened):
+    with pool.connection(ALICE) as first:
+        pass
+    with pool.connection(ALICE) as second:
+        assert second is first
+    assert len(opened) == 1
+
+
+def test_stale_connection_is_replaced(pool, opened):
+    connection = pool.acquire(ALICE)
+    pool.release(connection)
+    connection.stale = True
+    assert pool.acquire(ALICE) is not connection
+    assert connection.logged_out
+    assert len(opened) == 2
+
+
+def test_cap_evicts_idle_connections_of_other_accounts(pool, opened):
+    held = pool.acquire(ALICE)
+    pool.release(pool.acquire(ALICE))
+    bob = pool.acquire(BOB)
+    # Alice's idle connection made room, so the server never saw a third
+    assert opened[1].logged_out
+    assert bob.account is BOB
+    
+    waiting = threading.Thread(target=lambda: pool.release(pool.acquire(BOB)))
+    waiting.start()
+    waiting.join(0.2)
+    assert waiting.is_alive()
+    pool.release(held)
+    waiting.join(2)
+    assert not waiting.is_alive()
+    # Bob got a new connection in place of the one Alice released
+    assert opened[0].logged_out
+    assert opened[3].account is BOB
+
+
+def test_error_inside_connection_discards_it(pool, opened):
+    with pytest.raises(RuntimeError):
+        with pool.connection(ALICE):
+            raise RuntimeError("protocol error")
+    assert opened[0].logged_out
+    pool.close_all()
+    assert pool.acquire(ALICE) is not opened[0]
@@ -0,0 +1,41 @@
+"""Request and token budgets of RateLimiter, on a simulated clock"""
+
+import pytest
+
+import rate_limiter
+from rate_limiter import RateLimiter, estimate_tokens
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replace monotonic time and sleep with a clock that only moves when slept on"""
+    now = [1000.0]
+    monkeypatch.setattr(rate_limiter.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(rate_limiter.time, "sleep", lambda seconds: now.__setitem__(0, now[0] + seconds))
+    return now
+
+
+def test_requests_per_minute(clock):
+    limiter = RateLimiter(requests_per_minute=60)
+    # The bucket starts full
+    assert all(limiter.acquire() == 0 for _ in range(60))
+    assert limiter.acquire() == pytest.approx(1.0)
+    assert limiter.total_requests == 61
+
+
+def test_tokens_per_minute(clock):
+    limiter = RateLimiter(tokens_per_minute=1000)
+    assert limiter.acquire(800) == 0
+    assert limiter.acquire(500) == pytest.approx(18.0)
+    # A request larger than the whole budget waits for a full bucket, not forever
+    assert limiter.acquire(5000) == pytest.approx(60.0)
+
+
+def test_no_limits(clock):
+    limiter = RateLimiter()
+    assert sum(limiter.acquire(10 ** 6) for _ in range(1000)) == 0
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("x" * 400) == 100
+    assert estimate_tokens(None) == 0
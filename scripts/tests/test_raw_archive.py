@@ -0,0 +1,46 @@
+"""Storing and replaying messages of RawArchive"""
+
+import os
+import hashlib
+
+import pytest
+
+pytest.importorskip("zstandard")
+
+from raw_archive import RawArchive, load_archived, object_path
+
+
+def raw_message(number):
+    return (f"Message-ID: <m{number}@example.com>\r\nFrom: Sender <sender@example.com>\r\n"
+            f"To: me@example.com\r\nSubject: Message {number}\r\nDate: Mon, 1 Jan 2024 10:00:00 +0000\r\n"
+            f"\r\nBody of message {number}\r\n").encode("ascii")
+
+
+def test_put_is_content_addressed(tmp_path):
+    archive = RawArchive(str(tmp_path))
+    key = archive.put(raw_message(1), gmail_id="m1", mailbox="default/INBOX", uid=1)
+    assert key == hashlib.sha256(raw_message(1)).hexdigest()
+    assert key in archive
+    assert os.path.exists(object_path(str(tmp_path), key))
+    assert archive.get(key) == raw_message(1)
+    
+    assert archive.put(raw_message(1), gmail_id="m1", mailbox="default/INBOX", uid=1) == key
+    assert len(archive) == 1
+    assert not any(name.endswith(".tmp") for _, _, names in os.walk(tmp_path) for name in names)
+
+
+def test_entries_replay_in_archive_order(tmp_path, monkeypatch):
+    monkeypatch.setattr("raw_archive.ITER_PAGE_SIZE", 2)
+    archive = RawArchive(str(tmp_path))
+    for number in range(5):
+        archive.put(raw_message(number), gmail_id=f"m{number}",
+                    mailbox="default/INBOX" if number % 2 else "work/INBOX", uid=number, arrived_at=100.0 + number)
+    
+    entries = list(archive.iter_entries())
+    assert [entry["gmail_id"] for entry in entries] == ["m0", "m1", "m2", "m3", "m4"]
+    assert [entry["uid"] for entry in archive.iter_entries(mailbox="default/INBOX")] == [1, 3]
+    
+    emails = load_archived(str(tmp_path), entries[:2] + [dict(entries[2], key="0" * 64)])
+    assert [(email["gmail_id"], email["subject"], email["uid"], email["arrived_at"]) for email in emails] == [
+        ("m0", "Message 0", 0, 100.0), ("m1", "Message 1", 1, 101.0)
+    ]
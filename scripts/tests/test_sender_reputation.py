@@ -0,0 +1,132 @@
+"""Thresholds, domain fallback and the Supabase writes of SenderReputation"""
+
+import pytest
+
+from sender_reputation import FREEMAIL_DOMAINS, REPUTATION_PREFIX, SAVINGS_SOURCE, SenderReputation
+
+
+class FakeQuery:
+    def __init__(self, supabase, result):
+        self.supabase = supabase
+        self.result = result
+    
+    def select(self, columns):
+        return self
+    
+    def in_(self, column, keys):
+        self.result = lambda: [row for key, row in self.supabase.stats.items() if key in keys]
+        return self
+    
+    def execute(self):
+        return type("Response", (), {"data": self.result()})()
+
+
+class FakeSupabase:
+    """sender_stats rows keyed by sender_key, and the RPC calls made"""
+    
+    def __init__(self):
+        self.stats = {}
+        self.calls = []
+        self.failing = False
+    
+    def add(self, key, ignore=0, notify=0, respond=0):
+        self.stats[key] = {"sender_key": key, "ignore_count": ignore, "notify_count": notify, "respond_count": respond}
+    
+    def table(self, name):
+        return FakeQuery(self, lambda: [])
+    
+    def rpc(self, name, params):
+        def respond():
+            if self.failing:
+                raise ConnectionError("Supabase unavailable")
+            self.calls.append((name, params))
+            return []
+        return FakeQuery(self, respond)
+
+
+@pytest.fixture
+def supabase():
+    return FakeSupabase()
+
+
+def test_sender_needs_enough_emails_and_share(supabase):
+    reputation = SenderReputation(supabase, min_sender_emails=10, min_share=0.95)
+    supabase.add("few@shop.example", ignore=9)
+    supabase.add("mixed@shop.example", ignore=47, notify=3)
+    supabase.add("steady@shop.example", ignore=19, notify=1)
+    
+    assert reputation.lookup("few@shop.example") is None
+    # 94% is not enough
+    assert reputation.lookup("Mixed <mixed@shop.example>") is None
+    category, reasoning = reputation.lookup("Steady <steady@shop.example>")
+    assert category == "ignore"
+    assert reasoning == f"{REPUTATION_PREFIX} 19 of 20 earlier emails from steady@shop.example were triaged 'ignore'."
+    assert reputation.decided == 1
+
+
+def test_domain_decides_only_below_the_sender_minimum(supabase):
+    reputation = SenderReputation(supabase, min_sender_emails=10, min_domain_emails=30)
+    supabase.add("@shop.example", ignore=40)
+    supabase.add("new@shop.example", respond=3)
+    supabase.add("known@shop.example", ignore=5, respond=5)
+    
+    category, reasoning = reputation.lookup("new@shop.example")
+    assert category == "ignore"
+    assert "from @shop.example" in reasoning
+    # Enough history of its own, even if undecided, keeps the domain out of it
+    assert reputation.lookup("known@shop.example") is None
+
+
+def test_freemail_domains_are_never_judged(supabase):
+    reputation = SenderReputation(supabase, min_domain_emails=30)
+    assert "gmail.com" in FREEMAIL_DOMAINS
+    supabase.add("@gmail.com", ignore=1000)
+    supabase.add("@shop.example", ignore=1000)
+    
+    assert reputation.lookup("stranger@gmail.com") is None
+    assert reputation.lookup("stranger@shop.example")[0] == "ignore"
+
+
+def test_withdrawn_outcomes_clamp_at_zero(supabase):
+    reputation = SenderReputation(supabase)
+    supabase.add("pal@shop.example", notify=1)
+    assert reputation.lookup("pal@shop.example") is None
+    
+    assert reputation.record_many([("pal@shop.example", "notify", -3), ("pal@shop.example", "respond", 2),
+                                   ("pal@shop.example", "unknown", 1), ("not an address", "notify", 1)]) == 2
+    assert reputation._get_stats(["pal@shop.example"]) == {"pal@shop.example": [0, 0, 2]}
+    assert supabase.calls == [("record_sender_outcomes", {"outcomes": [
+        {"sender": "pal@shop.example", "category": "notify", "delta": -3},
+        {"sender": "pal@shop.example", "category": "respond", "delta": 2},
+    ]})]
+    assert reputation.recorded == 2
+
+
+def test_failed_record_leaves_counts_alone(supabase):
+    reputation = SenderReputation(supabase)
+    supabase.add("pal@shop.example", notify=4)
+    reputation.lookup("pal@shop.example")
+    
+    supabase.failing = True
+    assert not reputation.record("pal@shop.example", "notify")
+    assert reputation.recorded == 0
+    assert reputation._get_stats(["pal@shop.example", "@shop.example"]) == {
+        "pal@shop.example": [0, 4, 0], "@shop.example": [0, 0, 0]
+    }
+
+
+def test_failed_savings_flush_is_retried(supabase):
+    reputation = SenderReputation(supabase, min_sender_emails=1)
+    supabase.add("news@shop.example", ignore=5)
+    for _ in range(3):
+        reputation.lookup("news@shop.example")
+    
+    supabase.failing = True
+    reputation.flush_savings()
+    assert supabase.calls == []
+    
+    supabase.failing = False
+    reputation.lookup("news@shop.example")
+    reputation.flush_savings()
+    reputation.flush_savings()
+    assert supabase.calls == [("record_triage_savings", {"source": SAVINGS_SOURCE, "calls": 4})]
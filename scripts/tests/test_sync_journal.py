@@ -0,0 +1,54 @@
+"""Resuming an interrupted sync from SyncJournal"""
+
+import sync_journal
+from sync_journal import SyncJournal
+
+
+def test_restarted_run_resumes_unstored_messages(tmp_path):
+    path = str(tmp_path / "journal.sqlite3")
+    journal = SyncJournal(path)
+    journal.record_fetched("default/INBOX", [("a", 1), ("b", 2), ("c", 3)])
+    journal.record_fetched("default/Sent", [("d", 1)])
+    journal.record_triaged("a", "respond", "LLM triage: client question")
+    journal.record_triaged("b", "ignore", "Automatic categorization: digest")
+    journal.record_stored(["b"])
+    journal.close()
+    
+    # The run crashed; the next one re-fetches what never reached "stored"
+    journal = SyncJournal(path)
+    assert journal.get_unfinished("default/INBOX") == [1, 3]
+    assert journal.get_unfinished("default/Sent") == [1]
+    assert journal.get_decisions(["a", "b", "c"]) == {
+        "a": ("respond", "LLM triage: client question"),
+        "b": ("ignore", "Automatic categorization: digest")
+    }
+
+
+def test_refetch_keeps_the_recorded_decision(tmp_path):
+    journal = SyncJournal(str(tmp_path / "journal.sqlite3"))
+    journal.record_fetched("default/INBOX", [("a", 1)])
+    journal.record_triaged("a", "notify", "first")
+    journal.record_fetched("default/INBOX", [("a", 1)])
+    journal.record_triaged("a", "ignore", "second")
+    assert journal.get_decisions(["a"]) == {"a": ("notify", "first")}
+
+
+def test_prune_forgets_stale_entries(tmp_path, monkeypatch):
+    journal = SyncJournal(str(tmp_path / "journal.sqlite3"))
+    journal.record_fetched("default/INBOX", [("a", 1)])
+    now = sync_journal.time.time()
+    monkeypatch.setattr(sync_journal.time, "time", lambda: now + 2 * 86400)
+    assert journal.prune(retention_days=3) == 0
+    assert journal.prune(retention_days=1) == 1
+    assert journal.get_unfinished("default/INBOX") == []
+
+
+def test_unfinished_uids_belong_to_their_uidvalidity(tmp_path):
+    journal = SyncJournal(str(tmp_path / "journal.sqlite3"))
+    journal.record_fetched("default/INBOX", [("a", 1), ("b", 2)], uidvalidity=7)
+    journal.record_fetched("default/INBOX", [("c", 1)], uidvalidity=8)
+    
+    # After a UIDVALIDITY reset the old UIDs name other messages
+    assert journal.get_unfinished("default/INBOX", 7) == [1, 2]
+    assert journal.get_unfinished("default/INBOX", 8) == [1]
+    assert journal.get_unfinished("default/INBOX", 9) == []
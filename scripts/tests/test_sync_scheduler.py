@@ -0,0 +1,57 @@
+"""Interval choice of AdaptiveScheduler"""
+
+from datetime import datetime
+
+import pytest
+
+from sync_scheduler import AdaptiveScheduler, parse_quiet_hours
+
+
+def test_parse_quiet_hours():
+    assert parse_quiet_hours("22-6") == (22 * 60, 6 * 60)
+    assert parse_quiet_hours("22:30-06:15") == (22 * 60 + 30, 6 * 60 + 15)
+    assert parse_quiet_hours("") is None
+    with pytest.raises(ValueError):
+        parse_quiet_hours("22")
+
+
+def test_interval_follows_arrival_rate():
+    scheduler = AdaptiveScheduler(min_interval=60, max_interval=1800, jitter=0, smoothing=1.0)
+    assert scheduler.next_interval() == 1800
+    assert scheduler.reason == "initial"
+    
+    scheduler.record_cycle(0, 5, None)
+    # 10 emails in 100 seconds: 2 emails arrive about every 20 seconds, floored at the minimum
+    scheduler.record_cycle(100, 5, 10)
+    assert scheduler.next_interval() == 60
+    scheduler.record_cycle(1100, 5, 2)
+    assert scheduler.next_interval() == pytest.approx(1000)
+    scheduler.record_cycle(2100, 5, 0)
+    assert scheduler.next_interval() == 1800
+    assert scheduler.reason == "no recent arrivals"
+
+
+def test_last_cycle_duration_is_a_floor():
+    scheduler = AdaptiveScheduler(min_interval=60, max_interval=1800, jitter=0, smoothing=1.0)
+    scheduler.record_cycle(0, 5, None)
+    scheduler.record_cycle(100, 300, 10)
+    assert scheduler.next_interval() == 300
+    assert "last cycle took 300s" in scheduler.reason
+
+
+def test_quiet_hours_wrap_past_midnight():
+    scheduler = AdaptiveScheduler(min_interval=60, max_interval=1800, quiet_hours="22-6", jitter=0)
+    assert scheduler.in_quiet_hours(datetime(2024, 1, 1, 23, 0))
+    assert scheduler.in_quiet_hours(datetime(2024, 1, 1, 5, 59))
+    assert not scheduler.in_quiet_hours(datetime(2024, 1, 1, 6, 0))
+    scheduler.record_cycle(0, 5, None)
+    scheduler.record_cycle(100, 5, 50)
+    assert scheduler.next_interval(datetime(2024, 1, 1, 2, 0)) == 1800
+    assert scheduler.reason == "quiet hours"
+
+
+def test_jitter_stays_within_bounds():
+    scheduler = AdaptiveScheduler(min_interval=60, max_interval=1800, initial_interval=600, jitter=0.1)
+    intervals = [scheduler.next_interval() for _ in range(200)]
+    assert all(540 <= interval <= 660 for interval in intervals)
+    assert len(set(intervals)) > 1
@@ -0,0 +1,51 @@
+"""Subject templates and the agreement, TTL and instruction checks of TriageCache"""
+
+import triage_cache
+from triage_cache import TriageCache, cache_key, subject_template
+
+
+def test_subject_template_masks_dates_and_ids():
+    assert subject_template("Voicemail from (555) 123-4567 on Jan 5") == \
+        subject_template("RE: Voicemail from (555) 987-6543 on February 12th, 2024")
+    assert subject_template("Invoice #4411 due Monday") == "invoice # due #"
+    assert cache_key("Filevine <Alerts@Filevine.com>", "Case 22-CV-0193 updated") == \
+        cache_key("alerts@filevine.com", "Case 23-CV-0007 updated")
+
+
+def test_decision_served_after_agreement(tmp_path):
+    cache = TriageCache(str(tmp_path / "cache.sqlite3"), min_agreement=2)
+    sender, subject = "alerts@ringcentral.com", "Voicemail from (555) 123-4567"
+    cache.put(sender, subject, "v1", "notify", "A voicemail")
+    assert cache.get(sender, subject, "v1") is None
+    
+    cache.put(sender, "Voicemail from (555) 000-1111", "v1", "notify", "Another voicemail")
+    category, reasoning = cache.get(sender, subject, "v1")
+    assert category == "notify"
+    assert reasoning.startswith(triage_cache.CACHE_REUSE_PREFIX)
+    
+    # A different answer starts the count again
+    cache.put(sender, subject, "v1", "ignore", "Spam")
+    assert cache.get(sender, subject, "v1") is None
+
+
+def test_changed_instructions_drop_decisions(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = TriageCache(path, min_agreement=1)
+    cache.put("a@example.com", "Weekly report 12", "v1", "ignore", "Report")
+    assert cache.get("a@example.com", "Weekly report 13", "v1")[0] == "ignore"
+    assert cache.get("a@example.com", "Weekly report 13", "v2") is None
+    assert TriageCache(path, min_agreement=1).get("a@example.com", "Weekly report 13", "v1") is None
+    assert cache.stats()["invalidated"] == 1
+
+
+def test_expired_and_evicted_entries(tmp_path, monkeypatch):
+    cache = TriageCache(str(tmp_path / "cache.sqlite3"), max_entries=10, ttl_days=1, min_agreement=1)
+    for number in range(11):
+        cache.put(f"sender{number}@example.com", "Hello", "v1", "respond", "Personal")
+    assert cache.stats()["entries"] == 9
+    assert cache.get("sender0@example.com", "Hello", "v1") is None
+    assert cache.get("sender10@example.com", "Hello", "v1") is not None
+    
+    now = triage_cache.time.time()
+    monkeypatch.setattr(triage_cache.time, "time", lambda: now + 2 * 86400)
+    assert cache.get("sender10@example.com", "Hello", "v1") is None
@@ -0,0 +1,57 @@
+"""Training data selection and predictions of the local triage classifier"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from triage_classifier import (
+    CLASSIFIER_PREFIX, LLM_PREFIX, TriageClassifier, extract_features, iter_training_emails, load_classifier
+)
+
+EXAMPLES = [
+    ("Weekly digest", "Top stories this week", "news@digest.example", "ignore"),
+    ("Flash sale today", "Everything on sale", "deals@shop.example", "ignore"),
+    ("Your package shipped", "Tracking number inside", "orders@shop.example", "notify"),
+    ("Voicemail received", "You have a new voicemail", "alerts@phone.example", "notify"),
+    ("Can we meet tomorrow?", "Let me know what time works", "client@example.com", "respond"),
+    ("Question about my case", "Please call me back", "client@example.com", "respond"),
+]
+
+
+def test_training_reads_only_llm_decisions(fake_supabase):
+    supabase = fake_supabase(
+        emails=[
+            {"id": 1, "subject": "a", "category": "respond", "triage_reasoning": f"{LLM_PREFIX} client"},
+            {"id": 2, "subject": "b", "category": "notify", "triage_reasoning": "Automatic categorization: bill"},
+            {"id": 3, "subject": "c", "category": "notify", "triage_reasoning": f"{CLASSIFIER_PREFIX} 'notify'"},
+            {"id": 4, "subject": "d", "category": "done", "triage_reasoning": f"{LLM_PREFIX} handled"},
+            {"id": 5, "subject": "e", "category": "notify", "triage_reasoning": "Could not determine exact category"},
+        ],
+        triage_ignored=[{"id": 1, "subject": "f", "triage_reasoning": f"{LLM_PREFIX} newsletter"}]
+    )
+    rows = list(iter_training_emails(supabase, page_size=1))
+    assert [(row["subject"], row["category"]) for row in rows] == [("a", "respond"), ("f", "ignore")]
+
+
+def test_features_are_sorted_and_bounded():
+    features = extract_features("Re: Invoice 1234", "Invoice 5678 attached", "Billing <Billing@Vendor.com>", 10)
+    assert list(features) == sorted(set(features))
+    assert features.max() < 1 << 10
+    # Digit runs share features
+    assert list(features) == list(extract_features("Re: Invoice 99", "Invoice 1 attached", "billing@vendor.com", 10))
+
+
+def test_confident_predictions_only(tmp_path):
+    examples = [(extract_features(subject, body, sender, 12), category)
+                for subject, body, sender, category in EXAMPLES * 20]
+    classifier = TriageClassifier.train(examples, feature_bits=12, threshold=0.6)
+    category, reasoning = classifier.predict("Weekly digest", "Top stories this week", "news@digest.example")
+    assert category == "ignore"
+    assert reasoning.startswith(CLASSIFIER_PREFIX)
+    
+    path = str(tmp_path / "model.npz")
+    classifier.save(path)
+    loaded = load_classifier(path, threshold=1.0)
+    assert loaded.predict("Weekly digest", "Top stories this week", "news@digest.example") is None
+    assert (loaded.decided, loaded.deferred) == (0, 1)
+    assert load_classifier(str(tmp_path / "missing.npz")) is None
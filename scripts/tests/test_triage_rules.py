@@ -0,0 +1,196 @@
+"""The compiled triage rules against the indicator lists they replaced"""
+
+import pytest
+
+from triage_rules import DEFAULT_RULES_FILE, CompiledRules, load_rules, make_synthetic_corpus, naive_match
+
+
+def baseline_indicators(subject, body, sender):
+    """EmailTriageAgent._analyze_email_indicators before the rules were compiled"""
+    subject_lower = subject.lower() if subject else ""
+    body_lower = body.lower() if body else ""
+    sender_lower = sender.lower() if sender else ""
+    
+    if any(term in subject_lower for term in ["voice message", "text message", "fax"]) and "ringcentral" in sender_lower:
+        return "notify", 0.95, "Message notification from RingCentral"
+    if ("bill" in subject_lower and "due" in subject_lower) or "payment required" in subject_lower:
+        return "notify", 0.95, "Bill or payment notification"
+    for indicator in ["case", "court", "filing", "attorney", "lawyer", "legal",
+                      "hearing", "plaintiff", "defendant", "estate", "vs.", "v."]:
+        if indicator in subject_lower:
+            return "respond", 0.95, f"Legal term in subject: '{indicator}'"
+    if any(domain in sender_lower for domain in ["whaleylawfirm.com", "filevine.com", "blazeo.com"]):
+        return "respond", 0.95, "Email from team member domain"
+        
+    platform_indicators = [
+        ("new notification" in subject_lower, "Email contains 'new notification' in subject"),
+        ("notification" in subject_lower and not "court" in subject_lower, "Email contains 'notification' in subject"),
+        ("digest" in subject_lower, "Email is a digest"),
+        ("what you missed" in body_lower, "Email contains 'what you missed'"),
+        ("notification since" in body_lower, "Email contains 'notification since'"),
+        ("noreply" in sender_lower, "Email is from noreply address"),
+        ("no-reply" in sender_lower, "Email is from no-reply address"),
+        ("donotreply" in sender_lower, "Email is from donotreply address"),
+        ("notification" in sender_lower, "Email is from notification sender"),
+        ("updates" in subject_lower and "new" in subject_lower, "Email contains 'updates' and 'new' in subject"),
+        (any(domain in sender_lower for domain in ["skool.com", "medium.com", "facebook.com", "twitter.com", "linkedin.com"]),
+         "Email is from social/platform domain"),
+        ("view online" in body_lower[:500], "Email has 'view online' at top"),
+        ("view in browser" in body_lower, "Email has 'view in browser'"),
+        ("email preferences" in body_lower, "Email mentions email preferences"),
+        ("unsubscribe" in body_lower and ("offer" in body_lower or "discount" in body_lower),
+         "Email has unsubscribe and offer/discount"),
+        (body_lower.count("http") > 5, "Email contains many links (marketing)"),
+        ("too many emails" in body_lower, "Email mentions 'too many emails'"),
+    ]
+    for matched, reason in platform_indicators:
+        if matched:
+            return "ignore", 0.9, reason
+            
+    marketing_indicators = [
+        "offer" in subject_lower, "discount" in subject_lower, "sale" in subject_lower,
+        "deal" in subject_lower, "promotion" in subject_lower,
+        "special" in subject_lower and "offer" in subject_lower, "coupon" in subject_lower,
+        "limited time" in subject_lower or "limited time" in body_lower[:500],
+        "off" in subject_lower and "%" in subject_lower, "exclusive" in subject_lower,
+        "reward" in subject_lower and not "law" in subject_lower,
+        "pro days" in body_lower[:500], "pro days" in subject_lower,
+        "come back" in subject_lower, "miss you" in subject_lower,
+        "save" in subject_lower and "$" in subject_lower
+    ]
+    if any(marketing_indicators):
+        return "ignore", 0.9, "Email contains marketing/promotional content"
+    return None, 0, None
+
+
+EDGE_CASES = [
+    ("Voice Message from (555) 123-4567", "", "RingCentral <service@ringcentral.com>"),
+    ("Fax received", "", "friend@gmail.com"),
+    ("Your electric BILL is due", "", "billing@utility.com"),
+    ("Payment required for renewal", "", "billing@saas.com"),
+    ("Smith v. Jones", "", "clerk@courts.gov"),
+    ("Court notification: new filing", "", "ecf@courts.gov"),
+    ("New notification from Skool", "", "noreply@skool.com"),
+    ("System notification", "", "admin@example.com"),
+    ("Lunch?", "", "Jane <jane@whaleylawfirm.com>"),
+    ("What's new: product updates", "", "team@product.com"),
+    ("Hi", "Here is what you missed this week", "friend@gmail.com"),
+    ("Hi", "x" * 499 + "view online", "friend@gmail.com"),
+    ("Hi", "x" * 500 + "view online", "friend@gmail.com"),
+    ("Hi", "Unsubscribe here. 20% discount inside", "shop@store.com"),
+    ("Hi", "unsubscribe", "shop@store.com"),
+    ("Links", " ".join(["http://t.example"] * 6), "news@site.com"),
+    ("Links", " ".join(["http://t.example"] * 5), "news@site.com"),
+    ("Save $20 today", "", "deals@store.com"),
+    ("Loyalty reward", "", "club@store.com"),
+    ("Reward for the law clinic", "", "club@school.edu"),
+    ("50% off", "", "shop@store.com"),
+    ("We miss you", "", "app@service.com"),
+    ("Pro days are here", "", "app@service.com"),
+    ("Quick question", "Can we talk tomorrow?", "client@example.com"),
+    ("", "", ""),
+    (None, None, None),
+]
+
+
+@pytest.fixture(scope="module")
+def rules():
+    return load_rules(DEFAULT_RULES_FILE)
+
+
+@pytest.mark.parametrize("subject, body, sender", EDGE_CASES)
+def test_rules_match_the_baseline_indicators(rules, subject, body, sender):
+    match = rules.match(subject, body, sender)
+    if match is None:
+        assert baseline_indicators(subject, body, sender) == (None, 0, None)
+    else:
+        assert (match.category, match.confidence, match.reason) == baseline_indicators(subject, body, sender)
+
+
+def test_rules_match_the_baseline_on_a_synthetic_corpus(rules):
+    window = rules.body_head + rules.body_tail
+    for subject, body, sender in make_synthetic_corpus(500, seed=1):
+        if len(body) > window:
+            continue
+        match = rules.match(subject, body, sender)
+        decision = (match.category, match.confidence, match.reason) if match else (None, 0, None)
+        assert decision == baseline_indicators(subject, body, sender)
+
+
+def test_naive_evaluation_agrees(rules):
+    import json
+    with open(DEFAULT_RULES_FILE, encoding="utf-8") as f:
+        config = json.load(f)
+    for email in make_synthetic_corpus(500, seed=2) + EDGE_CASES:
+        if len(email[1] or "") <= rules.body_head + rules.body_tail:
+            assert getattr(rules.match(*email), "rule_id", None) == naive_match(config, *email)
+
+
+def test_long_bodies_are_searched_in_a_window():
+    rules = CompiledRules({
+        "body_window": {"head": 10, "tail": 10},
+        "rules": [{"id": "deep", "category": "ignore", "reason": "deep", "all": [{"field": "body", "any": ["needle"]}]}]
+    })
+    assert rules.match("", "needle" + "x" * 100, "").rule_id == "deep"
+    assert rules.match("", "x" * 100 + "needle", "").rule_id == "deep"
+    assert rules.match("", "x" * 50 + "needle" + "x" * 50, "") is None
+
+
+def test_safeguards_look_at_subject_and_sender(rules):
+    assert rules.safeguard("Estate planning documents", "someone@example.com").category == "respond"
+    assert rules.safeguard("Text message from (555) 000-0000", "notify@ringcentral.com").rule_id == "safeguard-ringcentral"
+    assert rules.safeguard("Weekly digest", "news@example.com") is None
+
+
+def test_unknown_field_is_rejected():
+    with pytest.raises(ValueError):
+        CompiledRules({"rules": [{"id": "x", "category": "ignore", "reason": "x",
+                                  "all": [{"field": "to", "any": ["me"]}]}]})
+
+
+def test_terms_inside_longer_terms_are_found():
+    rules = CompiledRules({"rules": [
+        {"id": "off", "category": "ignore", "reason": "{term}", "all": [{"field": "subject", "any": ["off"]}]},
+        {"id": "notification", "category": "ignore", "reason": "{term}",
+         "all": [{"field": "subject", "any": ["notification"]}, {"field": "subject", "none": ["new notification"]}]},
+    ]})
+    assert rules.match("A special offer", "", "").rule_id == "off"
+    assert rules.match("New notification", "", "") is None
+    assert rules.match("Notification", "", "").rule_id == "notification"
+    assert set(rules.patterns["subject"][1]["new notification"]) == {"new notification", "notification"}
+
+
+def test_terms_straddling_a_longer_match_are_found():
+    rules = CompiledRules({"rules": [
+        {"id": "ticket", "category": "respond", "reason": "{term}",
+         "all": [{"field": "body", "any": ["ticket number"]}, {"field": "body", "any": ["numbers game"]}]},
+    ]})
+    assert rules.match("", "your ticket numbers game", "").rule_id == "ticket"
+    assert rules.match("", "your ticket number", "") is None
+
+
+def test_header_only_decision_is_refused_when_the_body_could_change_it():
+    rules = CompiledRules({"rules": [
+        {"id": "invoice-body", "category": "respond", "reason": "invoice",
+         "all": [{"field": "sender", "any": ["billing@"]}, {"field": "body", "any": ["invoice"]}]},
+        {"id": "no-code", "category": "ignore", "reason": "no code",
+         "all": [{"field": "subject", "any": ["newsletter"]}, {"field": "body", "none": ["verification code"]}]},
+        {"id": "noreply", "category": "ignore", "reason": "noreply", "all": [{"field": "sender", "any": ["noreply"]}]},
+    ]})
+    assert rules.match_headers("Hello", "billing@noreply.example") is None
+    assert rules.match_headers("Weekly newsletter", "noreply@example.com") is None
+    assert rules.match_headers("Hello", "noreply@example.com").rule_id == "noreply"
+    assert rules.match("Hello", "Your invoice", "billing@noreply.example").rule_id == "invoice-body"
+
+
+def test_bundled_rules_decide_from_headers_like_from_an_empty_body(rules):
+    for subject, _, sender in EDGE_CASES + make_synthetic_corpus(200, seed=3):
+        match = rules.match_headers(subject, sender)
+        if match is not None:
+            assert match == rules.match(subject, "", sender)
+
+
+def test_safeguards_cannot_look_at_the_body():
+    with pytest.raises(ValueError):
+        CompiledRules({"safeguards": [{"id": "x", "category": "respond", "reason": "x",
+                                       "all": [{"field": "body", "any": ["urgent"]}]}]})
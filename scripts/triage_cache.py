@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Persistent Triage Decision Cache
+
+This module remembers the LLM's triage decisions for machine-generated mail
+that keeps coming back in the same shape: Filevine updates, RingCentral
+voicemails, court e-filing notices. Entries are keyed on the sender address
+plus a subject template in which numbers, dates and case IDs are masked, so
+"Voicemail from (555) 123-4567 on Jan 5" and "Voicemail from (555) 987-6543
+on Feb 12" share one entry.
+
+A decision is only served once the LLM has given the same answer for the
+template `min_agreement` times in a row, so a one-off human email never
+decides the next one. Entries expire after a TTL, the least recently used
+ones are evicted past `max_entries`, and every entry is tied to a
+fingerprint of the triage instructions: when the instructions change, the
+old decisions are dropped.
+"""
+
+import os
+import re
+import time
+import sqlite3
+import threading
+import email.utils
+from collections import OrderedDict
+
+from email_parsing import normalize_subject
+
+# Entries kept on disk before the least recently used are evicted
+DEFAULT_MAX_ENTRIES = 50000
+
+# Days a decision is trusted after the LLM last confirmed it
+DEFAULT_TTL_DAYS = 30
+
+# Identical LLM decisions for a key before the cache answers for it
+DEFAULT_MIN_AGREEMENT = 2
+
+# Entries also held in memory, so repeated hits never touch SQLite
+MEMORY_CACHE_SIZE = 5000
+
+# Seconds between persisting the last use of an entry that keeps hitting
+TOUCH_INTERVAL = 3600
+
+# Reasoning of decisions served from the cache
+CACHE_REUSE_PREFIX = "Repeated sender and subject template, reusing the earlier decision."
+
+# Dates written with a month name ("Jan 5", "January 5th, 2024")
+MONTH_DATE_PATTERN = re.compile(
+    r"\b(?:jan|feb|mar|apr|may|jun|jul|aug|sept?|oct|nov|dec)[a-z]*\.?\s+\d{1,2}(?:st|nd|rd|th)?(?:,?\s+\d{2,4})?\b"
+)
+
+# Weekday names, which change with the date
+WEEKDAY_PATTERN = re.compile(r"\b(?:mon|tues|wednes|thurs|fri|satur|sun)day\b")
+
+# Any token containing a digit: numbers, times, numeric dates, case and invoice IDs
+DIGIT_TOKEN_PATTERN = re.compile(r"[\w#./:-]*\d[\w#./:-]*")
+
+
+def subject_template(subject):
+    """
+    Reduce a subject to its template
+    
+    Reply prefixes are dropped, the subject is lower-cased, and dates,
+    weekdays and every token containing a digit become "#".
+    """
+    template = normalize_subject(subject)
+    template = MONTH_DATE_PATTERN.sub("#", template)
+    template = WEEKDAY_PATTERN.sub("#", template)
+    return DIGIT_TOKEN_PATTERN.sub("#", template)
+
+
+def cache_key(sender, subject):
+    """Build the cache key of an email: its lower-cased sender address and subject template"""
+    address = email.utils.parseaddr(sender or "")[1] or (sender or "")
+    return f"{address.strip().lower()}\n{subject_template(subject)}"
+
+
+class TriageCache:
+    """SQLite cache of triage decisions with LRU and TTL eviction"""
+    
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES, ttl_days=DEFAULT_TTL_DAYS,
+                 min_agreement=DEFAULT_MIN_AGREEMENT):
+        """
+        Open (or create) the cache
+        
+        Args:
+            path: Path of the SQLite cache file
+            max_entries: Entries kept before the least recently used are evicted
+            ttl_days: Days a decision is trusted after it was last confirmed
+            min_agreement: Identical LLM decisions needed before a key is served
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl_days * 86400
+        self.min_agreement = min_agreement
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._fingerprint = None
+        
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evicted = 0
+        self.invalidated = 0
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS decisions ("
+            "key TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, category TEXT NOT NULL, reasoning TEXT, "
+            "agreement INTEGER NOT NULL, confirmed_at REAL NOT NULL, last_used_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS decisions_last_used ON decisions (last_used_at)")
+        self._db.commit()
+        self._entries = self._db.execute("SELECT COUNT(*) FROM decisions").fetchone()[0]
+        
+    def _use_fingerprint(self, fingerprint):
+        """Drop every decision made under other triage instructions (call with the lock held)"""
+        if fingerprint == self._fingerprint:
+            return
+        cursor = self._db.execute("DELETE FROM decisions WHERE fingerprint != ?", (fingerprint,))
+        self._db.commit()
+        if cursor.rowcount > 0:
+            self.invalidated += cursor.rowcount
+            self._entries -= cursor.rowcount
+            print(f"Triage cache: dropped {cursor.rowcount} decisions made under different triage instructions")
+        self._memory.clear()
+        self._fingerprint = fingerprint
+        
+    def _load(self, key):
+        """Get an entry from memory or disk as [category, reasoning, agreement, confirmed_at, touched_at]"""
+        entry = self._memory.get(key)
+        if entry is None:
+            row = self._db.execute(
+                "SELECT category, reasoning, agreement, confirmed_at, last_used_at FROM decisions WHERE key = ?",
+                (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            entry = list(row)
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > MEMORY_CACHE_SIZE:
+            self._memory.popitem(last=False)
+        return entry
+        
+    def get(self, sender, subject, fingerprint):
+        """
+        Look up the decision for an email
+        
+        Args:
+            sender: Email sender
+            subject: Email subject
+            fingerprint: Fingerprint of the current triage instructions
+            
+        Returns:
+            tuple: (category, reasoning), or None if the LLM has to decide
+        """
+        key = cache_key(sender, subject)
+        now = time.time()
+        with self._lock:
+            self._use_fingerprint(fingerprint)
+            entry = self._load(key)
+            if entry is None or entry[2] < self.min_agreement or entry[3] + self.ttl < now:
+                self.misses += 1
+                return None
+                
+            self.hits += 1
+            if now - entry[4] > TOUCH_INTERVAL:
+                entry[4] = now
+                self._db.execute("UPDATE decisions SET last_used_at = ? WHERE key = ?", (now, key))
+                self._db.commit()
+            category, reasoning = entry[0], entry[1]
+        return category, f"{CACHE_REUSE_PREFIX}\nCached reasoning: {reasoning}"
+        
+    def put(self, sender, subject, fingerprint, category, reasoning):
+        """
+        Record a decision the LLM made for an email
+        
+        A decision matching the key's earlier one raises its agreement; a
+        different decision starts the count again.
+        """
+        key = cache_key(sender, subject)
+        now = time.time()
+        with self._lock:
+            self._use_fingerprint(fingerprint)
+            entry = self._load(key)
+            if entry is not None and entry[0] == category and entry[3] + self.ttl >= now:
+                agreement = entry[2] + 1
+            else:
+                agreement = 1
+            if entry is None:
+                self._entries += 1
+            self._memory[key] = [category, reasoning, agreement, now, now]
+            self._db.execute(
+                "INSERT OR REPLACE INTO decisions (key, fingerprint, category, reasoning, agreement, confirmed_at, "
+                "last_used_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, fingerprint, category, reasoning, agreement, now, now)
+            )
+            self.stores += 1
+            
+            if self._entries > self.max_entries:
+                # Evict down to 90% so eviction runs once per many inserts
+                excess = self._entries - int(self.max_entries * 0.9)
+                cursor = self._db.execute(
+                    "DELETE FROM decisions WHERE key IN (SELECT key FROM decisions ORDER BY last_used_at LIMIT ?)",
+                    (excess,)
+                )
+                self._entries -= cursor.rowcount
+                self.evicted += cursor.rowcount
+                self._memory.clear()
+            self._db.commit()
+    
+    def stats(self):
+        """
+        Get the cache counters of this process
+        
+        Returns:
+            dict: hits, misses, hit_rate, stores, evicted, invalidated and entries
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "stores": self.stores,
+                "evicted": self.evicted,
+                "invalidated": self.invalidated,
+                "entries": self._entries
+            }
+    
+    def close(self):
+        """Close the underlying SQLite connection"""
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""
+Local Triage Classifier
+
+This module trains a small CPU-only classifier on the emails the LLM has
+already triaged and uses it as a cascade stage in front of the LLM:
+EmailTriageAgent asks it after the rules, and only emails it is unsure
+about go on to a CrewAI call.
+
+The model is a multinomial logistic regression over hashed binary features
+(subject and body words and word pairs, the sender address and its domain),
+fitted with plain NumPy stochastic gradient descent. It is saved as an uncompressed .npz file of a few
+megabytes that loads in milliseconds. Training holds out a fifth of the
+emails, reports accuracy against the share of LLM calls removed at a range
+of confidence thresholds, and keeps the lowest threshold that reaches the
+target accuracy.
+
+Usage:
+    python triage_classifier.py [--output PATH] [--target-accuracy 0.95]
+"""
+
+import os
+import re
+import time
+import zlib
+import random
+import threading
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+TRIAGE_CATEGORIES = ("ignore", "notify", "respond")
+
+# Hashed feature space (the model holds one float32 per feature and category)
+DEFAULT_FEATURE_BITS = 18
+
+# Stochastic gradient descent: passes over the emails, initial step size
+# (divided by the pass number) and L2 penalty on the weights it touches
+DEFAULT_EPOCHS = 4
+DEFAULT_LEARNING_RATE = 0.2
+DEFAULT_L2 = 1e-4
+
+# Body characters looked at (the top of an email says what it is)
+BODY_CHARS = 2000
+
+# Held-out accuracy the confidence threshold is chosen for
+DEFAULT_TARGET_ACCURACY = 0.95
+
+# Confidence thresholds compared by the evaluation report
+EVALUATION_THRESHOLDS = (0.5, 0.7, 0.8, 0.9, 0.95, 0.98, 0.99, 0.995, 0.999)
+
+# Rows read per page when loading training emails
+TRAINING_PAGE_SIZE = 1000
+
+# Reasoning of decisions made by the classifier (never used as training data)
+CLASSIFIER_PREFIX = "Local classifier:"
+
+# Reasoning of rule decisions, which the rules make again without the classifier
+RULE_PREFIX = "Automatic categorization"
+
+# Reasoning of decisions the LLM made in the expected format (see email_triage_agent),
+# the only ones trained on
+LLM_PREFIX = "LLM triage:"
+
+# Version of the .npz layout
+MODEL_FORMAT_VERSION = 1
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9$%]+(?:['.][a-z0-9]+)*")
+DIGITS_PATTERN = re.compile(r"\d+")
+
+DEFAULT_MODEL_PATH = os.environ.get("TRIAGE_MODEL_FILE") or os.path.join(
+    os.environ.get("SYNC_STATE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "state")),
+    "triage_classifier.npz"
+)
+
+
+def _require_numpy():
+    """Fail with an install hint when numpy is missing"""
+    if np is None:
+        raise RuntimeError("The triage classifier needs the numpy package (pip install numpy)")
+
+
+def _tokens(text):
+    """Lower-case words with digit runs collapsed, so IDs and dates share features"""
+    return [DIGITS_PATTERN.sub("0", token) for token in TOKEN_PATTERN.findall((text or "").lower())]
+
+
+def extract_features(subject, body, sender, feature_bits=DEFAULT_FEATURE_BITS):
+    """
+    Hash an email into the indices of its features
+    
+    Subject and body words and word pairs are kept apart, and the sender
+    contributes its address and domain.
+    
+    Returns:
+        numpy.ndarray: Sorted unique feature indices
+    """
+    _require_numpy()
+    features = []
+    for prefix, text in (("s", subject), ("b", (body or "")[:BODY_CHARS])):
+        words = _tokens(text)
+        features.extend(f"{prefix}:{word}" for word in words)
+        features.extend(f"{prefix}:{first} {second}" for first, second in zip(words, words[1:]))
+        
+    address = (sender or "").lower()
+    if "<" in address and ">" in address:
+        address = address[address.find("<") + 1:address.find(">")]
+    address = address.strip()
+    if address:
+        features.append(f"from:{address}")
+        features.append(f"domain:{address.rsplit('@', 1)[-1]}")
+        
+    mask = (1 << feature_bits) - 1
+    return np.unique(np.fromiter(
+        (zlib.crc32(feature.encode("utf-8")) & mask for feature in features), dtype=np.int32, count=len(features)
+    ))
+
+
+class TriageClassifier:
+    """Logistic regression triage model over hashed email features"""
+    
+    def __init__(self, weights, bias, threshold, classes=TRIAGE_CATEGORIES):
+        """
+        Create a classifier from trained parameters
+        
+        Args:
+            weights: (categories x features) weight of each feature
+            bias: Bias of each category
+            threshold: Probability the top category must exceed before the classifier
+                decides (1.0 never decides)
+            classes: Category names, in the order of the parameter rows
+        """
+        _require_numpy()
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float64)
+        self.threshold = float(threshold)
+        self.classes = tuple(classes)
+        self.feature_bits = int(self.weights.shape[1]).bit_length() - 1
+        self._lock = threading.Lock()
+        self.decided = 0
+        self.deferred = 0
+        
+    @classmethod
+    def train(cls, examples, feature_bits=DEFAULT_FEATURE_BITS, epochs=DEFAULT_EPOCHS,
+              learning_rate=DEFAULT_LEARNING_RATE, l2=DEFAULT_L2, threshold=1.0, seed=0):
+        """
+        Fit a model
+        
+        Args:
+            examples: (features, category) pairs, features from extract_features
+            feature_bits: Size of the hashed feature space, as a power of two
+            epochs: Passes over the examples
+            learning_rate: Step size of the first pass
+            l2: L2 penalty on the weights of each example's features
+            threshold: Confidence threshold stored with the model
+            seed: Seed of the example shuffling, for reproducible models
+            
+        Returns:
+            TriageClassifier: The trained model
+        """
+        _require_numpy()
+        weights = np.zeros((len(TRIAGE_CATEGORIES), 1 << feature_bits), dtype=np.float64)
+        bias = np.zeros(len(TRIAGE_CATEGORIES), dtype=np.float64)
+        targets = [TRIAGE_CATEGORIES.index(category) for _, category in examples]
+        order = list(range(len(examples)))
+        shuffle = random.Random(seed).shuffle
+        
+        for epoch in range(epochs):
+            shuffle(order)
+            rate = learning_rate / (epoch + 1)
+            for index in order:
+                features = examples[index][0]
+                active = weights[:, features]
+                scores = active.sum(axis=1) + bias
+                gradient = np.exp(scores - scores.max())
+                gradient /= gradient.sum()
+                gradient[targets[index]] -= 1
+                weights[:, features] = active - rate * (gradient[:, None] + l2 * active)
+                bias -= rate * gradient
+        return cls(weights, bias, threshold)
+        
+    @classmethod
+    def load(cls, path):
+        """Load a model saved with save()"""
+        _require_numpy()
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["format_version"]) != MODEL_FORMAT_VERSION:
+                raise ValueError(f"{path} has model format {int(data['format_version'])}, "
+                                 f"expected {MODEL_FORMAT_VERSION}")
+            return cls(data["weights"], data["bias"], float(data["threshold"]),
+                       classes=[str(name) for name in data["classes"]])
+    
+    def save(self, path):
+        """Save the model atomically as an uncompressed .npz file"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            np.savez(f, weights=self.weights, bias=self.bias,
+                     threshold=np.float64(self.threshold), classes=np.array(self.classes),
+                     format_version=np.int64(MODEL_FORMAT_VERSION))
+        os.replace(temp_path, path)
+        
+    def probabilities_of(self, features):
+        """Get the probability of each category for extracted features"""
+        scores = self.bias + self.weights[:, features].sum(axis=1)
+        scores = np.exp(scores - scores.max())
+        return scores / scores.sum()
+        
+    def predict(self, subject, body, sender):
+        """
+        Categorize an email if the model is confident enough
+        
+        Returns:
+            tuple: (category, reasoning), or None to leave the email to the LLM
+        """
+        probabilities = self.probabilities_of(extract_features(subject, body, sender, self.feature_bits))
+        best = int(probabilities.argmax())
+        if probabilities[best] <= self.threshold:
+            with self._lock:
+                self.deferred += 1
+            return None
+        with self._lock:
+            self.decided += 1
+        category = self.classes[best]
+        return category, (f"{CLASSIFIER_PREFIX} '{category}' with probability {probabilities[best]:.3f} "
+                          f"(threshold {self.threshold:.3f})")
+
+
+def load_classifier(path, threshold=None):
+    """
+    Load the model at `path` if there is one
+    
+    Args:
+        path: Model file
+        threshold: Optional confidence threshold overriding the trained one
+        
+    Returns:
+        TriageClassifier: The model, or None if it is missing or cannot be loaded
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        started_at = time.perf_counter()
+        classifier = TriageClassifier.load(path)
+    except Exception as e:
+        print(f"Error loading triage classifier {path}: {e}")
+        return None
+    if threshold is not None:
+        classifier.threshold = threshold
+    print(f"Loaded triage classifier {path} in {1000 * (time.perf_counter() - started_at):.1f}ms "
+          f"(threshold {classifier.threshold:.3f})")
+    return classifier
+
+
+def _iter_llm_rows(supabase, table, columns, page_size):
+    """Page through the rows of `table` whose reasoning carries LLM_PREFIX"""
+    after_id = 0
+    while True:
+        response = supabase.table(table).select(columns).like(
+            "triage_reasoning", f"{LLM_PREFIX}%"
+        ).gt("id", after_id).order("id").limit(page_size).execute()
+        rows = response.data or []
+        yield from rows
+        if len(rows) < page_size:
+            break
+        after_id = rows[-1]["id"]
+
+
+def iter_training_emails(supabase, page_size=TRAINING_PAGE_SIZE):
+    """
+    Stream LLM-triaged emails
+    
+    Only decisions the LLM itself made are used: their reasoning starts with
+    LLM_PREFIX. Rule, thread, cache, sender reputation and classifier
+    shortcuts, safeguard overrides and the "notify" fallbacks of failed or
+    unparseable LLM calls all carry other reasoning and are left out, as are
+    emails stored before the marker existed. Emails marked done (their triage
+    category is gone) are skipped; a category changed in the inbox is used
+    as the label.
+    
+    Emails the LLM ignored are never stored in the emails table, so they
+    come from triage_ignored, where gmail_sync records them.
+    
+    Yields:
+        dict: id, subject, sender, body and category of each email
+    """
+    for row in _iter_llm_rows(supabase, "emails", "id, subject, sender, body, category, triage_reasoning", page_size):
+        if row.get("category") in TRIAGE_CATEGORIES:
+            yield row
+    for row in _iter_llm_rows(supabase, "triage_ignored", "id, subject, sender, body, triage_reasoning", page_size):
+        row["category"] = "ignore"
+        yield row
+
+
+def evaluate(classifier, examples):
+    """
+    Measure held-out accuracy against the share of emails the classifier decides
+    
+    Returns:
+        list: (threshold, coverage, accuracy) for each of EVALUATION_THRESHOLDS;
+            coverage is the share of LLM calls removed
+    """
+    predictions = []
+    for features, category in examples:
+        probabilities = classifier.probabilities_of(features)
+        best = int(probabilities.argmax())
+        predictions.append((probabilities[best], classifier.classes[best] == category))
+        
+    report = []
+    for threshold in EVALUATION_THRESHOLDS:
+        decided = [correct for confidence, correct in predictions if confidence > threshold]
+        coverage = len(decided) / len(predictions) if predictions else 0.0
+        accuracy = sum(decided) / len(decided) if decided else 0.0
+        report.append((threshold, coverage, accuracy))
+    return report
+
+
+def train_from_supabase(supabase, output, feature_bits=DEFAULT_FEATURE_BITS, epochs=DEFAULT_EPOCHS,
+                        target_accuracy=DEFAULT_TARGET_ACCURACY):
+    """
+    Train, evaluate and save a model from the stored emails
+    
+    Every fifth email (by id) is held out to choose the threshold; the saved
+    model is then trained on all of them.
+    
+    Returns:
+        TriageClassifier: The saved model, or None if there were no emails
+    """
+    started_at = time.monotonic()
+    train_examples = []
+    test_examples = []
+    for row in iter_training_emails(supabase):
+        example = (extract_features(row.get("subject"), row.get("body"), row.get("sender"), feature_bits),
+                   row["category"])
+        (test_examples if row["id"] % 5 == 0 else train_examples).append(example)
+        
+    total = len(train_examples) + len(test_examples)
+    if not total:
+        print("No triaged emails to train on")
+        return None
+    counts = {category: 0 for category in TRIAGE_CATEGORIES}
+    for _, category in train_examples + test_examples:
+        counts[category] += 1
+    print(f"Loaded {total} emails in {time.monotonic() - started_at:.1f}s: "
+          + ", ".join(f"{counts[category]} {category}" for category in TRIAGE_CATEGORIES))
+    
+    # Without held-out emails the classifier never decides on its own
+    threshold = 1.0
+    missing = [category for category in TRIAGE_CATEGORIES if not counts[category]]
+    if missing:
+        # A model that never saw a category is confidently wrong about it, and
+        # the held-out accuracy cannot show that
+        print(f"No LLM-triaged '{', '.join(missing)}' emails yet; "
+              f"the model will leave every email to the LLM")
+    elif test_examples and train_examples:
+        report = evaluate(TriageClassifier.train(train_examples, feature_bits, epochs), test_examples)
+        print(f"Held-out evaluation on {len(test_examples)} emails:")
+        print("  threshold  LLM calls removed  accuracy")
+        for candidate, coverage, accuracy in report:
+            print(f"  {candidate:>9.3f}  {100 * coverage:>16.1f}%  {100 * accuracy:>7.1f}%")
+        reaching = [candidate for candidate, coverage, accuracy in report if coverage and accuracy >= target_accuracy]
+        if reaching:
+            threshold = reaching[0]
+            print(f"Threshold {threshold:.3f} is the lowest with at least {100 * target_accuracy:.0f}% accuracy")
+        else:
+            print(f"No threshold reaches {100 * target_accuracy:.0f}% accuracy; "
+                  f"the model will leave every email to the LLM")
+    
+    started_at = time.monotonic()
+    classifier = TriageClassifier.train(train_examples + test_examples, feature_bits, epochs, threshold=threshold)
+    print(f"Trained on {total} emails in {time.monotonic() - started_at:.1f}s")
+    classifier.save(output)
+    print(f"Saved model to {output} ({os.path.getsize(output) / (1024 * 1024):.1f} MB)")
+    
+    started_at = time.perf_counter()
+    TriageClassifier.load(output)
+    print(f"Model loads in {1000 * (time.perf_counter() - started_at):.1f}ms")
+    return classifier
+
+
+def main():
+    import argparse
+    from dotenv import load_dotenv
+    from supabase import create_client
+    
+    parser = argparse.ArgumentParser(description='Train the local triage classifier from stored emails')
+    parser.add_argument('--output', default=DEFAULT_MODEL_PATH,
+                        help=f'Model file to write (default: TRIAGE_MODEL_FILE or {DEFAULT_MODEL_PATH})')
+    parser.add_argument('--target-accuracy', type=float, default=DEFAULT_TARGET_ACCURACY,
+                        help=f'Held-out accuracy the confidence threshold must reach (default: {DEFAULT_TARGET_ACCURACY})')
+    parser.add_argument('--feature-bits', type=int, default=DEFAULT_FEATURE_BITS,
+                        help=f'Hashed feature space size as a power of two (default: {DEFAULT_FEATURE_BITS})')
+    parser.add_argument('--epochs', type=int, default=DEFAULT_EPOCHS,
+                        help=f'Training passes over the emails (default: {DEFAULT_EPOCHS})')
+    args = parser.parse_args()
+    
+    load_dotenv()
+    supabase = create_client(os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_KEY"))
+    train_from_supabase(supabase, args.output, feature_bits=args.feature_bits, epochs=args.epochs,
+                        target_accuracy=args.target_accuracy)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,14 @@ Database Schema Update Script
 This script updates the Supabase database schema to add the fields needed for the email assistant agent:
 - processed_by_agent: Boolean flag to indicate if an email has been processed
 - agent_analysis: JSON field to store the analysis results
+
+It also creates the supporting tables used by gmail_sync.py:
+- sync_checkpoints: per-mailbox UIDVALIDITY / last UID / MODSEQ checkpoint
+- a unique index on emails.gmail_id, required for batched upserts
+- update_email_triage: batched UPDATE-only writes of re-triaged emails
+- triage_ignored: emails the LLM ignored, kept as training data for triage_classifier.py
+- emails.thread_id with an index, and get_email_threads for the grouped inbox view
+- attachment_blobs / email_attachments: attachment metadata, one blob row per distinct SHA-256
 """
 
 import os
@@ -69,6 +77,23 @@ def update_schema():
             'table': 'emails',
             'column': 'agent_analysis',
             'type': 'JSONB'
+        },
+        {
+            'table': 'emails',
+            'column': 'thread_id',
+            'type': 'TEXT'
+        },
+        {
+            # Category (and weight) this email added to sender_stats, so the inbox
+            # app withdraws exactly that when the email is recategorized
+            'table': 'emails',
+            'column': 'reputation_category',
+            'type': 'TEXT'
+        },
+        {
+            'table': 'emails',
+            'column': 'reputation_weight',
+            'type': 'INT'
         }
     ]
     
@@ -106,6 +131,231 @@ def update_schema():
     print(f"- {already_exists_count} columns already existed")
     print(f"- {error_count} errors")
 
+def create_tables():
+    """Create the supporting tables and indexes used by the sync scripts"""
+    tables = [
+        {
+            'name': 'emails_gmail_id_key',
+            'sql': """
+            CREATE UNIQUE INDEX IF NOT EXISTS emails_gmail_id_key ON emails (gmail_id);
+            """
+        },
+        {
+            'name': 'sync_checkpoints',
+            'sql': """
+            CREATE TABLE IF NOT EXISTS sync_checkpoints (
+                mailbox TEXT PRIMARY KEY,
+                uidvalidity BIGINT NOT NULL,
+                last_uid BIGINT NOT NULL DEFAULT 0,
+                highest_modseq BIGINT,
+                updated_at TIMESTAMPTZ DEFAULT NOW()
+            );
+            """
+        },
+        {
+            'name': 'update_email_triage',
+            'sql': """
+            CREATE OR REPLACE FUNCTION update_email_triage(updates JSONB)
+            RETURNS TABLE (gmail_id TEXT)
+            LANGUAGE SQL
+            AS $$
+                UPDATE emails e SET
+                    category = u.category,
+                    triage_reasoning = u.triage_reasoning,
+                    thread_id = COALESCE(u.thread_id, e.thread_id),
+                    subject = COALESCE(u.subject, e.subject),
+                    body = COALESCE(u.body, e.body),
+                    processing_status = COALESCE(u.processing_status, e.processing_status)
+                FROM jsonb_to_recordset(updates) AS u(
+                    gmail_id TEXT, category TEXT, triage_reasoning TEXT, thread_id TEXT,
+                    subject TEXT, body TEXT, processing_status TEXT
+                )
+                WHERE e.gmail_id = u.gmail_id
+                RETURNING e.gmail_id;
+            $$;
+            """
+        },
+        {
+            'name': 'emails_thread_id_idx',
+            'sql': """
+            UPDATE emails SET thread_id = gmail_id WHERE thread_id IS NULL;
+            CREATE INDEX IF NOT EXISTS emails_thread_id_idx ON emails (thread_id, received_date DESC);
+            CREATE INDEX IF NOT EXISTS emails_received_date_idx ON emails (received_date DESC);
+            """
+        },
+        {
+            'name': 'attachment_blobs',
+            'sql': """
+            CREATE TABLE IF NOT EXISTS attachment_blobs (
+                sha256 TEXT PRIMARY KEY,
+                size BIGINT NOT NULL,
+                mime_type TEXT,
+                first_seen_at TIMESTAMPTZ DEFAULT NOW()
+            );
+            """
+        },
+        {
+            'name': 'email_attachments',
+            'sql': """
+            CREATE TABLE IF NOT EXISTS email_attachments (
+                gmail_id TEXT NOT NULL,
+                part_index INT NOT NULL,
+                sha256 TEXT NOT NULL REFERENCES attachment_blobs (sha256),
+                filename TEXT,
+                mime_type TEXT,
+                size BIGINT NOT NULL,
+                created_at TIMESTAMPTZ DEFAULT NOW(),
+                PRIMARY KEY (gmail_id, part_index)
+            );
+            CREATE INDEX IF NOT EXISTS email_attachments_sha256_idx ON email_attachments (sha256);
+            """
+        },
+        {
+            'name': 'get_email_threads',
+            'sql': """
+            CREATE OR REPLACE FUNCTION get_email_threads(categories TEXT[], page_offset INT, page_limit INT)
+            RETURNS TABLE (
+                id BIGINT,
+                subject TEXT,
+                sender TEXT,
+                received_date TEXT,
+                category TEXT,
+                thread_id TEXT,
+                thread_count BIGINT
+            )
+            LANGUAGE SQL
+            STABLE
+            AS $$
+                -- Walk emails newest first (emails_received_date_idx), keep the latest
+                -- message of each thread (probing emails_thread_id_idx) and stop once
+                -- the page is full; only the page's threads are counted
+                WITH latest AS (
+                    SELECT e.id, e.subject, e.sender, e.received_date, e.category, e.thread_id
+                    FROM emails e
+                    WHERE (categories IS NULL OR e.category = ANY(categories))
+                      AND NOT EXISTS (
+                          SELECT 1 FROM emails n
+                          WHERE n.thread_id = e.thread_id
+                            AND (n.received_date > e.received_date
+                                 OR (n.received_date = e.received_date AND n.id > e.id))
+                            AND (categories IS NULL OR n.category = ANY(categories))
+                      )
+                    ORDER BY e.received_date DESC, e.id DESC
+                    OFFSET page_offset
+                    LIMIT page_limit
+                )
+                SELECT l.id, l.subject, l.sender, to_json(l.received_date) #>> '{}', l.category, l.thread_id,
+                       (SELECT COUNT(*) FROM emails c
+                        WHERE c.thread_id = l.thread_id
+                          AND (categories IS NULL OR c.category = ANY(categories))) AS thread_count
+                FROM latest l
+                ORDER BY l.received_date DESC, l.id DESC;
+            $$;
+            """
+        },
+        {
+            'name': 'sender_stats',
+            'sql': """
+            CREATE TABLE IF NOT EXISTS sender_stats (
+                sender_key TEXT PRIMARY KEY,
+                ignore_count INT NOT NULL DEFAULT 0,
+                notify_count INT NOT NULL DEFAULT 0,
+                respond_count INT NOT NULL DEFAULT 0,
+                updated_at TIMESTAMPTZ DEFAULT NOW()
+            );
+            """
+        },
+        {
+            'name': 'record_sender_outcome',
+            'sql': """
+            CREATE OR REPLACE FUNCTION record_sender_outcome(sender TEXT, category TEXT, delta INT)
+            RETURNS VOID
+            LANGUAGE plpgsql
+            AS $$
+            DECLARE
+                address TEXT := lower(trim(COALESCE(substring(sender from '<([^<>]+)>'), sender)));
+                stat_key TEXT;
+            BEGIN
+                IF category NOT IN ('ignore', 'notify', 'respond') OR position('@' in address) = 0 THEN
+                    RETURN;
+                END IF;
+                -- One row for the address and one for its domain ("@example.com")
+                FOREACH stat_key IN ARRAY ARRAY[address, '@' || split_part(address, '@', 2)] LOOP
+                    INSERT INTO sender_stats AS s (sender_key, ignore_count, notify_count, respond_count)
+                    VALUES (
+                        stat_key,
+                        GREATEST(0, CASE WHEN category = 'ignore' THEN delta ELSE 0 END),
+                        GREATEST(0, CASE WHEN category = 'notify' THEN delta ELSE 0 END),
+                        GREATEST(0, CASE WHEN category = 'respond' THEN delta ELSE 0 END)
+                    )
+                    ON CONFLICT (sender_key) DO UPDATE SET
+                        ignore_count = GREATEST(0, s.ignore_count + CASE WHEN category = 'ignore' THEN delta ELSE 0 END),
+                        notify_count = GREATEST(0, s.notify_count + CASE WHEN category = 'notify' THEN delta ELSE 0 END),
+                        respond_count = GREATEST(0, s.respond_count + CASE WHEN category = 'respond' THEN delta ELSE 0 END),
+                        updated_at = NOW();
+                END LOOP;
+            END;
+            $$;
+            CREATE OR REPLACE FUNCTION record_sender_outcomes(outcomes JSONB)
+            RETURNS VOID
+            LANGUAGE plpgsql
+            AS $$
+            DECLARE
+                outcome RECORD;
+            BEGIN
+                FOR outcome IN SELECT * FROM jsonb_to_recordset(outcomes) AS o(sender TEXT, category TEXT, delta INT) LOOP
+                    PERFORM record_sender_outcome(outcome.sender, outcome.category, outcome.delta);
+                END LOOP;
+            END;
+            $$;
+            """
+        },
+        {
+            'name': 'triage_ignored',
+            'sql': """
+            CREATE TABLE IF NOT EXISTS triage_ignored (
+                id BIGSERIAL PRIMARY KEY,
+                gmail_id TEXT NOT NULL UNIQUE,
+                subject TEXT,
+                sender TEXT,
+                body TEXT,
+                triage_reasoning TEXT,
+                created_at TIMESTAMPTZ DEFAULT NOW()
+            );
+            """
+        },
+        {
+            'name': 'triage_savings',
+            'sql': """
+            CREATE TABLE IF NOT EXISTS triage_savings (
+                day DATE NOT NULL,
+                source TEXT NOT NULL,
+                calls_avoided INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, source)
+            );
+            CREATE OR REPLACE FUNCTION record_triage_savings(source TEXT, calls INT)
+            RETURNS VOID
+            LANGUAGE SQL
+            AS $$
+                INSERT INTO triage_savings AS t (day, source, calls_avoided)
+                VALUES (CURRENT_DATE, source, calls)
+                ON CONFLICT (day, source) DO UPDATE SET calls_avoided = t.calls_avoided + EXCLUDED.calls_avoided;
+            $$;
+            """
+        }
+    ]
+    
+    print("Creating supporting tables and indexes...")
+    
+    for table in tables:
+        try:
+            supabase.rpc('execute_sql', {'sql': table['sql']}).execute()
+            print(f"{table['name']} is ready")
+        except Exception as e:
+            print(f"Error creating {table['name']}: {e}")
+            print("Note: You may need to run this SQL manually in the Supabase SQL editor:")
+            print(table['sql'])
+
 def create_rpc_functions():
     """Create necessary RPC functions for database operations"""
     # Function to get column information
@@ -250,6 +500,9 @@ if __name__ == "__main__":
     # Update the schema
     update_schema()
     
+    # Create supporting tables
+    create_tables()
+    
     # Create vector search function
     create_vector_search_function()
     
@@ -13,6 +13,7 @@ from dotenv import load_dotenv
 from supabase_utils import (
     get_email_list,
     get_email_detail,
+    get_email_thread,
     update_email_category,
     count_emails_by_category,
     get_similar_emails
@@ -82,6 +83,8 @@ if 'current_filter' not in st.session_state:
     st.session_state.current_filter = "all"
 if 'show_agent_analysis' not in st.session_state:
     st.session_state.show_agent_analysis = True
+if 'group_by_thread' not in st.session_state:
+    st.session_state.group_by_thread = False
 
 def format_date(date_string):
     """Format date string to a more readable format"""
@@ -98,9 +101,9 @@ def clean_html_content(html_content):
         return ""
     return html_converter.handle(str(html_content))
 
-def get_emails(category=None, page=1, page_size=10):
+def get_emails(category=None, page=1, page_size=10, group_by_thread=False):
     """Get emails with pagination and optional category filtering"""
-    emails = get_email_list(category, page, page_size)
+    emails = get_email_list(category, page, page_size, group_by_thread)
     if not emails:
         st.error("Error fetching emails")
     return emails
@@ -179,6 +182,16 @@ def render_sidebar():
         st.session_state.current_page = 1
         st.rerun()
     
+    group_by_thread = st.sidebar.checkbox(
+        "Group by conversation",
+        value=st.session_state.group_by_thread
+    )
+    
+    if group_by_thread != st.session_state.group_by_thread:
+        st.session_state.group_by_thread = group_by_thread
+        st.session_state.current_page = 1
+        st.rerun()
+    
     # Agent analysis toggle
     st.sidebar.divider()
     st.sidebar.subheader("Email Assistant")
@@ -197,7 +210,8 @@ def render_email_list():
     emails = get_emails(
         category=st.session_state.current_filter,
         page=st.session_state.current_page,
-        page_size=st.session_state.page_size
+        page_size=st.session_state.page_size,
+        group_by_thread=st.session_state.group_by_thread
     )
     
     # Title with current filter
@@ -225,6 +239,8 @@ def render_email_list():
                 button_text = f"**{email['subject']}**"
                 if has_analysis and st.session_state.show_agent_analysis:
                     button_text = f"🧠 {button_text}"  # Add brain emoji for analyzed emails
+                if email.get('thread_count', 1) > 1:
+                    button_text = f"{button_text} ({email['thread_count']})"  # Messages in the conversation
                 
                 if st.button(
                     button_text, 
@@ -350,6 +366,15 @@ def render_email_detail():
             st.write(f"**Date:** {format_date(email_detail['received_date'])}")
             st.write(f"**Category:** {email_detail.get('category', '').capitalize()}")
             
+            # Other emails in the same conversation
+            if email_detail.get('thread_id'):
+                thread = get_email_thread(email_detail['thread_id'])
+                if len(thread) > 1:
+                    with st.expander(f"💬 Conversation ({len(thread)} emails)"):
+                        for message in thread:
+                            marker = "➡️ " if message['id'] == email_detail['id'] else ""
+                            st.write(f"{marker}**{message['subject']}** — {message['sender']} • {format_date(message['received_date'])}")
+            
             # Display agent analysis if available and enabled
             if st.session_state.show_agent_analysis:
                 st.divider()
@@ -11,10 +11,20 @@ supabase_url = os.environ.get("SUPABASE_URL")
 supabase_key = os.environ.get("SUPABASE_KEY")
 supabase = create_client(supabase_url, supabase_key)
 
+# Categories counted in the sender_stats triage history
+TRIAGE_CATEGORIES = ("ignore", "notify", "respond")
+
+# Weight of a user's recategorization in that history (an LLM decision counts 1)
+USER_CORRECTION_WEIGHT = 3
+
+# Weight of a user's confirmation (marking an email done) of the category it had
+USER_CONFIRMATION_WEIGHT = 2
+
 def get_email_list(
     category: Optional[str] = None, 
     page: int = 1, 
-    page_size: int = 10
+    page_size: int = 10,
+    group_by_thread: bool = False
 ) -> List[Dict[str, Any]]:
     """
     Get emails with pagination and optional category filtering
@@ -23,12 +33,17 @@ def get_email_list(
         category: Optional filter for email category (respond, notify, done, active)
         page: Page number starting at 1
         page_size: Number of emails per page
+        group_by_thread: Return one entry per conversation (its latest email)
     
     Returns:
-        List of email dictionaries with basic info
+        List of email dictionaries with basic info; grouped entries also
+        have thread_id and thread_count
     """
+    if group_by_thread:
+        return get_thread_list(category, page, page_size)
+    
     query = supabase.table("emails").select(
-        "id, subject, sender, recipient, received_date, category"
+        "id, subject, sender, recipient, received_date, category, thread_id"
     ).order("received_date", desc=True)
     
     # Apply category filter if specified
@@ -56,6 +71,68 @@ def get_email_list(
         print(f"Error fetching emails: {e}")
         return []
 
+def get_thread_list(
+    category: Optional[str] = None,
+    page: int = 1,
+    page_size: int = 10
+) -> List[Dict[str, Any]]:
+    """
+    Get the latest email of each conversation with pagination
+    
+    Args:
+        category: Optional filter for email category (respond, notify, done, active)
+        page: Page number starting at 1
+        page_size: Number of conversations per page
+    
+    Returns:
+        List of email dictionaries with basic info, thread_id and thread_count
+    """
+    categories = {
+        "respond": ["respond"],
+        "notify": ["notify"],
+        "done": ["done"],
+        "active": ["respond", "notify"]
+    }.get(category)
+    
+    try:
+        response = supabase.rpc(
+            "get_email_threads",
+            {"categories": categories, "page_offset": (page - 1) * page_size, "page_limit": page_size}
+        ).execute()
+        return response.data
+    except Exception as e:
+        print(f"Error fetching email threads: {e}")
+    
+    # Fallback if the RPC doesn't exist: group the page of emails on its own
+    emails = get_email_list(category, page, page_size)
+    threads = {}
+    for email in emails:
+        thread_id = email.get("thread_id") or email["id"]
+        if thread_id in threads:
+            threads[thread_id]["thread_count"] += 1
+        else:
+            threads[thread_id] = dict(email, thread_id=thread_id, thread_count=1)
+    return list(threads.values())
+
+def get_email_thread(thread_id: str) -> List[Dict[str, Any]]:
+    """
+    Get all emails of a conversation, oldest first
+    
+    Args:
+        thread_id: Thread ID of the conversation
+    
+    Returns:
+        List of email dictionaries with basic info
+    """
+    try:
+        response = supabase.table("emails").select(
+            "id, subject, sender, received_date, category"
+        ).eq("thread_id", thread_id).order("received_date").execute()
+        return response.data
+    except Exception as e:
+        print(f"Error fetching email thread: {e}")
+        return []
+
 def get_email_detail(email_id: int) -> Optional[Dict[str, Any]]:
     """
     Get detailed information for a specific email
@@ -85,13 +162,85 @@ def update_email_category(email_id: int, category: str) -> bool:
         Boolean indicating success
     """
     try:
-        response = supabase.table("emails").update(
-            {"category": category}
+        current = supabase.table("emails").select(
+            "sender, category, reputation_category, reputation_weight"
         ).eq("id", email_id).execute()
-        return True
+        update = {"category": category}
+        outcomes = []
+        if current.data:
+            outcomes, reputation = sender_feedback_outcomes(current.data[0], category)
+            if outcomes:
+                # The email's contribution to sender_stats is now the user's verdict
+                update.update({"reputation_category": reputation[0], "reputation_weight": reputation[1]})
+        response = supabase.table("emails").update(update).eq("id", email_id).execute()
     except Exception as e:
         print(f"Error updating email category: {e}")
         return False
+    
+    if outcomes:
+        record_sender_feedback(current.data[0].get("sender"), outcomes)
+    return True
+
+def sender_feedback_outcomes(row: Dict[str, Any], new_category: str) -> tuple:
+    """
+    Work out what a recategorization changes in the sender's triage history
+    
+    An email's row records what it added to sender_stats (reputation_category
+    and reputation_weight, set by gmail_sync for LLM decisions). Moving it to
+    another triage category withdraws exactly that, if anything, and counts
+    the new category USER_CORRECTION_WEIGHT times.
+    
+    Marking it done confirms the category it had, which then counts
+    USER_CONFIRMATION_WEIGHT times. If triage already counted that category,
+    only the difference is added, so the email is never counted twice.
+    
+    Args:
+        row: The email's sender, category, reputation_category and reputation_weight
+        new_category: Category after the update
+    
+    Returns:
+        Tuple of the (category, delta) outcomes to record and the email's new
+        (reputation_category, reputation_weight); ([], None) if nothing changes
+    """
+    if not row.get("sender") or new_category == row.get("category"):
+        return [], None
+    
+    if new_category == "done":
+        category, weight = row.get("category"), USER_CONFIRMATION_WEIGHT
+    else:
+        category, weight = new_category, USER_CORRECTION_WEIGHT
+    if category not in TRIAGE_CATEGORIES:
+        return [], None
+    
+    recorded = row.get("reputation_category")
+    recorded_weight = (row.get("reputation_weight") or 0) if recorded in TRIAGE_CATEGORIES else 0
+    if recorded == category and recorded_weight:
+        # Already counted for this category: a confirmation may only raise the weight
+        if new_category != "done" or recorded_weight >= weight:
+            return [], None
+        return [(category, weight - recorded_weight)], (category, weight)
+    
+    outcomes = []
+    if recorded_weight:
+        outcomes.append((recorded, -recorded_weight))
+    outcomes.append((category, weight))
+    return outcomes, (category, weight)
+
+def record_sender_feedback(sender: str, outcomes: List[tuple]) -> None:
+    """
+    Add a user's recategorization to the sender's triage history (sender_stats)
+    
+    Args:
+        sender: Sender of the email
+        outcomes: (category, delta) pairs from sender_feedback_outcomes
+    """
+    try:
+        supabase.rpc(
+            "record_sender_outcomes",
+            {"outcomes": [{"sender": sender, "category": category, "delta": delta} for category, delta in outcomes]}
+        ).execute()
+    except Exception as e:
+        print(f"Error recording sender feedback: {e}")
 
 def count_emails_by_category() -> Dict[str, int]:
     """